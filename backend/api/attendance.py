@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Union
 from datetime import date
 from fastapi.responses import StreamingResponse
 
@@ -36,7 +36,10 @@ def debug_raw_attendance_records(db: Session = Depends(get_db)):
 
 @router.post("/", response_model=attendance_record_schema.AttendanceRecord)
 def create_attendance_record(record: attendance_record_schema.AttendanceRecordCreate, db: Session = Depends(get_db)):
-    return attendance_service.create_attendance_record(db=db, record=record)
+    try:
+        return attendance_service.create_attendance_record(db=db, record=record)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/export")
 def export_attendance_records(db: Session = Depends(get_db)):
@@ -149,6 +152,10 @@ def test_attendance_status(
         # 识别班制类型
         shift_type = mssql_sync_service._identify_shift_type(clock_in, clock_out)
         
+        # 批量引擎的判断结果，用于对照逐条规则
+        from services.shift_classifier import classify_attendance
+        batch_shift_types, batch_statuses = classify_attendance([clock_in], [clock_out])
+        
         return {
             "clock_in_time": clock_in.isoformat(),
             "clock_out_time": clock_out.isoformat(),
@@ -159,16 +166,23 @@ def test_attendance_status(
                 "is_late": clock_in.hour > 9 or (clock_in.hour == 9 and clock_in.minute > 0),
                 "is_early": (clock_out.hour < 17) or (clock_out.hour == 17 and clock_out.minute < 15),
                 "meets_work_hours": work_duration >= 8
+            },
+            "batch_classifier": {
+                "shift_type": batch_shift_types[0],
+                "attendance_status": batch_statuses[0],
+                "consistent": batch_shift_types[0] == shift_type and batch_statuses[0] == status
             }
         }
     except Exception as e:
         return {"error": str(e)}
 
 
-@router.get("/", response_model=List[attendance_record_schema.AttendanceRecordResponse])
+@router.get("/", response_model=Union[attendance_record_schema.AttendanceRecordPage, List[attendance_record_schema.AttendanceRecordResponse]])
 def read_attendance_records(
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
     employee_id: int = None,
     name: str = None,
     startDate: str = None,
@@ -189,6 +203,23 @@ def read_attendance_records(
         except ValueError:
             pass
     
+    # 传入 cursor 参数（第一页传空值）时按游标分页，返回 {items, total, next_cursor}
+    if cursor is not None:
+        try:
+            return attendance_service.get_attendance_records_page(
+                db, cursor=cursor, limit=limit, employee_id=employee_id,
+                name=name, start_date=start_date, end_date=end_date
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    # with_total=true 时 skip/limit 分页也返回 {items, total}；否则保持原有的列表响应
+    if with_total:
+        return attendance_service.get_attendance_records_with_total(
+            db, skip=skip, limit=limit, employee_id=employee_id,
+            name=name, start_date=start_date, end_date=end_date
+        )
+    
     records = attendance_service.get_attendance_records_formatted(
         db, skip=skip, limit=limit, employee_id=employee_id, 
         name=name, start_date=start_date, end_date=end_date
@@ -204,7 +235,10 @@ def read_attendance_record(record_id: int, db: Session = Depends(get_db)):
 
 @router.put("/{record_id}", response_model=attendance_record_schema.AttendanceRecord)
 def update_attendance_record(record_id: int, record: attendance_record_schema.AttendanceRecordCreate, db: Session = Depends(get_db)):
-    db_record = attendance_service.update_attendance_record(db, record_id=record_id, record=record)
+    try:
+        db_record = attendance_service.update_attendance_record(db, record_id=record_id, record=record)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if db_record is None:
         raise HTTPException(status_code=404, detail="Attendance record not found")
     return db_record
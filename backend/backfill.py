@@ -0,0 +1,76 @@
+"""
+历史考勤数据回补命令
+
+用法:
+    python backfill.py --start 2025-01-01 --end 2025-06-30
+    python backfill.py --start 2025-01-01 --end 2025-06-30 --shard-days 7 --concurrency 4 --employees 1001,1002
+
+中断后以相同参数重新运行，已完成的分片会被跳过，未完成的分片从最后提交的块继续。
+收到 Ctrl+C 或 SIGTERM 时不再开始新的分片，进行中的分片在提交块之间停止并保留检查点。
+"""
+from datetime import datetime
+import argparse
+import logging
+import signal
+import sys
+import threading
+
+from config.config import settings
+from services.backfill_service import HistoricalBackfill
+
+def parse_date(value: str):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日期格式错误: {value}，应为 YYYY-MM-DD")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="按分片并发回补MSSQL历史考勤数据")
+    parser.add_argument("--start", type=parse_date, required=True, help="开始日期 YYYY-MM-DD")
+    parser.add_argument("--end", type=parse_date, required=True, help="结束日期 YYYY-MM-DD")
+    parser.add_argument("--shard-days", type=int, default=settings.BACKFILL_SHARD_DAYS, help="每个分片的天数")
+    parser.add_argument("--concurrency", type=int, default=settings.BACKFILL_CONCURRENCY, help="并发处理的分片数")
+    parser.add_argument("--employees", type=str, default=None, help="逗号分隔的员工工号，默认全部员工")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=getattr(logging, settings.LOG_LEVEL),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    if not settings.mssql_enabled:
+        print("MSSQL未配置，无法回补")
+        return 1
+    if args.shard_days < 1 or args.concurrency < 1:
+        parser.error("--shard-days 和 --concurrency 必须至少为 1")
+
+    employee_nos = [no.strip() for no in args.employees.split(',') if no.strip()] if args.employees else None
+
+    cancel_event = threading.Event()
+    try:
+        backfill = HistoricalBackfill(args.start, args.end, employee_nos, args.shard_days, args.concurrency,
+                                      cancel_event=cancel_event)
+    except ValueError as e:
+        parser.error(str(e))
+
+    def request_stop(signum, frame):
+        print("收到停止信号，等待进行中的分片在提交块之间停止...")
+        cancel_event.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    summary = backfill.run()
+    print(
+        f"回补{summary['status']}: 分片 {summary['shards_total']} 个（跳过 {summary['shards_skipped']}，"
+        f"成功 {summary['shards_succeeded']}，失败 {summary['shards_failed']}，取消 {summary['shards_cancelled']}），"
+        f"扫描 {summary['employee_days_scanned']} 员工-日，写入 {summary['records_count']} 条记录，"
+        f"耗时 {summary['elapsed_seconds']} 秒，{summary['employee_days_scanned_per_second']} 员工-日/秒，"
+        f"{summary['records_per_second']} 条/秒"
+    )
+    if summary["failed_dates"]:
+        print(f"失败日期: {', '.join(summary['failed_dates'])}")
+    return 0 if summary["status"] == "success" else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
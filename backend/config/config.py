@@ -27,12 +27,48 @@ class Settings(BaseSettings):
     MSSQL_USERNAME: str = Field(default="sa", description="MSSQL用户名")
     MSSQL_PASSWORD: Optional[str] = Field(default=None, description="MSSQL密码")
     MSSQL_DRIVER: str = Field(default="ODBC Driver 17 for SQL Server", description="MSSQL驱动")
+    MSSQL_POOL_SIZE: int = Field(default=5, description="MSSQL连接池最大连接数")
+    MSSQL_POOL_TIMEOUT: int = Field(default=30, description="从MSSQL连接池获取连接的超时时间(秒)")
+    MSSQL_POOL_RECYCLE_SECONDS: int = Field(default=300, description="MSSQL空闲连接回收时间(秒)")
+    MSSQL_POOL_PRE_PING_SECONDS: int = Field(default=30, description="空闲超过该时间(秒)的连接借出前做健康检查")
+    MSSQL_FETCH_CHUNK_SIZE: int = Field(default=5000, description="MSSQL流式查询每次fetchmany的行数")
+    MSSQL_FETCH_BATCH_SIZE: int = Field(default=100, description="按员工分批查询刷卡记录时每批的员工数")
+    MSSQL_FETCH_CONCURRENCY: int = Field(default=4, description="并发查询的员工批次数，不应超过MSSQL_POOL_SIZE")
+    MSSQL_EMPLOYEE_FILTER_MODE: str = Field(default="batch", description="员工过滤方式: batch(分批IN列表) / temp_table(临时表关联) / window(窗口全量拉取后本地过滤)")
     
     # 环境配置
     ENVIRONMENT: str = Field(default="production", description="运行环境")
     DEBUG: bool = Field(default=False, description="调试模式")
     SYNC_INTERVAL_MINUTES: Optional[int] = Field(default=5, description="同步间隔(分钟)")
     
+    # 同步配置
+    SYNC_RANGE_FETCH: bool = Field(default=True, description="按日期范围一次性拉取MSSQL刷卡记录，关闭则逐日查询")
+    SYNC_INCREMENTAL: bool = Field(default=True, description="后台同步使用持久化高水位线增量拉取")
+    SYNC_WATERMARK_OVERLAP_MINUTES: int = Field(default=5, description="增量同步时水位线回看的分钟数，用于兜底延迟入库的刷卡")
+    SYNC_COMMIT_CHUNK_SIZE: int = Field(default=1000, description="写入考勤记录时每次提交的员工-日期数，限制单个事务的大小")
+    RAW_PUNCH_STORE_ENABLED: bool = Field(default=True, description="同步时将MSSQL原始刷卡落地到本地raw_punches表")
+    SYNC_JOB_WORKERS: int = Field(default=1, description="手动同步任务的工作线程数")
+    SYNC_JOB_QUEUE_SIZE: int = Field(default=20, description="手动同步任务队列的最大排队数")
+    SYNC_JOB_MAX_DAYS: int = Field(default=31, description="单个手动同步任务允许的最大日期跨度(天)")
+    SYNC_JOB_HISTORY_SIZE: int = Field(default=100, description="保留的已结束手动同步任务数量")
+    SYNC_LEADER_ELECTION: bool = Field(default=True, description="多进程/多副本部署时选举唯一的后台同步进程")
+    SYNC_LEADER_LEASE_SECONDS: int = Field(default=60, description="后台同步领导者租约时长(秒)，领导者失联超过该时长后由其他进程接管")
+    SYNC_STOP_TIMEOUT_SECONDS: int = Field(default=10, description="停止后台同步时等待进行中的同步到达检查点的最长时间(秒)，超时则不释放租约")
+    SYNC_ADAPTIVE_SCHEDULE: bool = Field(default=True, description="按班次交接时段和刷卡频率动态调整后台同步间隔，关闭则固定按SYNC_INTERVAL_MINUTES同步")
+    SYNC_SHIFT_BOUNDARIES: list = Field(default=["07:00", "07:30", "08:45", "09:00", "17:15", "19:00", "19:30"], description="班次交接时间点(HH:MM)，前后窗口内高频同步")
+    SYNC_SHIFT_WINDOW_MINUTES: int = Field(default=30, description="班次交接时间点前后的高频同步窗口(分钟)")
+    SYNC_PEAK_INTERVAL_MINUTES: int = Field(default=1, description="交接窗口内或刷卡密集时的同步间隔(分钟)")
+    SYNC_IDLE_MAX_INTERVAL_MINUTES: int = Field(default=30, description="连续无新刷卡时同步间隔逐步放大的上限(分钟)")
+    SYNC_BUSY_PUNCHES_PER_MINUTE: float = Field(default=5.0, description="新刷卡速率达到该值(条/分钟)时按高频间隔同步")
+    SYNC_PIPELINE_DEPTH: int = Field(default=2, description="拉取与写入流水线中已拉取、等待写入的窗口数上限，0表示逐个先拉取后写入")
+    SYNC_PIPELINE_WINDOW_DAYS: int = Field(default=7, description="范围拉取模式下流水线每个拉取窗口的天数")
+    BACKFILL_SHARD_DAYS: int = Field(default=7, description="历史回补时每个分片的天数")
+    BACKFILL_CONCURRENCY: int = Field(default=2, description="历史回补时并发处理的分片数，不超过MSSQL_POOL_SIZE // MSSQL_FETCH_CONCURRENCY（batch模式）")
+    BACKFILL_REPORT_SECONDS: int = Field(default=10, description="历史回补时输出进度和吞吐量的间隔(秒)")
+    
+    # 查询配置
+    ATTENDANCE_COUNT_CACHE_SIZE: int = Field(default=256, description="考勤列表按筛选条件缓存总数的条目上限，数据版本变化时失效，0表示不缓存")
+    
     # 安全配置
     CORS_ORIGINS: list = Field(default=["http://localhost:3000"], description="允许的CORS源")
     RATE_LIMIT_PER_MINUTE: int = Field(default=100, description="每分钟请求限制")
@@ -63,12 +99,92 @@ class Settings(BaseSettings):
             raise ValueError('EMAIL_SMTP_PORT must be between 1 and 65535')
         return v
     
+    @validator('MSSQL_POOL_SIZE')
+    def validate_mssql_pool_size(cls, v):
+        if v < 1:
+            raise ValueError('MSSQL_POOL_SIZE must be at least 1')
+        return v
+    
+    @validator('MSSQL_FETCH_BATCH_SIZE', 'MSSQL_FETCH_CONCURRENCY')
+    def validate_mssql_fetch_settings(cls, v):
+        if v < 1:
+            raise ValueError('MSSQL fetch batch size and concurrency must be at least 1')
+        return v
+    
+    @validator('MSSQL_EMPLOYEE_FILTER_MODE')
+    def validate_mssql_employee_filter_mode(cls, v):
+        if v not in ('batch', 'temp_table', 'window'):
+            raise ValueError('MSSQL_EMPLOYEE_FILTER_MODE must be one of: batch, temp_table, window')
+        return v
+    
     @validator('SYNC_INTERVAL_MINUTES')
     def validate_sync_interval(cls, v):
         if v is not None and v < 1:
             raise ValueError('SYNC_INTERVAL_MINUTES must be at least 1')
         return v
     
+    @validator('SYNC_SHIFT_BOUNDARIES')
+    def validate_sync_shift_boundaries(cls, v):
+        for boundary in v:
+            hour, _, minute = str(boundary).partition(':')
+            if not (hour.isdigit() and minute.isdigit() and int(hour) < 24 and int(minute) < 60):
+                raise ValueError('SYNC_SHIFT_BOUNDARIES entries must be HH:MM')
+        return v
+    
+    @validator('SYNC_SHIFT_WINDOW_MINUTES', 'SYNC_PEAK_INTERVAL_MINUTES', 'SYNC_IDLE_MAX_INTERVAL_MINUTES')
+    def validate_sync_schedule_minutes(cls, v):
+        if v < 1:
+            raise ValueError('sync schedule minutes must be at least 1')
+        return v
+    
+    @validator('SYNC_LEADER_LEASE_SECONDS')
+    def validate_sync_leader_lease_seconds(cls, v):
+        if v < 10:
+            raise ValueError('SYNC_LEADER_LEASE_SECONDS must be at least 10')
+        return v
+    
+    @validator('SYNC_STOP_TIMEOUT_SECONDS')
+    def validate_sync_stop_timeout_seconds(cls, v):
+        if v < 1:
+            raise ValueError('SYNC_STOP_TIMEOUT_SECONDS must be at least 1')
+        return v
+    
+    @validator('SYNC_COMMIT_CHUNK_SIZE')
+    def validate_sync_commit_chunk_size(cls, v):
+        if v < 1:
+            raise ValueError('SYNC_COMMIT_CHUNK_SIZE must be at least 1')
+        return v
+    
+    @validator('SYNC_JOB_WORKERS', 'SYNC_JOB_QUEUE_SIZE', 'SYNC_JOB_MAX_DAYS', 'SYNC_JOB_HISTORY_SIZE')
+    def validate_sync_job_settings(cls, v):
+        if v < 1:
+            raise ValueError('SYNC_JOB settings must be at least 1')
+        return v
+    
+    @validator('SYNC_PIPELINE_DEPTH')
+    def validate_sync_pipeline_depth(cls, v):
+        if v < 0:
+            raise ValueError('SYNC_PIPELINE_DEPTH must not be negative')
+        return v
+    
+    @validator('SYNC_PIPELINE_WINDOW_DAYS')
+    def validate_sync_pipeline_window_days(cls, v):
+        if v < 1:
+            raise ValueError('SYNC_PIPELINE_WINDOW_DAYS must be at least 1')
+        return v
+    
+    @validator('BACKFILL_SHARD_DAYS', 'BACKFILL_CONCURRENCY', 'BACKFILL_REPORT_SECONDS')
+    def validate_backfill_settings(cls, v):
+        if v < 1:
+            raise ValueError('BACKFILL settings must be at least 1')
+        return v
+    
+    @validator('ATTENDANCE_COUNT_CACHE_SIZE')
+    def validate_attendance_count_cache_size(cls, v):
+        if v < 0:
+            raise ValueError('ATTENDANCE_COUNT_CACHE_SIZE must not be negative')
+        return v
+    
     @property
     def is_production(self) -> bool:
         return self.ENVIRONMENT.lower() == "production"
@@ -1,10 +1,203 @@
 import pyodbc
-from typing import Optional
+from typing import Optional, Dict
+from contextlib import contextmanager
+from collections import deque
 from config.config import settings
 import logging
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+class MSSQLConnectionPool:
+    """
+    MSSQL连接池
+    
+    有界、线程安全，供后台同步线程和API触发的同步并发使用：
+    - 借出时对空闲过久的连接执行 SELECT 1 健康检查，失效则重建
+    - 空闲超过回收时间的连接直接关闭
+    - 连接数达到上限时等待归还，超时抛出异常
+    """
+    
+    def __init__(self, connection_string: str, max_size: int = 5, acquire_timeout: float = 30,
+                 recycle_seconds: float = 300, pre_ping_seconds: float = 30):
+        self._connection_string = connection_string
+        self._max_size = max_size
+        self._acquire_timeout = acquire_timeout
+        self._recycle_seconds = recycle_seconds
+        self._pre_ping_seconds = pre_ping_seconds
+        
+        self._condition = threading.Condition()
+        self._idle = deque()  # (连接, 最近归还时间)
+        self._size = 0  # 已创建且未关闭的连接数（空闲 + 借出）
+        self._in_use = 0
+        
+        # 连接池使用统计
+        self._stats = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "recycled": 0,
+            "peak_in_use": 0
+        }
+    
+    def acquire(self) -> pyodbc.Connection:
+        """
+        从连接池借出一个连接
+        """
+        deadline = time.monotonic() + self._acquire_timeout
+        stale_connections = []
+        connection = None
+        idle_seconds = 0
+        
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                
+                # 优先复用最近归还的空闲连接，空闲过久的连接回收
+                while self._idle:
+                    candidate, returned_at = self._idle.pop()
+                    if now - returned_at > self._recycle_seconds:
+                        stale_connections.append(candidate)
+                        self._size -= 1
+                        self._stats["recycled"] += 1
+                        continue
+                    connection = candidate
+                    idle_seconds = now - returned_at
+                    break
+                
+                if connection is not None or self._size < self._max_size:
+                    if connection is None:
+                        self._size += 1  # 预占名额，在锁外建立新连接
+                    self._in_use += 1
+                    self._stats["checkouts"] += 1
+                    self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._in_use)
+                    break
+                
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise Exception(f"MSSQL连接池获取连接超时（{self._acquire_timeout}秒），连接池上限: {self._max_size}")
+                
+                self._stats["waits"] += 1
+                self._condition.wait(remaining)
+        
+        for stale in stale_connections:
+            self._close_quietly(stale)
+        
+        try:
+            if connection is not None and idle_seconds > self._pre_ping_seconds and not self._is_healthy(connection):
+                with self._condition:
+                    self._stats["health_check_failures"] += 1
+                logger.warning("MSSQL连接健康检查失败，重新建立连接")
+                self._close_quietly(connection)
+                connection = None
+            
+            if connection is None:
+                connection = self._create_connection()
+            return connection
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+    
+    def release(self, connection: pyodbc.Connection, discard: bool = False):
+        """
+        归还连接，discard为True或连接已关闭时直接丢弃
+        """
+        if not discard and connection.closed:
+            discard = True
+        
+        with self._condition:
+            self._in_use -= 1
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+        
+        if discard:
+            self._close_quietly(connection)
+    
+    @contextmanager
+    def connection(self):
+        """
+        借出连接的上下文管理器，发生pyodbc错误时丢弃该连接
+        """
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except pyodbc.Error:
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard=discard)
+    
+    def close_all(self):
+        """
+        关闭所有空闲连接（借出中的连接在归还后照常回到池中）
+        """
+        with self._condition:
+            idle_connections = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle_connections)
+        
+        for connection in idle_connections:
+            self._close_quietly(connection)
+        logger.info(f"MSSQL连接池已关闭 {len(idle_connections)} 个空闲连接")
+    
+    def get_stats(self) -> Dict:
+        """
+        获取连接池使用统计
+        """
+        with self._condition:
+            return {
+                "max_size": self._max_size,
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                **self._stats
+            }
+    
+    def _create_connection(self) -> pyodbc.Connection:
+        # 同步只执行查询，使用自动提交避免连接在池中空闲时持有事务
+        connection = pyodbc.connect(self._connection_string, autocommit=True)
+        with self._condition:
+            self._stats["connections_created"] += 1
+        logger.debug("MSSQL连接池新建连接")
+        return connection
+    
+    def _is_healthy(self, connection: pyodbc.Connection) -> bool:
+        cursor = None
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            return True
+        except pyodbc.Error:
+            return False
+        finally:
+            if cursor:
+                try:
+                    cursor.close()
+                except pyodbc.Error:
+                    pass
+    
+    def _close_quietly(self, connection: pyodbc.Connection):
+        try:
+            if not connection.closed:
+                connection.close()
+        except pyodbc.Error as e:
+            logger.debug(f"关闭MSSQL连接时出错: {str(e)}")
+        with self._condition:
+            self._stats["connections_closed"] += 1
+
 class MSSQLConnection:
     """
     MSSQL数据库连接管理类
@@ -13,6 +206,13 @@ class MSSQLConnection:
     def __init__(self):
         self.connection_string = self._build_connection_string()
         self.connection: Optional[pyodbc.Connection] = None
+        self.pool = MSSQLConnectionPool(
+            self.connection_string,
+            max_size=settings.MSSQL_POOL_SIZE,
+            acquire_timeout=settings.MSSQL_POOL_TIMEOUT,
+            recycle_seconds=settings.MSSQL_POOL_RECYCLE_SECONDS,
+            pre_ping_seconds=settings.MSSQL_POOL_PRE_PING_SECONDS
+        )
     
     def _build_connection_string(self) -> str:
         """
@@ -65,31 +265,31 @@ class MSSQLConnection:
     
     def execute_query(self, query: str, params: tuple = None):
         """
-        执行查询语句
+        执行查询语句（使用连接池中的连接）
         """
-        connection = None
-        cursor = None
         max_retries = 3
         retry_count = 0
         
         while retry_count < max_retries:
             try:
-                # 每次查询都创建新的连接，避免连接冲突
-                logger.debug(f"尝试连接MSSQL数据库 (第{retry_count + 1}次)")
-                connection = pyodbc.connect(self.connection_string)
-                cursor = connection.cursor()
-                
-                logger.debug(f"执行查询: {query[:100]}...")
-                if params:
-                    cursor.execute(query, params)
-                else:
-                    cursor.execute(query)
-                
-                # 获取列名
-                columns = [column[0] for column in cursor.description] if cursor.description else []
-                
-                # 获取数据
-                rows = cursor.fetchall()
+                logger.debug(f"从连接池获取MSSQL连接 (第{retry_count + 1}次)")
+                with self.pool.connection() as connection:
+                    cursor = connection.cursor()
+                    try:
+                        logger.debug(f"执行查询: {query[:100]}...")
+                        if params:
+                            cursor.execute(query, params)
+                        else:
+                            cursor.execute(query)
+                        
+                        # 获取列名
+                        columns = [column[0] for column in cursor.description] if cursor.description else []
+                        
+                        # 获取数据
+                        rows = cursor.fetchall()
+                    finally:
+                        # 确保游标被正确释放，连接归还连接池
+                        cursor.close()
                 
                 # 转换为字典列表
                 result = []
@@ -109,33 +309,97 @@ class MSSQLConnection:
                     raise Exception(f"MSSQL数据库连接失败: {str(e)}")
                 else:
                     logger.info(f"等待2秒后重试...")
-                    import time
                     time.sleep(2)
                     
             except Exception as e:
                 logger.error(f"执行查询时发生未知错误: {str(e)}")
                 raise
-            finally:
-                # 确保资源被正确释放
-                if cursor:
+    
+    def execute_query_stream(self, query: str, params: tuple = None, chunk_size: int = None):
+        """
+        以流式方式执行查询，按 fetchmany 分块产出结果
+        
+        每次产出一个字典列表（最多 chunk_size 行），调用方逐块处理，
+        无需把整个结果集一次性加载到内存。迭代结束或中途关闭时连接归还连接池。
+        """
+        chunk_size = chunk_size or settings.MSSQL_FETCH_CHUNK_SIZE
+        
+        try:
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    yield from self._stream_cursor(cursor, query, params, chunk_size)
+                finally:
                     cursor.close()
-                if connection:
-                    connection.close()
+        except pyodbc.Error as e:
+            logger.error(f"MSSQL流式查询失败: {str(e)}")
+            raise Exception(f"MSSQL数据库查询失败: {str(e)}")
+    
+    def execute_query_stream_with_keys(self, table_name: str, keys, query: str, params: tuple = None, chunk_size: int = None):
+        """
+        先把 keys 批量写入会话级临时表，再在同一连接上流式执行查询
+        
+        查询中可直接 JOIN 该临时表（如 #sync_employees(emp_id)），
+        用一条固定文本的语句代替长度不定的 IN 列表，整个窗口只编译一个执行计划。
+        临时表列使用 COLLATE DATABASE_DEFAULT，避免 tempdb 与业务库排序规则不同导致 JOIN 报排序规则冲突。
+        临时表在查询结束后删除，连接归还连接池。
+        """
+        chunk_size = chunk_size or settings.MSSQL_FETCH_CHUNK_SIZE
+        
+        try:
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    cursor.execute(f"IF OBJECT_ID('tempdb..{table_name}') IS NOT NULL DROP TABLE {table_name}")
+                    cursor.execute(f"CREATE TABLE {table_name} (emp_id NVARCHAR(50) COLLATE DATABASE_DEFAULT NOT NULL PRIMARY KEY)")
+                    cursor.fast_executemany = True
+                    cursor.executemany(f"INSERT INTO {table_name} (emp_id) VALUES (?)", [(key,) for key in sorted(set(keys))])
+                    cursor.fast_executemany = False
+                    
+                    yield from self._stream_cursor(cursor, query, params, chunk_size)
+                finally:
+                    try:
+                        cursor.execute(f"IF OBJECT_ID('tempdb..{table_name}') IS NOT NULL DROP TABLE {table_name}")
+                    finally:
+                        cursor.close()
+        except pyodbc.Error as e:
+            logger.error(f"MSSQL临时表流式查询失败: {str(e)}")
+            raise Exception(f"MSSQL数据库查询失败: {str(e)}")
+    
+    def _stream_cursor(self, cursor, query: str, params: tuple, chunk_size: int):
+        logger.debug(f"流式执行查询: {query[:100]}...")
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+        
+        # 获取列名
+        columns = [column[0] for column in cursor.description] if cursor.description else []
+        
+        total_rows = 0
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            total_rows += len(rows)
+            yield [dict(zip(columns, row)) for row in rows]
+        
+        logger.debug(f"流式查询完成，共返回 {total_rows} 条记录")
     
     def test_connection(self) -> bool:
         """
-        测试数据库连接
+        测试数据库连接（复用连接池中的连接）
         """
-        connection = None
-        cursor = None
         try:
             logger.info("开始测试MSSQL数据库连接...")
-            connection = pyodbc.connect(self.connection_string)
-            
-            # 执行简单查询验证连接
-            cursor = connection.cursor()
-            cursor.execute("SELECT 1 as test")
-            result = cursor.fetchone()
+            with self.pool.connection() as connection:
+                # 执行简单查询验证连接
+                cursor = connection.cursor()
+                try:
+                    cursor.execute("SELECT 1 as test")
+                    result = cursor.fetchone()
+                finally:
+                    cursor.close()
             
             if result and result[0] == 1:
                 logger.info("MSSQL数据库连接测试成功")
@@ -150,11 +414,18 @@ class MSSQLConnection:
         except Exception as e:
             logger.error(f"MSSQL数据库连接测试失败 (未知错误): {str(e)}")
             return False
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
+    
+    def get_pool_stats(self) -> Dict:
+        """
+        获取连接池使用统计
+        """
+        return self.pool.get_stats()
+    
+    def close_pool(self):
+        """
+        关闭连接池中的空闲连接
+        """
+        self.pool.close_all()
 
 # 全局MSSQL连接实例
 mssql_conn = MSSQLConnection()
@@ -30,8 +30,13 @@ CREATE TABLE
     IF NOT EXISTS attendance_records (
         record_id INT AUTO_INCREMENT PRIMARY KEY,
         employee_id INT NOT NULL,
+        attendance_date DATE COMMENT '考勤日期',
         clock_in_time DATETIME,
         clock_out_time DATETIME,
+        punch_count INT COMMENT '当天刷卡次数，由MSSQL同步写入',
+        work_minutes INT COMMENT '工作分钟数',
+        overtime_minutes INT COMMENT '加班分钟数，超过8小时标准工时的部分',
+        shift_type VARCHAR(20) COMMENT '班制：12H_DAY, 8H, 12H_NIGHT',
         clock_type VARCHAR(50),
         device_id VARCHAR(255),
         location VARCHAR(255),
@@ -40,6 +45,10 @@ CREATE TABLE
         remarks VARCHAR(500),
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
         updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        UNIQUE KEY uq_attendance_employee_date (employee_id, attendance_date),
+        INDEX idx_attendance_clock_in (clock_in_time, record_id),
+        INDEX idx_attendance_date_employee (attendance_date, employee_id),
+        INDEX idx_attendance_employee_clock_in (employee_id, clock_in_time),
         FOREIGN KEY (employee_id) REFERENCES employees (employee_id)
     );
 
@@ -54,6 +63,7 @@ CREATE TABLE
         sync_status VARCHAR(20) NOT NULL DEFAULT 'processing' COMMENT '同步状态：processing, success, failed',
         records_count INT DEFAULT 0 COMMENT '同步的记录数量',
         error_message TEXT COMMENT '错误信息',
+        fetch_stats TEXT COMMENT 'MSSQL批次查询耗时统计(JSON)',
         sync_start_time DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '同步开始时间',
         sync_end_time DATETIME COMMENT '同步结束时间',
         created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
@@ -70,6 +80,56 @@ CREATE TABLE
         clock_in_time DATETIME COMMENT '上班打卡时间',
         clock_out_time DATETIME COMMENT '下班打卡时间',
         external_record_id VARCHAR(100) COMMENT '外部系统的记录ID',
-        sync_hash VARCHAR(64) NOT NULL UNIQUE COMMENT '同步数据的哈希值，用于去重',
-        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        sync_hash VARCHAR(64) NOT NULL COMMENT '同步数据的哈希值，用于判断当天打卡是否有变化',
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE KEY uq_sync_records_employee_date (employee_no, attendance_date)
+    );
+
+-- Create sync_checkpoints table
+CREATE TABLE
+    IF NOT EXISTS sync_checkpoints (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        checkpoint_key VARCHAR(100) NOT NULL UNIQUE COMMENT '检查点标识，如：attendance_records:sign_time',
+        watermark DATETIME COMMENT '已同步的最大刷卡时间(sign_time)',
+        position VARCHAR(255) COMMENT '分块提交的断点位置，格式：YYYY-MM-DD|最后提交的工号',
+        sync_log_id INT COMMENT '最近一次推进检查点的同步日志ID',
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    );
+
+-- Create raw_punches table
+CREATE TABLE
+    IF NOT EXISTS raw_punches (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        employee_no VARCHAR(50) NOT NULL COMMENT '员工工号(emp_id)',
+        employee_name VARCHAR(100) COMMENT '员工姓名',
+        device_id INT NOT NULL COMMENT '刷卡设备ID(clock_id)',
+        device_name VARCHAR(100) COMMENT '刷卡设备名称',
+        sign_time DATETIME(6) NOT NULL COMMENT '刷卡时间',
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE KEY uq_raw_punches_punch (employee_no, sign_time, device_id),
+        INDEX idx_raw_punches_employee_time (employee_no, sign_time),
+        INDEX idx_raw_punches_sign_time (sign_time)
+    );
+
+-- Create sync_leases table
+CREATE TABLE
+    IF NOT EXISTS sync_leases (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        lease_name VARCHAR(100) NOT NULL UNIQUE COMMENT '租约名称，如：mssql_background_sync',
+        holder VARCHAR(255) COMMENT '当前持有者(主机名:进程号)',
+        acquired_at DATETIME COMMENT '当前持有者获得租约的时间',
+        heartbeat_at DATETIME COMMENT '最近一次续约时间',
+        expires_at DATETIME COMMENT '租约过期时间，过期后其他进程可接管',
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    );
+
+-- Create data_versions table
+CREATE TABLE
+    IF NOT EXISTS data_versions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        version_key VARCHAR(100) NOT NULL UNIQUE COMMENT '数据版本标识，如：attendance_records',
+        version BIGINT NOT NULL DEFAULT 0 COMMENT '数据版本号，每次数据变更时递增',
+        updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
     );
@@ -1,6 +1,6 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
 from contextlib import asynccontextmanager
 from database.database import engine, SessionLocal, Base
@@ -8,16 +8,18 @@ from api import auth, employees, attendance, reports, dashboard, my
 from middleware.rate_limiting import RateLimitingMiddleware
 from services import employee_service
 from services.mssql_sync_service import mssql_sync_service
+from services.sync_job_service import sync_job_service, SyncJobQueueFull
 from schemas.employee import EmployeeCreate
 from config.config import settings
 from datetime import date
+from typing import List, Optional
 import asyncio
 import logging
 import traceback
 
 # 导入所有模型以确保表结构被正确识别
 from models import (
-    employee, attendance_record, sync_log
+    employee, attendance_record, sync_log, raw_punch, data_version
 )
 
 # 配置日志
@@ -103,12 +105,21 @@ async def lifespan(app: FastAPI):
         raise
     finally:
         # 关闭时的事件处理
+        # 先取消手动同步任务并释放同步锁，后台同步线程才能在超时前退出并释放租约
+        try:
+            sync_job_service.shutdown(timeout=settings.SYNC_STOP_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.error(f"停止手动同步任务失败: {e}")
         logger.info("正在停止后台同步服务...")
         try:
             mssql_sync_service.stop_background_sync()
             logger.info("后台同步服务已停止")
         except Exception as e:
             logger.error(f"停止同步服务失败: {e}")
+        try:
+            mssql_sync_service.mssql_conn.close_pool()
+        except Exception as e:
+            logger.error(f"关闭MSSQL连接池失败: {e}")
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -259,18 +270,113 @@ def control_sync_service(action: str, sync_interval_minutes: int = None):
         raise HTTPException(status_code=500, detail=f"操作失败: {str(e)}")
 
 @app.post("/api/sync-trigger")
-def trigger_manual_sync():
-    """手动触发一次同步（不影响定时同步）"""
+def trigger_manual_sync(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    employee_nos: Optional[List[str]] = Query(None)
+):
+    """手动触发一次同步（不影响定时同步）
+    
+    同步任务进入后台队列执行，接口立即返回任务ID，可通过 /api/sync-jobs/{job_id} 查询进度
+    
+    Args:
+        start_date: 开始日期，默认今天
+        end_date: 结束日期，默认与开始日期相同
+        employee_nos: 指定员工工号，为空则同步所有员工
+    """
+    start_date = start_date or date.today()
+    end_date = end_date or start_date
+    
     try:
-        # 这里可以添加手动触发同步的逻辑
-        # 暂时返回提示信息
-        return {
-            "success": True, 
-            "message": "手动同步功能暂未实现，系统正在使用自动增量同步"
-        }
+        submitted = sync_job_service.submit(start_date, end_date, employee_nos)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SyncJobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         logger.error(f"手动同步失败: {e}")
         raise HTTPException(status_code=500, detail=f"手动同步失败: {str(e)}")
+    
+    job = submitted["job"]
+    return {
+        "success": True,
+        "message": "已存在覆盖该范围的同步任务" if submitted["deduplicated"] else "同步任务已提交",
+        "job_id": job["job_id"],
+        "deduplicated": submitted["deduplicated"],
+        "job": job
+    }
+
+@app.get("/api/sync-jobs")
+def list_sync_jobs(limit: int = 20):
+    """获取最近的手动同步任务"""
+    return {
+        "success": True,
+        "queue": sync_job_service.get_queue_status(),
+        "data": sync_job_service.list_jobs(limit)
+    }
+
+@app.get("/api/sync-jobs/{job_id}")
+def get_sync_job(job_id: str):
+    """获取手动同步任务的状态和进度"""
+    job = sync_job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="同步任务不存在")
+    return {"success": True, "data": job}
+
+@app.post("/api/sync-replay")
+def replay_sync_from_raw_punches(
+    start_date: date,
+    end_date: date,
+    employee_nos: Optional[List[str]] = Query(None)
+):
+    """基于本地原始刷卡重建考勤记录（不访问MSSQL）
+    
+    重建任务进入后台队列执行，与手动同步共用同步锁和日期跨度上限，接口立即返回任务ID，
+    可通过 /api/sync-jobs/{job_id} 查询进度
+    """
+    try:
+        submitted = sync_job_service.submit_replay(start_date, end_date, employee_nos)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SyncJobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        logger.error(f"本地重建考勤记录失败: {e}")
+        raise HTTPException(status_code=500, detail=f"本地重建考勤记录失败: {str(e)}")
+    
+    job = submitted["job"]
+    return {
+        "success": True,
+        "message": "已存在覆盖该范围的重建任务" if submitted["deduplicated"] else "重建任务已提交",
+        "job_id": job["job_id"],
+        "deduplicated": submitted["deduplicated"],
+        "job": job
+    }
+
+@app.post("/api/sync-reconcile")
+def reconcile_sync(start_date: date, end_date: date, resync: bool = True):
+    """按天对账MSSQL与本地考勤数据，只对不一致的日期提交重新同步任务
+    
+    对账任务进入后台队列执行，接口立即返回任务ID，对账结果通过 /api/sync-jobs/{job_id} 查询
+    """
+    try:
+        submitted = sync_job_service.submit_reconcile(start_date, end_date, resync)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SyncJobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        logger.error(f"考勤数据对账失败: {e}")
+        raise HTTPException(status_code=500, detail=f"考勤数据对账失败: {str(e)}")
+    
+    job = submitted["job"]
+    return {
+        "success": True,
+        "message": "已存在覆盖该范围的对账任务" if submitted["deduplicated"] else "对账任务已提交",
+        "job_id": job["job_id"],
+        "deduplicated": submitted["deduplicated"],
+        "job": job
+    }
 
 @app.get("/api/sync-metrics")
 def get_sync_metrics():
@@ -284,6 +390,14 @@ def get_sync_metrics():
         logger.error(f"获取监控指标失败: {e}")
         raise HTTPException(status_code=500, detail=f"获取监控指标失败: {str(e)}")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """以Prometheus文本格式输出同步监控指标"""
+    return PlainTextResponse(
+        mssql_sync_service.get_prometheus_metrics(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 @app.get("/api/sync-health")
 def get_sync_health():
     """获取同步服务健康状态"""
@@ -307,12 +421,9 @@ def update_sync_interval(interval_minutes: int):
         if interval_minutes < 1:
             raise HTTPException(status_code=400, detail="同步间隔不能小于1分钟")
         
+        # 新间隔立即生效，无需重启同步服务
         result = mssql_sync_service.update_sync_interval(interval_minutes)
         
-        # 如果服务正在运行，提示需要重启
-        if result.get('requires_restart'):
-            result['restart_tip'] = "同步服务正在运行，新的间隔将在下次重启后生效。可以调用 /api/sync-control 重启服务。"
-        
         return {"success": True, "data": result}
     except Exception as e:
         logger.error(f"更新同步间隔失败: {e}")
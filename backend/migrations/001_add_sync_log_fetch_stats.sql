@@ -0,0 +1,6 @@
+-- 001: 同步日志记录MSSQL批次查询耗时统计
+-- 新部署由 init.sql / Base.metadata.create_all 直接建表，无需执行；已有数据库按编号顺序执行
+USE attendance_system;
+
+ALTER TABLE sync_logs
+    ADD COLUMN fetch_stats TEXT COMMENT 'MSSQL批次查询耗时统计(JSON)' AFTER error_message;
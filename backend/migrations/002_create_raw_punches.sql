@@ -0,0 +1,17 @@
+-- 002: 本地原始刷卡表，同步时落地MSSQL刷卡明细，供本地重建考勤记录
+-- 新部署由 init.sql / Base.metadata.create_all 直接建表，无需执行；已有数据库按编号顺序执行
+USE attendance_system;
+
+CREATE TABLE
+    IF NOT EXISTS raw_punches (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        employee_no VARCHAR(50) NOT NULL COMMENT '员工工号(emp_id)',
+        employee_name VARCHAR(100) COMMENT '员工姓名',
+        device_id INT NOT NULL COMMENT '刷卡设备ID(clock_id)',
+        device_name VARCHAR(100) COMMENT '刷卡设备名称',
+        sign_time DATETIME(6) NOT NULL COMMENT '刷卡时间',
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE KEY uq_raw_punches_punch (employee_no, sign_time, device_id),
+        INDEX idx_raw_punches_employee_time (employee_no, sign_time),
+        INDEX idx_raw_punches_sign_time (sign_time)
+    );
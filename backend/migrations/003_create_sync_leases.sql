@@ -0,0 +1,15 @@
+-- 003: 后台同步领导者租约表，多进程/多副本部署时只有一个进程执行定时同步
+-- 新部署由 init.sql / Base.metadata.create_all 直接建表，无需执行；已有数据库按编号顺序执行
+USE attendance_system;
+
+CREATE TABLE
+    IF NOT EXISTS sync_leases (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        lease_name VARCHAR(100) NOT NULL UNIQUE COMMENT '租约名称，如：mssql_background_sync',
+        holder VARCHAR(255) COMMENT '当前持有者(主机名:进程号)',
+        acquired_at DATETIME COMMENT '当前持有者获得租约的时间',
+        heartbeat_at DATETIME COMMENT '最近一次续约时间',
+        expires_at DATETIME COMMENT '租约过期时间，过期后其他进程可接管',
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    );
@@ -0,0 +1,6 @@
+-- 004: 同步检查点记录分块提交的断点位置，失败的范围同步从最后提交的块继续
+-- 新部署由 init.sql / Base.metadata.create_all 直接建表，无需执行；已有数据库按编号顺序执行
+USE attendance_system;
+
+ALTER TABLE sync_checkpoints
+    ADD COLUMN position VARCHAR(255) COMMENT '分块提交的断点位置，格式：YYYY-MM-DD|最后提交的工号' AFTER watermark;
@@ -0,0 +1,32 @@
+-- 005: 考勤记录和同步记录改为按 (员工, 考勤日期) 唯一，同一天的后续刷卡原地更新，不再按哈希每个版本插入一行
+-- 新部署由 init.sql / Base.metadata.create_all 直接建表，无需执行；已有数据库按编号顺序执行
+USE attendance_system;
+
+-- 考勤记录：增加考勤日期，回填同步产生的记录
+ALTER TABLE attendance_records
+    ADD COLUMN attendance_date DATE COMMENT '考勤日期' AFTER employee_id;
+
+UPDATE attendance_records
+SET attendance_date = DATE(clock_in_time)
+WHERE device_id = 'MSSQL_SYNC' AND clock_in_time IS NOT NULL;
+
+-- 同一员工同一天的多个版本只保留最新的一条
+DELETE a FROM attendance_records a
+JOIN attendance_records b
+    ON a.employee_id = b.employee_id
+    AND a.attendance_date = b.attendance_date
+    AND a.record_id < b.record_id;
+
+ALTER TABLE attendance_records
+    ADD UNIQUE KEY uq_attendance_employee_date (employee_id, attendance_date);
+
+-- 同步记录：哈希不再唯一，改为按员工工号和考勤日期唯一
+DELETE a FROM sync_records a
+JOIN sync_records b
+    ON a.employee_no = b.employee_no
+    AND a.attendance_date = b.attendance_date
+    AND a.id < b.id;
+
+ALTER TABLE sync_records
+    DROP INDEX sync_hash,
+    ADD UNIQUE KEY uq_sync_records_employee_date (employee_no, attendance_date);
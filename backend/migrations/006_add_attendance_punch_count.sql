@@ -0,0 +1,7 @@
+-- 006: 考勤记录保存当天刷卡次数，与MSSQL按天对账时比较刷卡次数和首末次刷卡时间
+-- 新部署由 init.sql / Base.metadata.create_all 直接建表，无需执行；已有数据库按编号顺序执行
+-- 已有记录的刷卡次数为空，对账时不比较；下次同步到该员工-日期时补齐
+USE attendance_system;
+
+ALTER TABLE attendance_records
+    ADD COLUMN punch_count INT COMMENT '当天刷卡次数，由MSSQL同步写入' AFTER clock_out_time;
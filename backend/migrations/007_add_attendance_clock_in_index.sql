@@ -0,0 +1,5 @@
+-- 007: 考勤列表按 (上班时间, 记录ID) 倒序游标分页，增加对应索引，翻页时直接从游标位置定位而不扫描已翻过的行
+-- 新部署由 init.sql / Base.metadata.create_all 直接建表，无需执行；已有数据库按编号顺序执行
+USE attendance_system;
+
+CREATE INDEX idx_attendance_clock_in ON attendance_records (clock_in_time, record_id);
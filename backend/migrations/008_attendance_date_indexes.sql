@@ -0,0 +1,49 @@
+-- 008: 考勤日期改为所有写入路径都按上班时间维护，回填手动录入和导入的记录，并增加按日期/按员工查询的组合索引
+-- 新部署由 init.sql / Base.metadata.create_all 直接建表，无需执行；已有数据库按编号顺序执行
+-- 同一员工同一天有多条记录时合并为一条，保证每条有上班时间的记录都有考勤日期：
+--   保留手动录入/导入的记录（优先于MSSQL同步记录，多条时取记录ID最大的一条），
+--   上班时间取当天最早、下班时间取当天最晚，备注中注明合并条数，其余记录删除；
+--   执行前先输出待合并的员工-日期及记录ID，便于核对
+-- 手动录入/导入的记录有考勤日期后与同步记录共用 (员工, 考勤日期) 唯一键，同步遇到此类员工-日期时跳过并记录警告，不覆盖
+USE attendance_system;
+
+CREATE TEMPORARY TABLE tmp_attendance_days AS
+SELECT
+    employee_id,
+    DATE(clock_in_time) AS attendance_date,
+    COUNT(*) AS record_count,
+    MIN(clock_in_time) AS first_clock_in,
+    MAX(clock_out_time) AS last_clock_out,
+    COALESCE(
+        MAX(CASE WHEN device_id IS NULL OR device_id <> 'MSSQL_SYNC' THEN record_id END),
+        MAX(record_id)
+    ) AS keep_record_id,
+    GROUP_CONCAT(record_id ORDER BY record_id) AS record_ids
+FROM attendance_records
+WHERE clock_in_time IS NOT NULL
+GROUP BY employee_id, DATE(clock_in_time);
+
+-- 待合并的重复记录
+SELECT employee_id, attendance_date, record_count, keep_record_id, record_ids
+FROM tmp_attendance_days
+WHERE record_count > 1
+ORDER BY attendance_date, employee_id;
+
+DELETE a FROM attendance_records a
+JOIN tmp_attendance_days t ON t.employee_id = a.employee_id AND t.attendance_date = DATE(a.clock_in_time)
+WHERE t.record_count > 1 AND a.record_id <> t.keep_record_id;
+
+UPDATE attendance_records a
+JOIN tmp_attendance_days t ON t.keep_record_id = a.record_id
+SET a.attendance_date = t.attendance_date,
+    a.clock_in_time = t.first_clock_in,
+    a.clock_out_time = t.last_clock_out,
+    a.remarks = CASE
+        WHEN t.record_count > 1 THEN LEFT(CONCAT_WS('；', a.remarks, CONCAT('迁移时合并同日 ', t.record_count - 1, ' 条重复记录')), 500)
+        ELSE a.remarks
+    END;
+
+DROP TEMPORARY TABLE tmp_attendance_days;
+
+CREATE INDEX idx_attendance_date_employee ON attendance_records (attendance_date, employee_id);
+CREATE INDEX idx_attendance_employee_clock_in ON attendance_records (employee_id, clock_in_time);
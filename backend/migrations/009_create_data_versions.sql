@@ -0,0 +1,13 @@
+-- 009: 数据版本表，同步提交或修改考勤记录时递增版本号，考勤列表按版本号判断缓存的总数是否失效
+-- 新部署由 init.sql / Base.metadata.create_all 直接建表，无需执行；已有数据库按编号顺序执行
+USE attendance_system;
+
+CREATE TABLE
+    IF NOT EXISTS data_versions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        version_key VARCHAR(100) NOT NULL UNIQUE COMMENT '数据版本标识，如：attendance_records',
+        version BIGINT NOT NULL DEFAULT 0 COMMENT '数据版本号，每次数据变更时递增',
+        updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    );
+
+INSERT IGNORE INTO data_versions (version_key, version) VALUES ('attendance_records', 0);
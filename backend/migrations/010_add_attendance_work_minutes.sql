@@ -0,0 +1,24 @@
+-- 010: 考勤记录保存工作分钟数、加班分钟数和班制，列表和报表直接读取或在SQL中汇总，不再逐行重新计算
+-- 新部署由 init.sql / Base.metadata.create_all 直接建表，无需执行；已有数据库按编号顺序执行
+-- 回填规则与 services/shift_classifier.py 一致：工作时长取整分钟，超过8小时的部分为加班；
+-- 18:00之后上班为12H夜班，6:00-7:59上班且时长>=10小时为12H白班，其余为8H班；缺卡的记录保持为空
+USE attendance_system;
+
+ALTER TABLE attendance_records
+    ADD COLUMN work_minutes INT COMMENT '工作分钟数' AFTER punch_count,
+    ADD COLUMN overtime_minutes INT COMMENT '加班分钟数，超过8小时标准工时的部分' AFTER work_minutes,
+    ADD COLUMN shift_type VARCHAR(20) COMMENT '班制：12H_DAY, 8H, 12H_NIGHT' AFTER overtime_minutes;
+
+UPDATE attendance_records
+SET work_minutes = TIMESTAMPDIFF(MINUTE, clock_in_time, clock_out_time),
+    overtime_minutes = GREATEST(TIMESTAMPDIFF(MINUTE, clock_in_time, clock_out_time) - 480, 0)
+WHERE clock_in_time IS NOT NULL AND clock_out_time IS NOT NULL AND clock_out_time > clock_in_time;
+
+UPDATE attendance_records
+SET shift_type = CASE
+        WHEN HOUR(clock_in_time) >= 18 THEN '12H_NIGHT'
+        WHEN HOUR(clock_in_time) BETWEEN 6 AND 7
+             AND TIMESTAMPDIFF(SECOND, clock_in_time, clock_out_time) >= 36000 THEN '12H_DAY'
+        ELSE '8H'
+    END
+WHERE clock_in_time IS NOT NULL AND clock_out_time IS NOT NULL;
@@ -1,14 +1,25 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DATETIME, func
+from sqlalchemy import Column, Integer, String, ForeignKey, DATETIME, Date, Index, UniqueConstraint, func
 from sqlalchemy.orm import relationship
 from database.database import Base
 
 class AttendanceRecord(Base):
     __tablename__ = "attendance_records"
+    __table_args__ = (
+        UniqueConstraint("employee_id", "attendance_date", name="uq_attendance_employee_date"),
+        Index("idx_attendance_clock_in", "clock_in_time", "record_id"),  # 考勤列表游标分页
+        Index("idx_attendance_date_employee", "attendance_date", "employee_id"),  # 按日期统计
+        Index("idx_attendance_employee_clock_in", "employee_id", "clock_in_time"),  # 按员工查询时间范围
+    )
 
     record_id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("employees.employee_id"), nullable=False)
+    attendance_date = Column(Date)  # 考勤日期，写入时按上班时间维护，同一员工同一天只保留一行
     clock_in_time = Column(DATETIME)
     clock_out_time = Column(DATETIME)
+    punch_count = Column(Integer)  # 当天刷卡次数，由MSSQL同步写入，用于与源库对账
+    work_minutes = Column(Integer)  # 工作分钟数，写入时按上下班时间计算，缺卡时为空
+    overtime_minutes = Column(Integer)  # 加班分钟数，超过8小时标准工时的部分
+    shift_type = Column(String(20))  # 班制：12H_DAY, 8H, 12H_NIGHT，缺卡时为空
     clock_type = Column(String(50))
     device_id = Column(String(255))
     location = Column(String(255))
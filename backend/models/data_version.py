@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime
+from sqlalchemy.sql import func
+from database.database import Base
+
+class DataVersion(Base):
+    """
+    数据版本模型
+    每次同步提交或手动修改考勤数据时在同一事务中递增版本号，
+    各进程据此判断缓存的查询结果（如考勤列表总数）是否失效
+    """
+    __tablename__ = "data_versions"
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    version_key = Column(String(100), nullable=False, unique=True, comment="数据版本标识，如：attendance_records")
+    version = Column(BigInteger, nullable=False, default=0, comment="数据版本号，每次数据变更时递增")
+    updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<DataVersion(version_key='{self.version_key}', version={self.version})>"
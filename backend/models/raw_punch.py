@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index, UniqueConstraint
+from sqlalchemy.dialects import mysql
+from sqlalchemy.sql import func
+from database.database import Base
+
+class RawPunch(Base):
+    """
+    原始刷卡记录模型
+    同步时从MSSQL TimeRecords 逐条落地的刷卡明细，只追加不修改，
+    用于规则调整或重算时在本地重建考勤记录，无需再次查询MSSQL
+    """
+    __tablename__ = "raw_punches"
+    __table_args__ = (
+        UniqueConstraint("employee_no", "sign_time", "device_id", name="uq_raw_punches_punch"),
+        Index("idx_raw_punches_employee_time", "employee_no", "sign_time"),
+        Index("idx_raw_punches_sign_time", "sign_time"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    employee_no = Column(String(50), nullable=False, comment="员工工号(emp_id)")
+    employee_name = Column(String(100), nullable=True, comment="员工姓名")
+    device_id = Column(Integer, nullable=False, comment="刷卡设备ID(clock_id)")
+    device_name = Column(String(100), nullable=True, comment="刷卡设备名称")
+    # 保留小数秒，与MSSQL原始刷卡时间一致，保证重建出的同步哈希不变
+    sign_time = Column(DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql"), nullable=False, comment="刷卡时间")
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    
+    def __repr__(self):
+        return f"<RawPunch(id={self.id}, employee_no='{self.employee_no}', sign_time='{self.sign_time}')>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, UniqueConstraint
 from sqlalchemy.sql import func
 from database.database import Base
 
@@ -17,6 +17,7 @@ class SyncLog(Base):
     sync_status = Column(String(20), nullable=False, default="processing", comment="同步状态：processing, success, failed")
     records_count = Column(Integer, default=0, comment="同步的记录数量")
     error_message = Column(Text, nullable=True, comment="错误信息")
+    fetch_stats = Column(Text, nullable=True, comment="MSSQL批次查询耗时统计(JSON)")
     sync_start_time = Column(DateTime, nullable=False, default=func.now(), comment="同步开始时间")
     sync_end_time = Column(DateTime, nullable=True, comment="同步结束时间")
     created_at = Column(DateTime, nullable=False, default=func.now())
@@ -28,9 +29,12 @@ class SyncLog(Base):
 class SyncRecord(Base):
     """
     同步记录详情模型
-    记录每条具体的同步数据，用于去重和追踪
+    每个员工每天一条，按 (员工工号, 考勤日期) 原地更新；sync_hash 用于判断当天打卡是否有变化
     """
     __tablename__ = "sync_records"
+    __table_args__ = (
+        UniqueConstraint("employee_no", "attendance_date", name="uq_sync_records_employee_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     sync_log_id = Column(Integer, nullable=False, comment="关联的同步日志ID")
@@ -39,8 +43,45 @@ class SyncRecord(Base):
     clock_in_time = Column(DateTime, nullable=True, comment="上班打卡时间")
     clock_out_time = Column(DateTime, nullable=True, comment="下班打卡时间")
     external_record_id = Column(String(100), nullable=True, comment="外部系统的记录ID")
-    sync_hash = Column(String(64), nullable=False, unique=True, comment="同步数据的哈希值，用于去重")
+    sync_hash = Column(String(64), nullable=False, comment="同步数据的哈希值，用于判断当天打卡是否有变化")
     created_at = Column(DateTime, nullable=False, default=func.now())
     
     def __repr__(self):
-        return f"<SyncRecord(id={self.id}, employee_no='{self.employee_no}', attendance_date='{self.attendance_date}')>"
\ No newline at end of file
+        return f"<SyncRecord(id={self.id}, employee_no='{self.employee_no}', attendance_date='{self.attendance_date}')>"
+
+class SyncCheckpoint(Base):
+    """
+    同步检查点模型
+    持久化增量同步的高水位线，以及按范围同步时分块提交的断点，服务重启或失败后从上次位置继续同步
+    """
+    __tablename__ = "sync_checkpoints"
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    checkpoint_key = Column(String(100), nullable=False, unique=True, comment="检查点标识，如：attendance_records:sign_time")
+    watermark = Column(DateTime, nullable=True, comment="已同步的最大刷卡时间(sign_time)")
+    position = Column(String(255), nullable=True, comment="分块提交的断点位置，格式：YYYY-MM-DD|最后提交的工号")
+    sync_log_id = Column(Integer, nullable=True, comment="最近一次推进检查点的同步日志ID")
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<SyncCheckpoint(id={self.id}, checkpoint_key='{self.checkpoint_key}', watermark='{self.watermark}')>"
+
+class SyncLease(Base):
+    """
+    同步租约模型
+    多个进程/副本间选举后台同步的领导者，只有持有未过期租约的进程执行定时同步
+    """
+    __tablename__ = "sync_leases"
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    lease_name = Column(String(100), nullable=False, unique=True, comment="租约名称，如：mssql_background_sync")
+    holder = Column(String(255), nullable=True, comment="当前持有者(主机名:进程号)")
+    acquired_at = Column(DateTime, nullable=True, comment="当前持有者获得租约的时间")
+    heartbeat_at = Column(DateTime, nullable=True, comment="最近一次续约时间")
+    expires_at = Column(DateTime, nullable=True, comment="租约过期时间，过期后其他进程可接管")
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    updated_at = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<SyncLease(id={self.id}, lease_name='{self.lease_name}', holder='{self.holder}', expires_at='{self.expires_at}')>"
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime, date
-from typing import Optional
+from typing import List, Optional
 
 class AttendanceRecordBase(BaseModel):
     employee_id: int
@@ -30,6 +30,9 @@ class AttendanceRecordUpdate(BaseModel):
 
 class AttendanceRecord(AttendanceRecordBase):
     record_id: int
+    work_minutes: Optional[int] = None
+    overtime_minutes: Optional[int] = None
+    shift_type: Optional[str] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
@@ -56,8 +59,16 @@ class AttendanceRecordResponse(BaseModel):
     remarks: Optional[str] = None
     workHours: Optional[str] = None
     overtimeHours: Optional[str] = None
+    work_minutes: Optional[int] = None      # 工作分钟数
+    overtime_minutes: Optional[int] = None  # 加班分钟数
+    shift_type: Optional[str] = None        # 班制：12H_DAY, 8H, 12H_NIGHT
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class AttendanceRecordPage(BaseModel):
+    items: List[AttendanceRecordResponse]
+    total: int  # 筛选条件下的记录总数
+    next_cursor: Optional[str] = None  # 下一页游标，没有更多记录时为空
@@ -18,10 +18,12 @@ class SyncLogUpdate(BaseModel):
     sync_status: Optional[str] = None
     records_count: Optional[int] = None
     error_message: Optional[str] = None
+    fetch_stats: Optional[str] = None
     sync_end_time: Optional[datetime] = None
 
 class SyncLog(SyncLogBase):
     id: int
+    fetch_stats: Optional[str] = None
     sync_start_time: datetime
     sync_end_time: Optional[datetime] = None
     created_at: datetime
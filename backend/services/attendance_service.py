@@ -1,69 +1,71 @@
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 from typing import List, Optional, Tuple
 import pandas as pd
 from io import BytesIO
 from datetime import date, datetime
+from collections import OrderedDict
+import base64
+import binascii
+import json
 import random
 import logging
+import threading
 
+from config.config import settings
 from models import attendance_record as attendance_record_model
 from models import employee as employee_model
 from schemas import attendance_record as attendance_record_schema
+from services.data_version_service import bump_data_version, get_data_version
+from services.employee_search_service import employee_search_index
+from services.shift_classifier import calculate_work_minutes, classify_attendance
 
 logger = logging.getLogger(__name__)
 
-def calculate_work_hours(clock_in_time: Optional[datetime], clock_out_time: Optional[datetime]) -> Tuple[str, str]:
+def format_duration_minutes(minutes: Optional[int]) -> str:
     """
-    计算工作时长和加班时长
-    返回格式化的时长字符串 (例如: "8小时30分钟")
+    将分钟数格式化为时长字符串 (例如: "8小时30分钟")，为空或为 0 时返回 "--"
     """
-    if not clock_in_time or not clock_out_time:
-        return "--", "--"
-    
-    # 计算总工作时长（秒）
-    total_seconds = (clock_out_time - clock_in_time).total_seconds()
-    
-    if total_seconds <= 0:
-        return "--", "--"
-    
-    # 转换为小时和分钟
-    total_hours = total_seconds / 3600
-    hours = int(total_hours)
-    minutes = int((total_hours - hours) * 60)
-    
-    # 格式化工作时长
+    if not minutes:
+        return "--"
+    hours, minutes = divmod(minutes, 60)
     if hours > 0 and minutes > 0:
-        work_hours_str = f"{hours}小时{minutes}分钟"
-    elif hours > 0:
-        work_hours_str = f"{hours}小时"
-    elif minutes > 0:
-        work_hours_str = f"{minutes}分钟"
-    else:
-        work_hours_str = "--"
-    
-    # 计算加班时长（超过8小时的部分）
-    standard_hours = 8
-    if total_hours > standard_hours:
-        overtime_total_hours = total_hours - standard_hours
-        overtime_hours = int(overtime_total_hours)
-        overtime_minutes = int((overtime_total_hours - overtime_hours) * 60)
-        
-        if overtime_hours > 0 and overtime_minutes > 0:
-            overtime_str = f"{overtime_hours}小时{overtime_minutes}分钟"
-        elif overtime_hours > 0:
-            overtime_str = f"{overtime_hours}小时"
-        elif overtime_minutes > 0:
-            overtime_str = f"{overtime_minutes}分钟"
-        else:
-            overtime_str = "--"
-    else:
-        overtime_str = "--"
+        return f"{hours}小时{minutes}分钟"
+    if hours > 0:
+        return f"{hours}小时"
+    return f"{minutes}分钟"
+
+def _apply_derived_fields(db: Session, db_record, pending_keys: Optional[set] = None):
+    """
+    按上下班时间维护考勤日期、工作/加班分钟数和班制，列表和报表直接读取，无需逐行重新计算
+
+    考勤记录按 (员工, 考勤日期) 唯一，该员工当天已有其他记录时抛出 ValueError。
+    pending_keys 为同一事务中尚未提交的 (员工ID, 考勤日期)，用于批量导入时检查文件内的重复。
+    """
+    AttendanceRecord = attendance_record_model.AttendanceRecord
+    db_record.work_minutes, db_record.overtime_minutes = calculate_work_minutes(db_record.clock_in_time, db_record.clock_out_time)
+    db_record.shift_type = classify_attendance([db_record.clock_in_time], [db_record.clock_out_time])[0][0]
+    db_record.attendance_date = db_record.clock_in_time.date() if db_record.clock_in_time else None
+    if db_record.attendance_date is None:
+        return
     
-    return work_hours_str, overtime_str
+    key = (db_record.employee_id, db_record.attendance_date)
+    query = db.query(AttendanceRecord.record_id).filter(
+        AttendanceRecord.employee_id == db_record.employee_id,
+        AttendanceRecord.attendance_date == db_record.attendance_date
+    )
+    if db_record.record_id is not None:
+        query = query.filter(AttendanceRecord.record_id != db_record.record_id)
+    if (pending_keys is not None and key in pending_keys) or query.first() is not None:
+        raise ValueError(f"员工 {db_record.employee_id} 在 {db_record.attendance_date} 已有考勤记录")
+    if pending_keys is not None:
+        pending_keys.add(key)
 
 def create_attendance_record(db: Session, record: attendance_record_schema.AttendanceRecordCreate):
     db_record = attendance_record_model.AttendanceRecord(**record.dict())
+    _apply_derived_fields(db, db_record)
     db.add(db_record)
+    bump_data_version(db)
     db.commit()
     db.refresh(db_record)
     
@@ -84,7 +86,7 @@ def get_attendance_records(db: Session, skip: int = 0, limit: int = 100, employe
     records = query.offset(skip).limit(limit).all()
     return records
 
-def get_attendance_records_formatted(db: Session, skip: int = 0, limit: int = 100, employee_id: Optional[int] = None, name: Optional[str] = None, start_date: Optional[date] = None, end_date: Optional[date] = None):
+def _attendance_list_query(db: Session, employee_id: Optional[int] = None, name: Optional[str] = None, start_date: Optional[date] = None, end_date: Optional[date] = None):
     query = db.query(
         attendance_record_model.AttendanceRecord,
         employee_model.Employee.name,
@@ -98,7 +100,9 @@ def get_attendance_records_formatted(db: Session, skip: int = 0, limit: int = 10
     if employee_id:
         query = query.filter(attendance_record_model.AttendanceRecord.employee_id == employee_id)
     if name:
-        query = query.filter(employee_model.Employee.name.like(f"%{name}%"))
+        # 通过内存索引解析出匹配的员工ID，避免关联查询中对姓名做 LIKE 全表扫描
+        employee_ids = employee_search_index.search(db, name)
+        query = query.filter(attendance_record_model.AttendanceRecord.employee_id.in_(employee_ids))
     if start_date:
         # 使用日期范围过滤，确保包含整天的记录
         start_datetime = datetime.combine(start_date, datetime.min.time())
@@ -108,12 +112,122 @@ def get_attendance_records_formatted(db: Session, skip: int = 0, limit: int = 10
         end_datetime = datetime.combine(end_date, datetime.max.time())
         query = query.filter(attendance_record_model.AttendanceRecord.clock_in_time <= end_datetime)
     
+    # 按 (上班时间, 记录ID) 倒序，保证分页结果稳定；上班时间为空的记录排在最后
+    return query.order_by(
+        attendance_record_model.AttendanceRecord.clock_in_time.desc(),
+        attendance_record_model.AttendanceRecord.record_id.desc()
+    )
+
+def get_attendance_records_formatted(db: Session, skip: int = 0, limit: int = 100, employee_id: Optional[int] = None, name: Optional[str] = None, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    query = _attendance_list_query(db, employee_id, name, start_date, end_date)
     results = query.offset(skip).limit(limit).all()
+    return _format_attendance_rows(results)
+
+def get_attendance_records_with_total(db: Session, skip: int = 0, limit: int = 100, employee_id: Optional[int] = None, name: Optional[str] = None, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """
+    按 skip/limit 分页查询考勤记录，并返回筛选条件下的总数
+
+    Returns:
+        {"items": 记录列表, "total": 总数, "next_cursor": None}
+    """
+    items = get_attendance_records_formatted(db, skip, limit, employee_id, name, start_date, end_date)
+    return {
+        "items": items,
+        "total": count_attendance_records(db, employee_id, name, start_date, end_date),
+        "next_cursor": None
+    }
+
+# 考勤列表总数缓存：筛选条件 -> (数据版本, 总数)，数据版本变化后重新统计
+_count_cache = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+def count_attendance_records(db: Session, employee_id: Optional[int] = None, name: Optional[str] = None, start_date: Optional[date] = None, end_date: Optional[date] = None) -> int:
+    """
+    统计筛选条件下的考勤记录总数
+
+    同一筛选条件的总数按数据版本缓存，翻页时只读取一次版本号；
+    同步提交或修改记录后版本递增，下一次请求重新执行 COUNT。
+    """
+    key = (employee_id or None, name or None, start_date, end_date)
+    # 先读版本再统计：统计期间有新写入时缓存的是旧版本号，下一次请求会重新统计
+    version = get_data_version(db)
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+        if cached is not None and cached[0] == version:
+            _count_cache.move_to_end(key)
+            return cached[1]
     
+    total = _attendance_list_query(db, employee_id, name, start_date, end_date).order_by(None).count()
+    
+    if settings.ATTENDANCE_COUNT_CACHE_SIZE > 0:
+        with _count_cache_lock:
+            _count_cache[key] = (version, total)
+            _count_cache.move_to_end(key)
+            while len(_count_cache) > settings.ATTENDANCE_COUNT_CACHE_SIZE:
+                _count_cache.popitem(last=False)
+    return total
+
+def get_attendance_records_page(db: Session, cursor: Optional[str] = None, limit: int = 100, employee_id: Optional[int] = None, name: Optional[str] = None, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """
+    按游标分页查询考勤记录
+
+    从游标位置之后按 (上班时间, 记录ID) 倒序读取，不扫描已翻过的行，同步插入新记录时页面内容也不会错位。
+
+    Args:
+        cursor: 上一页返回的 next_cursor，为空时读取第一页
+
+    Returns:
+        {"items": 记录列表, "total": 筛选条件下的总数, "next_cursor": 下一页游标，没有更多记录时为 None}
+    """
+    AttendanceRecord = attendance_record_model.AttendanceRecord
+    query = _attendance_list_query(db, employee_id, name, start_date, end_date)
+    
+    if cursor:
+        last_clock_in, last_record_id = decode_attendance_cursor(cursor)
+        if last_clock_in is None:
+            query = query.filter(AttendanceRecord.clock_in_time.is_(None), AttendanceRecord.record_id < last_record_id)
+        else:
+            query = query.filter(or_(
+                AttendanceRecord.clock_in_time < last_clock_in,
+                and_(AttendanceRecord.clock_in_time == last_clock_in, AttendanceRecord.record_id < last_record_id),
+                AttendanceRecord.clock_in_time.is_(None)
+            ))
+    
+    # 多取一条判断是否还有下一页
+    results = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last_record = results[-1][0]
+        next_cursor = encode_attendance_cursor(last_record.clock_in_time, last_record.record_id)
+    
+    return {
+        "items": _format_attendance_rows(results),
+        "total": count_attendance_records(db, employee_id, name, start_date, end_date),
+        "next_cursor": next_cursor
+    }
+
+def encode_attendance_cursor(clock_in_time: Optional[datetime], record_id: int) -> str:
+    payload = json.dumps([clock_in_time.isoformat() if clock_in_time else None, record_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_attendance_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        clock_in_value, record_id = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        clock_in_time = datetime.fromisoformat(clock_in_value) if clock_in_value is not None else None
+        if not isinstance(record_id, int):
+            raise ValueError(record_id)
+        return clock_in_time, record_id
+    except (ValueError, TypeError, UnicodeDecodeError, binascii.Error):
+        raise ValueError("无效的分页游标")
+
+def _format_attendance_rows(results):
     formatted_records = []
     for record, employee_name, employee_no, position in results:
-        # 计算工作时长和加班时长
-        work_hours, overtime_hours = calculate_work_hours(record.clock_in_time, record.clock_out_time)
+        # 工作时长和加班时长在写入时已计算，这里只做格式化
+        work_hours = format_duration_minutes(record.work_minutes)
+        overtime_hours = format_duration_minutes(record.overtime_minutes)
         
         formatted_record = {
             'record_id': record.record_id,
@@ -133,6 +247,9 @@ def get_attendance_records_formatted(db: Session, skip: int = 0, limit: int = 10
             'location': record.location,
             'workHours': work_hours,
             'overtimeHours': overtime_hours,
+            'work_minutes': record.work_minutes,
+            'overtime_minutes': record.overtime_minutes,
+            'shift_type': record.shift_type,
             'remarks': record.remarks,
             'process_status': record.process_status,
             'created_at': record.created_at,
@@ -148,8 +265,16 @@ def get_attendance_record(db: Session, record_id: int):
 def update_attendance_record(db: Session, record_id: int, record: attendance_record_schema.AttendanceRecordCreate):
     db_record = get_attendance_record(db, record_id)
     if db_record:
-        for key, value in record.dict().items():
-            setattr(db_record, key, value)
+        # 修改前先加载原值，检查重复的查询不会自动提交未完成的修改
+        with db.no_autoflush:
+            for key, value in record.dict().items():
+                setattr(db_record, key, value)
+            try:
+                _apply_derived_fields(db, db_record)
+            except ValueError:
+                db.rollback()
+                raise
+        bump_data_version(db)
         db.commit()
         db.refresh(db_record)
     
@@ -159,11 +284,13 @@ def delete_attendance_record(db: Session, record_id: int):
     db_record = get_attendance_record(db, record_id)
     if db_record:
         db.delete(db_record)
+        bump_data_version(db)
         db.commit()
     return db_record
 
 def import_records_from_file(db: Session, contents: bytes):
     df = pd.read_excel(BytesIO(contents))
+    pending_keys = set()
     for _, row in df.iterrows():
         if 'clock_in_time' in row and pd.notna(row['clock_in_time']):
             row['clock_in_time'] = pd.to_datetime(row['clock_in_time'])
@@ -171,7 +298,13 @@ def import_records_from_file(db: Session, contents: bytes):
             row['clock_out_time'] = pd.to_datetime(row['clock_out_time'])
         record_data = attendance_record_schema.AttendanceRecordCreate(**row.to_dict())
         db_record = attendance_record_model.AttendanceRecord(**record_data.dict())
+        try:
+            _apply_derived_fields(db, db_record, pending_keys)
+        except ValueError:
+            db.rollback()
+            raise
         db.add(db_record)
+    bump_data_version(db)
     db.commit()
     return len(df)
 
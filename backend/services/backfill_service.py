@@ -0,0 +1,190 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from config.config import settings
+from database.database import SessionLocal
+from models.sync_log import SyncLog
+from services.mssql_sync_service import mssql_sync_service
+
+logger = logging.getLogger(__name__)
+
+# 历史回补分片的同步日志类型，用于识别已完成的分片
+BACKFILL_SYNC_TYPE = "attendance_backfill"
+
+def split_into_shards(start_date: date, end_date: date, shard_days: int) -> List[Tuple[date, date]]:
+    """
+    将日期范围按天数切分为连续的分片
+    """
+    shards = []
+    shard_start = start_date
+    while shard_start <= end_date:
+        shard_end = min(shard_start + timedelta(days=shard_days - 1), end_date)
+        shards.append((shard_start, shard_end))
+        shard_start = shard_end + timedelta(days=1)
+    return shards
+
+class HistoricalBackfill:
+    """
+    历史考勤数据回补
+
+    将长日期范围切分为若干分片，多个分片并发同步（并发数不超过MSSQL连接池大小）。
+    每个分片完成后在 sync_logs 中留下一条 attendance_backfill 类型的成功日志，
+    中断后重新运行同一范围时跳过已完成的分片；未完成的分片通过范围同步检查点从最后提交的块继续。
+    cancel_event 被设置后不再开始新的分片，进行中的分片在下一个提交块之间回滚并停止。
+    """
+    def __init__(self, start_date: date, end_date: date, employee_nos: Optional[List[str]] = None,
+                 shard_days: int = None, concurrency: int = None, report_seconds: int = None,
+                 cancel_event: Optional[threading.Event] = None):
+        if start_date > end_date:
+            raise ValueError("开始日期不能晚于结束日期")
+
+        self.start_date = start_date
+        self.end_date = end_date
+        self.employee_nos = sorted(set(employee_nos)) if employee_nos else None
+        self.shard_days = shard_days or settings.BACKFILL_SHARD_DAYS
+        requested = concurrency or settings.BACKFILL_CONCURRENCY
+        self.concurrency = min(requested, self.max_concurrency())
+        if self.concurrency < requested:
+            logger.warning(f"回补并发 {requested} 超出MSSQL连接池可支撑的分片数，已限制为 {self.concurrency}")
+        self.report_seconds = report_seconds or settings.BACKFILL_REPORT_SECONDS
+        self.cancel_event = cancel_event or threading.Event()
+
+        self._lock = threading.Lock()
+        self._employee_count = 0
+        self._days_total = 0
+        self._days_done = 0
+        self._records_count = 0
+        self._started = None
+
+    @staticmethod
+    def max_concurrency() -> int:
+        """
+        MSSQL连接池可同时支撑的分片数：batch 模式下每个分片最多占用 MSSQL_FETCH_CONCURRENCY 个连接，
+        其余模式每个分片一次只有一条查询
+        """
+        connections_per_shard = settings.MSSQL_FETCH_CONCURRENCY if settings.MSSQL_EMPLOYEE_FILTER_MODE == "batch" else 1
+        return max(1, settings.MSSQL_POOL_SIZE // connections_per_shard)
+
+    def run(self) -> Dict:
+        """
+        执行回补
+
+        Returns:
+            回补结果汇总
+        """
+        shards = split_into_shards(self.start_date, self.end_date, self.shard_days)
+
+        db = SessionLocal()
+        try:
+            self._employee_count = len(mssql_sync_service._get_sync_employees(db, self.employee_nos))
+            completed = self._completed_shards(db, shards)
+        finally:
+            db.close()
+
+        pending = [shard for shard in shards if shard not in completed]
+        self._days_total = sum((shard_end - shard_start).days + 1 for shard_start, shard_end in pending)
+        logger.info(
+            f"历史回补 {self.start_date} 至 {self.end_date}: 共 {len(shards)} 个分片，已完成 {len(completed)} 个，"
+            f"待处理 {len(pending)} 个，员工 {self._employee_count} 人，并发 {self.concurrency}"
+        )
+
+        self._started = time.perf_counter()
+        stop_event = threading.Event()
+        reporter = threading.Thread(target=self._report_loop, args=(stop_event,), daemon=True, name="BackfillReporter")
+        reporter.start()
+
+        shard_results = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="BackfillShard") as executor:
+                futures = {executor.submit(self._run_shard, shard): shard for shard in pending}
+                for future in as_completed(futures):
+                    shard_results.append(future.result())
+        finally:
+            stop_event.set()
+            reporter.join()
+
+        elapsed = time.perf_counter() - self._started
+        cancelled_shards = [result for result in shard_results if result["status"] == "cancelled"]
+        failed_shards = [result for result in shard_results if result["status"] not in ("success", "cancelled")]
+        succeeded = len(shard_results) - len(failed_shards) - len(cancelled_shards)
+        if cancelled_shards:
+            status = "cancelled"
+        else:
+            status = "success" if not failed_shards else "partial_success" if succeeded else "failed"
+        summary = {
+            "start_date": self.start_date.isoformat(),
+            "end_date": self.end_date.isoformat(),
+            "shards_total": len(shards),
+            "shards_skipped": len(completed),
+            "shards_succeeded": succeeded,
+            "shards_failed": len(failed_shards),
+            "shards_cancelled": len(cancelled_shards),
+            "failed_dates": sorted(date_str for result in failed_shards for date_str in result["failed_dates"]),
+            "records_count": self._records_count,
+            "employee_days_scanned": self._days_done * self._employee_count,
+            "elapsed_seconds": round(elapsed, 3),
+            "employee_days_scanned_per_second": round(self._days_done * self._employee_count / elapsed, 2) if elapsed else None,
+            "records_per_second": round(self._records_count / elapsed, 2) if elapsed else None,
+            "status": status
+        }
+        logger.info(f"历史回补结束: {summary}")
+        return summary
+
+    def _run_shard(self, shard: Tuple[date, date]) -> Dict:
+        shard_start, shard_end = shard
+        if self.cancel_event.is_set():
+            return {"shard": shard, "status": "cancelled", "failed_dates": []}
+        db = SessionLocal()
+        try:
+            result = mssql_sync_service._sync_date_range(
+                db, shard_start, shard_end, self.employee_nos,
+                progress_callback=self._record_progress, resumable=True, sync_type=BACKFILL_SYNC_TYPE,
+                cancel_event=self.cancel_event
+            )
+            logger.info(f"回补分片 {shard_start} 至 {shard_end} 结束: {result['status']}，{result['message']}")
+            return {"shard": shard, "status": result["status"], "failed_dates": result["failed_dates"]}
+        except Exception as e:
+            logger.error(f"回补分片 {shard_start} 至 {shard_end} 失败: {str(e)}")
+            days = [(shard_start + timedelta(days=i)).isoformat() for i in range((shard_end - shard_start).days + 1)]
+            return {"shard": shard, "status": "failed", "failed_dates": days}
+        finally:
+            db.close()
+
+    def _completed_shards(self, db, shards: List[Tuple[date, date]]) -> set:
+        """
+        从 sync_logs 中查找员工范围相同且已成功的分片
+        """
+        shard_names = {f"{shard_start.strftime('%Y-%m-%d')} 至 {shard_end.strftime('%Y-%m-%d')}": (shard_start, shard_end)
+                       for shard_start, shard_end in shards}
+        rows = db.query(SyncLog.sync_date).filter(
+            SyncLog.sync_type == BACKFILL_SYNC_TYPE,
+            SyncLog.sync_status == "success",
+            SyncLog.employee_no == (",".join(self.employee_nos) if self.employee_nos else "all"),
+            SyncLog.sync_date.in_(list(shard_names))
+        ).distinct().all()
+        return {shard_names[row.sync_date] for row in rows}
+
+    def _record_progress(self, sync_date: str, success: bool, records_count: int):
+        with self._lock:
+            self._days_done += 1
+            self._records_count += records_count
+
+    def _report_loop(self, stop_event: threading.Event):
+        while not stop_event.wait(timeout=self.report_seconds):
+            logger.info(self.progress_line())
+
+    def progress_line(self) -> str:
+        with self._lock:
+            days_done, records_count = self._days_done, self._records_count
+        elapsed = time.perf_counter() - self._started
+        employee_days = days_done * self._employee_count
+        scan_rate = employee_days / elapsed if elapsed else 0
+        write_rate = records_count / elapsed if elapsed else 0
+        return (
+            f"回补进度: {days_done}/{self._days_total} 天，扫描 {employee_days} 员工-日，写入 {records_count} 条，"
+            f"吞吐 {scan_rate:.1f} 员工-日/秒，写入 {write_rate:.1f} 条/秒"
+        )
@@ -17,7 +17,7 @@ def get_dashboard_stats(db: Session, date: str = None):
     
     # 获取指定日期出勤人数（去重）- 只统计有打卡记录的员工
     present_today = db.query(distinct(AttendanceRecord.employee_id)).filter(
-        func.date(AttendanceRecord.clock_in_time) == target_date
+        AttendanceRecord.attendance_date == target_date
     )
     present_today = present_today.count()
     
@@ -26,7 +26,7 @@ def get_dashboard_stats(db: Session, date: str = None):
     # 获取异常考勤数（指定日期迟到、早退等）
     abnormal_query = db.query(AttendanceRecord).filter(
         and_(
-            func.date(AttendanceRecord.clock_in_time) == target_date,
+            AttendanceRecord.attendance_date == target_date,
             AttendanceRecord.status.in_(['迟到', '早退', '缺勤', '缺卡'])
         )
     )
@@ -35,15 +35,16 @@ def get_dashboard_stats(db: Session, date: str = None):
     # 待处理请求数（这里暂时设为0，实际应该查询补卡申请等）
     pending_requests = 0
     
-    # 获取过去7天的出勤统计
-    weekly_attendance = []
-    for i in range(7):
-        date_item = target_date - timedelta(days=6-i)
-        count_query = db.query(distinct(AttendanceRecord.employee_id)).filter(
-            func.date(AttendanceRecord.clock_in_time) == date_item
-        )
-        count = count_query.count()
-        weekly_attendance.append(count)
+    # 获取过去7天的出勤统计，按考勤日期范围一次分组查询
+    week_start = target_date - timedelta(days=6)
+    daily_counts = dict(db.query(
+        AttendanceRecord.attendance_date,
+        func.count(distinct(AttendanceRecord.employee_id))
+    ).filter(
+        AttendanceRecord.attendance_date >= week_start,
+        AttendanceRecord.attendance_date <= target_date
+    ).group_by(AttendanceRecord.attendance_date).all())
+    weekly_attendance = [daily_counts.get(week_start + timedelta(days=i), 0) for i in range(7)]
     
     return {
         "total_employees": total_employees,
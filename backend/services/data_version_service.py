@@ -0,0 +1,36 @@
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import logging
+
+from models.data_version import DataVersion
+
+logger = logging.getLogger(__name__)
+
+# 考勤记录（及列表关联的员工信息）的数据版本标识
+ATTENDANCE_DATA_VERSION = "attendance_records"
+
+def bump_data_version(db: Session, version_key: str = ATTENDANCE_DATA_VERSION):
+    """
+    递增数据版本号，不提交；调用方在写入数据的同一事务中调用，随数据一起提交或回滚
+    """
+    updated = db.query(DataVersion).filter(DataVersion.version_key == version_key).update(
+        {DataVersion.version: DataVersion.version + 1}, synchronize_session=False
+    )
+    if updated:
+        return
+    
+    # 首次写入时创建版本行；并发创建冲突时改为递增对方创建的行
+    try:
+        with db.begin_nested():
+            db.add(DataVersion(version_key=version_key, version=1))
+    except IntegrityError:
+        db.query(DataVersion).filter(DataVersion.version_key == version_key).update(
+            {DataVersion.version: DataVersion.version + 1}, synchronize_session=False
+        )
+
+def get_data_version(db: Session, version_key: str = ATTENDANCE_DATA_VERSION) -> int:
+    """
+    读取当前数据版本号，尚无版本行时为 0
+    """
+    row = db.query(DataVersion.version).filter(DataVersion.version_key == version_key).first()
+    return row.version if row else 0
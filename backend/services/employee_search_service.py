@@ -0,0 +1,127 @@
+from typing import Dict, Iterable, List, Optional, Set
+import logging
+import threading
+
+from sqlalchemy.orm import Session
+
+from models.employee import Employee
+from services.data_version_service import get_data_version
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:  # 未安装 pypinyin 时不支持拼音首字母搜索
+    lazy_pinyin = None
+
+logger = logging.getLogger(__name__)
+
+# 员工信息的数据版本标识，员工新增、修改、删除、导入时递增
+EMPLOYEE_DATA_VERSION = "employees"
+
+def pinyin_initials(name: str) -> str:
+    """
+    中文姓名的拼音首字母，如 张三 -> zs；未安装 pypinyin 时返回空字符串
+    """
+    if lazy_pinyin is None or not name:
+        return ""
+    return "".join(syllable[0] for syllable in lazy_pinyin(name, style=Style.FIRST_LETTER) if syllable).lower()
+
+class EmployeeSearchIndex:
+    """
+    员工内存搜索索引
+
+    对姓名、工号和姓名拼音首字母建立单字和二元组倒排索引，搜索时按二元组求交集得到候选员工，
+    再校验子串匹配，语义与 LIKE '%关键字%' 一致，不再对 employees 表全表扫描。
+    索引记录构建时的员工数据版本，本进程内的员工变更增量更新索引；
+    其他进程修改员工后版本不一致，下一次搜索时重新构建。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._tokens: Dict[int, tuple] = {}
+        self._grams: Dict[str, Set[int]] = {}
+
+    def search(self, db: Session, keyword: str) -> List[int]:
+        """
+        按姓名、工号或拼音首字母搜索员工
+
+        Returns:
+            匹配的员工ID列表（升序）
+        """
+        keyword = (keyword or "").strip().lower()
+        if not keyword:
+            return []
+        self._ensure_fresh(db)
+
+        with self._lock:
+            if len(keyword) == 1:
+                candidates = self._grams.get(keyword, set())
+            else:
+                gram_sets = [self._grams.get(keyword[i:i + 2], set()) for i in range(len(keyword) - 1)]
+                gram_sets.sort(key=len)
+                candidates = set(gram_sets[0]).intersection(*gram_sets[1:])
+            return sorted(
+                employee_id for employee_id in candidates
+                if any(keyword in token for token in self._tokens[employee_id])
+            )
+
+    def rebuild(self, db: Session):
+        """
+        从 employees 表重新构建索引
+        """
+        version = get_data_version(db, EMPLOYEE_DATA_VERSION)
+        rows = db.query(Employee.employee_id, Employee.name, Employee.employee_no).all()
+        tokens, grams = {}, {}
+        for row in rows:
+            self._add(tokens, grams, row.employee_id, row.name, row.employee_no)
+        with self._lock:
+            self._tokens, self._grams, self._version = tokens, grams, version
+        logger.info(f"员工搜索索引已重建: {len(tokens)} 名员工，版本 {version}")
+
+    def on_employees_changed(self, db: Session, employees: Iterable[Employee] = (), removed_ids: Iterable[int] = ()):
+        """
+        员工变更提交后增量更新索引
+
+        只有本次提交恰好使版本加一（期间没有其他进程修改员工）时才增量更新，否则留待下一次搜索时重建。
+        """
+        version = get_data_version(db, EMPLOYEE_DATA_VERSION)
+        with self._lock:
+            if self._version is None or version != self._version + 1:
+                return
+            for employee_id in removed_ids:
+                self._remove(employee_id)
+            for employee in employees:
+                self._remove(employee.employee_id)
+                self._add(self._tokens, self._grams, employee.employee_id, employee.name, employee.employee_no)
+            self._version = version
+
+    def _ensure_fresh(self, db: Session):
+        version = get_data_version(db, EMPLOYEE_DATA_VERSION)
+        with self._lock:
+            fresh = self._version == version
+        if not fresh:
+            self.rebuild(db)
+
+    @staticmethod
+    def _add(tokens: Dict[int, tuple], grams: Dict[str, Set[int]], employee_id: int, name: Optional[str], employee_no: Optional[str]):
+        employee_tokens = tuple(token for token in (
+            (name or "").lower(), (employee_no or "").lower(), pinyin_initials(name or "")
+        ) if token)
+        tokens[employee_id] = employee_tokens
+        for token in employee_tokens:
+            for i in range(len(token)):
+                grams.setdefault(token[i], set()).add(employee_id)
+                if i + 1 < len(token):
+                    grams.setdefault(token[i:i + 2], set()).add(employee_id)
+
+    def _remove(self, employee_id: int):
+        for token in self._tokens.pop(employee_id, ()):
+            for i in range(len(token)):
+                for gram in (token[i], token[i:i + 2]):
+                    employee_ids = self._grams.get(gram)
+                    if employee_ids is not None:
+                        employee_ids.discard(employee_id)
+                        if not employee_ids:
+                            del self._grams[gram]
+
+# 全局员工搜索索引实例
+employee_search_index = EmployeeSearchIndex()
@@ -4,6 +4,8 @@ import pandas as pd
 from io import BytesIO
 
 from models import employee as employee_model
+from services.data_version_service import bump_data_version
+from services.employee_search_service import employee_search_index, EMPLOYEE_DATA_VERSION
 from schemas import employee as employee_schema
 from utils.security import get_password_hash, verify_password
 
@@ -22,14 +24,18 @@ def create_employee(db: Session, employee: employee_schema.EmployeeCreate):
         password=hashed_password
     )
     db.add(db_employee)
+    bump_data_version(db, EMPLOYEE_DATA_VERSION)
     db.commit()
     db.refresh(db_employee)
+    employee_search_index.on_employees_changed(db, employees=[db_employee])
     return db_employee
 
 def get_employees(db: Session, skip: int = 0, limit: int = 100, name: str = None):
     query = db.query(employee_model.Employee)
     if name:
-        query = query.filter(employee_model.Employee.name.contains(name))
+        # 通过内存索引按姓名、工号或拼音首字母匹配，再按主键查询
+        employee_ids = employee_search_index.search(db, name)
+        query = query.filter(employee_model.Employee.employee_id.in_(employee_ids))
     employees = query.offset(skip).limit(limit).all()
     return employees
 
@@ -46,15 +52,22 @@ def update_employee(db: Session, employee_id: int, employee: employee_schema.Emp
         for key, value in update_data.items():
             if key != "password":
                 setattr(db_employee, key, value)
+        # 考勤列表按员工姓名筛选，姓名变化后缓存的总数失效
+        bump_data_version(db)
+        bump_data_version(db, EMPLOYEE_DATA_VERSION)
         db.commit()
         db.refresh(db_employee)
+        employee_search_index.on_employees_changed(db, employees=[db_employee])
     return db_employee
 
 def delete_employee(db: Session, employee_id: int):
     db_employee = get_employee(db, employee_id)
     if db_employee:
         db.delete(db_employee)
+        bump_data_version(db)
+        bump_data_version(db, EMPLOYEE_DATA_VERSION)
         db.commit()
+        employee_search_index.on_employees_changed(db, removed_ids=[employee_id])
     return db_employee
 
 def get_employee_by_employee_no(db: Session, employee_no: str):
@@ -82,6 +95,7 @@ def import_employees_from_file(db: Session, contents: bytes):
         df = df.rename(columns=column_mapping)
         
         imported_count = 0
+        imported_employees = []
         for index, row in df.iterrows():
             try:
                 # 处理是否管理员字段
@@ -118,13 +132,17 @@ def import_employees_from_file(db: Session, contents: bytes):
                     password=hashed_password
                 )
                 db.add(db_employee)
+                imported_employees.append(db_employee)
                 imported_count += 1
                 
             except Exception as e:
                 print(f"Error importing row {index}: {str(e)}")
                 continue
         
+        if imported_employees:
+            bump_data_version(db, EMPLOYEE_DATA_VERSION)
         db.commit()
+        employee_search_index.on_employees_changed(db, employees=imported_employees)
         return imported_count
         
     except Exception as e:
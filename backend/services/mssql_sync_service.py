@@ -1,5 +1,7 @@
 from datetime import datetime, date, timedelta
-from typing import List, Dict, Optional
+from typing import Callable, Iterable, Iterator, List, Dict, Optional
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.orm import Session
 import hashlib
 import logging
@@ -9,12 +11,23 @@ import asyncio
 from enum import Enum
 import traceback
 import os
+import json
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from contextlib import contextmanager
 
+from config.config import settings
+from database.database import engine
 from database.mssql_database import get_mssql_connection
 from models import employee as employee_model
 from models import attendance_record as attendance_record_model
-from models.sync_log import SyncLog, SyncRecord
+from models.sync_log import SyncLog, SyncRecord, SyncCheckpoint
+from models.raw_punch import RawPunch
 from schemas.sync_log import SyncLogCreate, SyncLogUpdate, SyncRecordCreate
+from services.shift_classifier import classify_attendance, calculate_work_minutes
+from services.sync_leader_service import SyncLeaderElection, BACKGROUND_SYNC_LEASE
+from services.sync_scheduler import AdaptiveSyncScheduler
+from services.sync_pipeline import prefetch_pipeline
+from services.data_version_service import bump_data_version
 
 # 配置日志格式
 logging.basicConfig(
@@ -23,6 +36,40 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 排除的刷卡设备ID
+EXCLUDED_DEVICE_IDS = [701, 702, 703, 704, 705, 706, 710, 750, 760]
+
+# 增量同步高水位线的检查点标识
+WATERMARK_CHECKPOINT_KEY = "attendance_records:sign_time"
+
+# 首次增量同步（尚无水位线）时回溯的天数
+INITIAL_SYNC_DAYS = 3
+
+# 去重预取时单次IN查询的最大参数个数
+DEDUP_LOOKUP_CHUNK_SIZE = 1000
+
+# 后台同步等待同步锁时检查停止信号的间隔（秒）
+SYNC_LOCK_POLL_SECONDS = 1
+
+# 本地原始刷卡重建时的同步数据源标识
+RAW_PUNCH_SYNC_SOURCE = "LOCAL_RawPunches"
+
+# 同步阶段耗时直方图的桶上界（秒）
+SYNC_PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# 同步阶段：MSSQL读取（游标迭代）、刷卡折叠、原始刷卡落地、状态判断、去重预取、写入、提交、整轮同步
+SYNC_PHASES = ("mssql_fetch", "fold", "raw_store", "classify", "dedup_lookup", "write", "commit", "cycle")
+
+# 行数计数器：拉取的刷卡、新增、更新、跳过、失败的考勤记录
+SYNC_ROW_COUNTERS = ("punches_fetched", "records_inserted", "records_updated", "records_skipped", "records_failed")
+
+class SyncCancelled(Exception):
+    """同步被停止信号中止（已提交的块保持提交，未提交的部分已回滚）"""
+
+def check_cancelled(cancel_event: Optional[threading.Event], where: str):
+    if cancel_event is not None and cancel_event.is_set():
+        raise SyncCancelled(f"同步已取消: {where}")
+
 class SyncErrorType(Enum):
     """同步错误类型枚举"""
     CONNECTION_ERROR = "connection_error"  # 连接错误
@@ -31,9 +78,51 @@ class SyncErrorType(Enum):
     PERMISSION_ERROR = "permission_error"  # 权限错误
     UNKNOWN_ERROR = "unknown_error"  # 未知错误
 
+class PhaseHistogram:
+    """单个同步阶段的耗时直方图"""
+    def __init__(self):
+        self.bucket_counts = [0] * len(SYNC_PHASE_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, seconds: float):
+        for i, upper_bound in enumerate(SYNC_PHASE_BUCKETS):
+            if seconds <= upper_bound:
+                self.bucket_counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+    
+    def cumulative_buckets(self) -> List[tuple]:
+        """
+        返回 (桶上界, 累计次数) 列表，末尾为 +Inf
+        """
+        result = []
+        total = 0
+        for upper_bound, bucket_count in zip(SYNC_PHASE_BUCKETS, self.bucket_counts):
+            total += bucket_count
+            result.append((upper_bound, total))
+        result.append(("+Inf", self.count))
+        return result
+    
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum_seconds": round(self.sum, 3),
+            "avg_seconds": round(self.sum / self.count, 3) if self.count else None,
+            "max_seconds": round(self.max, 3),
+            "buckets": {str(upper_bound): total for upper_bound, total in self.cumulative_buckets()}
+        }
+
 class SyncMetrics:
     """同步监控指标"""
     def __init__(self):
+        # 阶段耗时和行数计数可能来自后台同步、手动同步任务和并发查询线程
+        self._lock = threading.Lock()
+        self.phase_histograms = {phase: PhaseHistogram() for phase in SYNC_PHASES}
+        self.row_counters = {counter: 0 for counter in SYNC_ROW_COUNTERS}
         self.total_syncs = 0
         self.successful_syncs = 0
         self.failed_syncs = 0
@@ -62,8 +151,31 @@ class SyncMetrics:
             self.error_types[error_key] = 0
         self.error_types[error_key] += 1
         
+    def observe_phase(self, phase: str, seconds: float):
+        with self._lock:
+            self.phase_histograms[phase].observe(seconds)
+    
+    @contextmanager
+    def time_phase(self, phase: str):
+        """
+        统计代码块的耗时（异常退出同样计入）
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_phase(phase, time.perf_counter() - started)
+    
+    def add_rows(self, counter: str, count: int):
+        if count:
+            with self._lock:
+                self.row_counters[counter] += count
+    
     def get_metrics(self) -> Dict:
         success_rate = (self.successful_syncs / self.total_syncs * 100) if self.total_syncs > 0 else 0
+        with self._lock:
+            phases = {phase: histogram.to_dict() for phase, histogram in self.phase_histograms.items()}
+            rows = dict(self.row_counters)
         return {
             "total_syncs": self.total_syncs,
             "successful_syncs": self.successful_syncs,
@@ -73,8 +185,213 @@ class SyncMetrics:
             "total_errors": self.total_errors,
             "error_types": self.error_types,
             "last_error_time": self.last_error_time.isoformat() if self.last_error_time else None,
-            "consecutive_failures": self.consecutive_failures
+            "consecutive_failures": self.consecutive_failures,
+            "phases": phases,
+            "rows": rows
         }
+    
+    def to_prometheus(self) -> str:
+        """
+        以Prometheus文本格式输出指标
+        """
+        lines = [
+            "# HELP attendance_sync_runs_total 后台同步执行次数",
+            "# TYPE attendance_sync_runs_total counter",
+            f'attendance_sync_runs_total{{result="success"}} {self.successful_syncs}',
+            f'attendance_sync_runs_total{{result="failure"}} {self.failed_syncs}',
+            "# HELP attendance_sync_consecutive_failures 后台同步连续失败次数",
+            "# TYPE attendance_sync_consecutive_failures gauge",
+            f"attendance_sync_consecutive_failures {self.consecutive_failures}",
+            "# HELP attendance_sync_errors_total 按错误类型统计的同步错误次数",
+            "# TYPE attendance_sync_errors_total counter",
+        ]
+        for error_type, count in sorted(self.error_types.items()):
+            lines.append(f'attendance_sync_errors_total{{type="{error_type}"}} {count}')
+        
+        with self._lock:
+            lines.append("# HELP attendance_sync_rows_total 同步处理的行数")
+            lines.append("# TYPE attendance_sync_rows_total counter")
+            for counter, count in self.row_counters.items():
+                lines.append(f'attendance_sync_rows_total{{kind="{counter}"}} {count}')
+            
+            lines.append("# HELP attendance_sync_phase_seconds 同步各阶段耗时（秒）")
+            lines.append("# TYPE attendance_sync_phase_seconds histogram")
+            for phase, histogram in self.phase_histograms.items():
+                for upper_bound, total in histogram.cumulative_buckets():
+                    lines.append(f'attendance_sync_phase_seconds_bucket{{phase="{phase}",le="{upper_bound}"}} {total}')
+                lines.append(f'attendance_sync_phase_seconds_sum{{phase="{phase}"}} {histogram.sum:.6f}')
+                lines.append(f'attendance_sync_phase_seconds_count{{phase="{phase}"}} {histogram.count}')
+        
+        return "\n".join(lines) + "\n"
+
+class PunchGroup:
+    """
+    一个"员工-日期"的折叠结果，只保留首末次刷卡、刷卡次数和设备数
+    """
+    __slots__ = ('employee_name', 'first_time', 'first_device', 'last_time', 'count', 'device_count')
+    
+    def __init__(self, employee_name: str, card_time: datetime, device_name: str):
+        self.employee_name = employee_name
+        self.first_time = card_time
+        self.first_device = device_name
+        self.last_time = card_time
+        self.count = 0
+        self.device_count = 0
+
+class PunchAccumulator:
+    """
+    刷卡记录折叠器
+    
+    逐块接收按 (员工工号, 刷卡时间) 排序的刷卡流，单遍折叠出每个"员工-日期"的首末次刷卡、刷卡次数和设备数，
+    不保留刷卡明细；只有当前正在折叠的"员工-日期"持有设备名集合，其余分组只保留 PunchGroup。
+    输入未排序时结果仍正确，只是重新回到已关闭分组时设备数按新出现的设备累加，可能偏大。
+    """
+    def __init__(self):
+        self._groups = {}
+        self._open_key = None
+        self._open_group = None
+        self._open_devices = set()
+        self._open_base_devices = 0
+        self.punch_count = 0
+    
+    def add_rows(self, rows: List[Dict]):
+        groups = self._groups
+        open_key, group = self._open_key, self._open_group
+        devices, base_devices = self._open_devices, self._open_base_devices
+        
+        for row in rows:
+            card_time = row['card_time']
+            device_name = row.get('device_name', '')
+            key = (row['employee_no'], card_time.date())
+            
+            if key != open_key:
+                if group is not None:
+                    group.device_count = base_devices + len(devices)
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = PunchGroup(row.get('employee_name', ''), card_time, device_name)
+                    base_devices = 0
+                else:
+                    base_devices = group.device_count
+                devices = set()
+                open_key = key
+            
+            # 与按时间稳定排序后取首尾一致：同一时间的刷卡，首次取先到的，末次取后到的
+            if card_time < group.first_time:
+                group.first_time = card_time
+                group.first_device = device_name
+                group.employee_name = row.get('employee_name', '')
+            if card_time >= group.last_time:
+                group.last_time = card_time
+            group.count += 1
+            devices.add(device_name)
+        
+        self._open_key, self._open_group = open_key, group
+        self._open_devices, self._open_base_devices = devices, base_devices
+        self.punch_count += len(rows)
+    
+    def merge(self, other: "PunchAccumulator"):
+        """
+        合并另一个折叠器的结果（用于合并不同员工批次的并发查询结果）
+        
+        各批次的员工互不重叠，同一"员工-日期"不会同时出现在两个折叠器中；若出现，设备数按两边相加
+        """
+        self._sync_open_group()
+        other._sync_open_group()
+        for key, other_group in other._groups.items():
+            group = self._groups.get(key)
+            if group is None:
+                self._groups[key] = other_group
+                continue
+            if other_group.first_time < group.first_time:
+                group.first_time = other_group.first_time
+                group.first_device = other_group.first_device
+                group.employee_name = other_group.employee_name
+            if other_group.last_time >= group.last_time:
+                group.last_time = other_group.last_time
+            group.count += other_group.count
+            group.device_count += other_group.device_count
+            if group is self._open_group:
+                self._open_base_devices += other_group.device_count
+        
+        self.punch_count += other.punch_count
+    
+    def processed_records_by_date(self) -> Dict[str, List[Dict]]:
+        """
+        输出按日期分组的考勤记录：每个员工当天的第一次刷卡作为上班时间，最后一次刷卡作为下班时间
+        """
+        self._sync_open_group()
+        result = {}
+        date_strs = {}
+        for (employee_no, day), group in self._groups.items():
+            attendance_date = date_strs.get(day)
+            if attendance_date is None:
+                attendance_date = date_strs[day] = day.strftime('%Y-%m-%d')
+            count = group.count
+            result.setdefault(attendance_date, []).append({
+                'employee_no': employee_no,
+                'employee_name': group.employee_name,
+                'attendance_date': attendance_date,
+                'clock_in_time': group.first_time,
+                # 最后一次刷卡作为下班时间（如果只有一次刷卡，则下班时间为空）
+                'clock_out_time': group.last_time if count > 1 else None,
+                'external_record_id': f"MSSQL_{employee_no}_{attendance_date}_{count}_cards",
+                'total_card_count': count,
+                'device_info': f"{group.first_device}等{group.device_count}个设备"
+            })
+        return result
+    
+    def _sync_open_group(self):
+        # 把当前分组的设备数写回 PunchGroup，分组保持打开，后续刷卡可继续折叠
+        if self._open_group is not None:
+            self._open_group.device_count = self._open_base_devices + len(self._open_devices)
+
+class FetchStats:
+    """
+    MSSQL批次查询耗时统计，写入同步日志用于调优批次大小和并发度
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batch_size = None
+        self.concurrency = None
+        self.queries = 0
+        self.batch_seconds = []
+        self.punches = 0
+        self.wall_seconds = 0.0
+    
+    def configure(self, batch_size: int, concurrency: int):
+        with self._lock:
+            self.batch_size = batch_size
+            self.concurrency = concurrency
+            self.queries += 1
+    
+    def record_batch(self, seconds: float, punches: int):
+        with self._lock:
+            self.batch_seconds.append(seconds)
+            self.punches += punches
+    
+    def record_wall(self, seconds: float):
+        with self._lock:
+            self.wall_seconds += seconds
+    
+    def to_dict(self) -> Dict:
+        with self._lock:
+            batches = len(self.batch_seconds)
+            return {
+                "batch_size": self.batch_size,
+                "concurrency": self.concurrency,
+                "queries": self.queries,
+                "batches": batches,
+                "punches": self.punches,
+                "wall_seconds": round(self.wall_seconds, 3),
+                "batch_seconds_total": round(sum(self.batch_seconds), 3),
+                "batch_seconds_min": round(min(self.batch_seconds), 3) if batches else None,
+                "batch_seconds_avg": round(sum(self.batch_seconds) / batches, 3) if batches else None,
+                "batch_seconds_max": round(max(self.batch_seconds), 3) if batches else None
+            }
+    
+    def to_json(self) -> Optional[str]:
+        return json.dumps(self.to_dict(), ensure_ascii=False) if self.queries else None
 
 class MSSQLSyncService:
     """
@@ -91,8 +408,25 @@ class MSSQLSyncService:
         self._sync_interval = self._get_sync_interval_by_env()
         self._is_running = False
         self._stop_event = threading.Event()
+        # 同步间隔被修改或服务停止时唤醒后台循环
+        self._wake_event = threading.Event()
         self._last_sync_time = None
+        self._next_sync_time = None
+        self._scheduler = AdaptiveSyncScheduler(
+            settings.SYNC_SHIFT_BOUNDARIES,
+            settings.SYNC_SHIFT_WINDOW_MINUTES,
+            settings.SYNC_PEAK_INTERVAL_MINUTES * 60,
+            settings.SYNC_IDLE_MAX_INTERVAL_MINUTES * 60,
+            settings.SYNC_BUSY_PUNCHES_PER_MINUTE
+        ) if settings.SYNC_ADAPTIVE_SCHEDULE else None
         self._sync_status = "stopped"
+        # 后台同步与手动同步任务共用，避免两者同时写入同一批考勤数据
+        self.sync_lock = threading.Lock()
+        # 多进程/多副本部署时只有持有租约的进程执行定时同步
+        self._leader_election = (
+            SyncLeaderElection(BACKGROUND_SYNC_LEASE, settings.SYNC_LEADER_LEASE_SECONDS)
+            if settings.SYNC_LEADER_ELECTION else None
+        )
         
         # 监控和错误处理相关属性
         self._metrics = SyncMetrics()
@@ -104,7 +438,8 @@ class MSSQLSyncService:
         env_name = self._get_environment_name()
         logger.info(f"同步服务初始化 - 环境: {env_name}, 同步间隔: {self._sync_interval//60}分钟({self._sync_interval}秒)")
     
-    def sync_attendance_records(self, db: Session, sync_date: str = None, employee_nos: List[str] = None, sync_days: int = 1) -> Dict:
+    def sync_attendance_records(self, db: Session, sync_date: str = None, employee_nos: List[str] = None, sync_days: int = 1,
+                                cancel_event: threading.Event = None) -> Dict:
         """
         从MSSQL同步考勤记录
         
@@ -113,6 +448,7 @@ class MSSQLSyncService:
             sync_date: 同步日期，格式：YYYY-MM-DD，默认为今天
             employee_nos: 指定员工工号列表，为空则同步所有员工
             sync_days: 同步天数，默认1天（当天）
+            cancel_event: 停止信号，设置后按日期范围同步时不再拉取新的窗口
         
         Returns:
             同步结果字典
@@ -121,49 +457,373 @@ class MSSQLSyncService:
             # 默认同步指定天数的数据，从今天往前推
             end_date = date.today()
             start_date = end_date - timedelta(days=sync_days - 1)
-            return self._sync_date_range(db, start_date, end_date, employee_nos)
+            return self._sync_date_range(db, start_date, end_date, employee_nos, cancel_event=cancel_event)
         else:
             # 如果指定了日期，只同步该日期
             return self._sync_single_date(db, sync_date, employee_nos)
     
-    def _sync_date_range(self, db: Session, start_date: date, end_date: date, employee_nos: List[str] = None) -> Dict:
+    def sync_incremental(self, db: Session, cancel_event: threading.Event = None) -> Dict:
         """
-        同步日期范围内的考勤记录
+        基于持久化高水位线的增量同步
+        
+        只拉取水位线之后（含回看窗口）的新刷卡，并只重算这些刷卡涉及的"员工-日期"，
+        每次同步的开销与新增数据量相关，而与同步窗口大小无关。
+        尚无水位线时（首次运行），先记录MSSQL当前最大刷卡时间，再同步最近几天的数据。
+        
+        Returns:
+            同步结果字典，结构与 _sync_date_range 一致
+        """
+        checkpoint = self._get_checkpoint(db, WATERMARK_CHECKPOINT_KEY)
+        
+        if checkpoint is None or checkpoint.watermark is None:
+            # 先取水位线再同步，保证同步期间新到的刷卡在下一轮被拉取
+            high_water_mark = self._fetch_source_high_water_mark()
+            end_date = date.today()
+            start_date = end_date - timedelta(days=INITIAL_SYNC_DAYS - 1)
+            logger.info(f"尚无同步水位线，执行初始同步 {start_date} 至 {end_date}，完成后水位线设为 {high_water_mark}")
+            
+            result = self._sync_date_range(db, start_date, end_date, cancel_event=cancel_event)
+            # 失败或取消时不设水位线，下一轮重新执行初始同步，避免未处理的日期落在水位线之前
+            if result["status"] == "success" and high_water_mark is not None:
+                self._save_checkpoint(db, WATERMARK_CHECKPOINT_KEY, high_water_mark, result["sync_log_id"])
+            return result
+        
+        since = checkpoint.watermark - timedelta(minutes=settings.SYNC_WATERMARK_OVERLAP_MINUTES)
+        return self._sync_since_watermark(db, since, checkpoint.watermark, cancel_event)
+    
+    def _sync_since_watermark(self, db: Session, since: datetime, watermark: datetime, cancel_event: threading.Event = None) -> Dict:
+        """
+        同步 since 之后的新刷卡所涉及的员工-日期，成功后推进水位线
         """
         total_records = 0
         total_duplicates = 0
         failed_dates = []
         successful_dates = []
         
-        # 创建总体同步日志
-        date_range_str = f"{start_date.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')}"
-        sync_log = self._create_sync_log(db, date_range_str, employee_nos)
+        sync_log = self._create_sync_log(db, f"增量: {since.strftime('%Y-%m-%d %H:%M:%S')} 之后")
+        fetch_stats = FetchStats()
         
         try:
-            current_date = start_date
-            while current_date <= end_date:
-                sync_date_str = current_date.strftime('%Y-%m-%d')
-                logger.info(f"开始同步日期: {sync_date_str}")
-                
+            new_punches = self._fetch_punches_since(since)
+            
+            employees = self._get_sync_employees(db)
+            employee_by_no = {emp.employee_no: emp for emp in employees}
+            
+            # 只保留系统内员工涉及的员工-日期
+            touched = {}
+            new_watermark = watermark
+            for punch in new_punches:
+                card_time = punch['card_time']
+                if card_time > new_watermark:
+                    new_watermark = card_time
+                if punch['employee_no'] in employee_by_no:
+                    touched.setdefault(card_time.strftime('%Y-%m-%d'), set()).add(punch['employee_no'])
+            
+            logger.info(f"增量同步: 水位线 {watermark} 之后（回看至 {since}）共有 {len(new_punches)} 条新刷卡，涉及 {sum(len(v) for v in touched.values())} 个员工-日期")
+            
+            # 逐日重算受影响员工当天的完整刷卡，拉取下一天与写入当天流水线执行
+            tasks = [
+                (sync_date_str,
+                 lambda sync_date_str=sync_date_str: self._fetch_attendance_from_mssql(
+                     sync_date_str, sorted(touched[sync_date_str]), fetch_stats, cancel_event))
+                for sync_date_str in sorted(touched)
+            ]
+            for sync_date_str, attendance_data, fetch_error in prefetch_pipeline(tasks, settings.SYNC_PIPELINE_DEPTH, cancel_event):
+                touched_employees = [employee_by_no[no] for no in sorted(touched[sync_date_str])]
                 try:
-                    result = self._sync_single_date_internal(db, sync_date_str, employee_nos)
+                    if fetch_error is not None:
+                        raise fetch_error
+                    check_cancelled(cancel_event, f"增量同步日期 {sync_date_str} 开始前")
+                    result = self._sync_prefetched_date(db, sync_log.id, sync_date_str, attendance_data, touched_employees,
+                                                        cancel_event=cancel_event)
                     total_records += result.get('records_count', 0)
                     total_duplicates += result.get('duplicates_skipped', 0)
                     successful_dates.append(sync_date_str)
+                except SyncCancelled as e:
+                    db.rollback()
+                    logger.warning(f"增量同步日期 {sync_date_str} 中止: {str(e)}")
+                    break
                 except Exception as e:
-                    logger.error(f"同步日期 {sync_date_str} 失败: {str(e)}")
+                    logger.error(f"增量同步日期 {sync_date_str} 失败: {str(e)}")
                     failed_dates.append(sync_date_str)
+            
+            # 取消时尚未完成的日期不推进水位线，下一轮重新拉取
+            cancelled_dates = [d for d in sorted(touched) if d not in successful_dates and d not in failed_dates]
+            if cancelled_dates:
+                logger.warning(f"增量同步已取消，未完成的日期: {', '.join(cancelled_dates)}")
+            
+            # 全部成功才推进水位线，否则下一轮重新拉取
+            if not failed_dates and not cancelled_dates and new_watermark > watermark:
+                self._save_checkpoint(db, WATERMARK_CHECKPOINT_KEY, new_watermark, sync_log.id)
+            
+            if cancelled_dates:
+                status = "cancelled"
+            else:
+                status = "success" if not failed_dates else "partial_success" if successful_dates else "failed"
+            message = f"增量同步 {len(successful_dates)} 天，失败 {len(failed_dates)} 天。总计 {total_records} 条记录，跳过重复 {total_duplicates} 条"
+            if cancelled_dates:
+                message += f"；已取消，未完成 {len(cancelled_dates)} 天"
+            
+            error_messages = []
+            if failed_dates:
+                error_messages.append(f"失败日期: {', '.join(failed_dates)}")
+            if cancelled_dates:
+                error_messages.append(f"取消时未完成的日期: {', '.join(cancelled_dates)}")
+            self._update_sync_log(db, sync_log.id, {
+                "sync_status": status,
+                "records_count": total_records,
+                "error_message": "；".join(error_messages) or None,
+                "fetch_stats": fetch_stats.to_json(),
+                "sync_end_time": datetime.now()
+            })
+            
+            return {
+                "message": message,
+                "sync_log_id": sync_log.id,
+                "records_count": total_records,
+                "duplicates_skipped": total_duplicates,
+                "successful_dates": successful_dates,
+                "failed_dates": failed_dates,
+                "cancelled_dates": cancelled_dates,
+                "status": status,
+                "watermark": new_watermark.isoformat(),
+                "punches": len(new_punches)
+            }
+            
+        except Exception as e:
+            logger.error(f"增量同步失败: {str(e)}")
+            self._update_sync_log(db, sync_log.id, {
+                "sync_status": "failed",
+                "error_message": str(e),
+                "fetch_stats": fetch_stats.to_json(),
+                "sync_end_time": datetime.now()
+            })
+            raise
+    
+    def _fetch_punches_since(self, since: datetime) -> List[Dict]:
+        """
+        获取 since 之后（不晚于当前时间）的新刷卡，只取工号和刷卡时间
+        """
+        excluded_devices_str = ','.join(map(str, EXCLUDED_DEVICE_IDS))
+        query = f"""
+        SELECT 
+            T.emp_id as employee_no,
+            T.sign_time as card_time
+        FROM TimeRecords T WITH (nolock)
+        WHERE T.sign_time > ? AND T.sign_time <= ?
+        AND T.clock_id NOT IN ({excluded_devices_str})
+        """
+        try:
+            with self._metrics.time_phase("mssql_fetch"):
+                return self.mssql_conn.execute_query(query, [since, datetime.now()])
+        except Exception as e:
+            logger.error(f"获取增量刷卡记录失败 - 起点: {since}, 错误: {str(e)}")
+            raise Exception(f"MSSQL增量数据获取失败: {str(e)}")
+    
+    def _fetch_source_high_water_mark(self) -> Optional[datetime]:
+        """
+        获取MSSQL中当前最大的刷卡时间（不晚于当前时间）
+        """
+        excluded_devices_str = ','.join(map(str, EXCLUDED_DEVICE_IDS))
+        query = f"""
+        SELECT MAX(T.sign_time) as max_sign_time
+        FROM TimeRecords T WITH (nolock)
+        WHERE T.sign_time <= ?
+        AND T.clock_id NOT IN ({excluded_devices_str})
+        """
+        rows = self.mssql_conn.execute_query(query, [datetime.now()])
+        return rows[0]['max_sign_time'] if rows else None
+    
+    def _get_checkpoint(self, db: Session, checkpoint_key: str) -> Optional[SyncCheckpoint]:
+        """
+        获取同步检查点
+        """
+        return db.query(SyncCheckpoint).filter(SyncCheckpoint.checkpoint_key == checkpoint_key).first()
+    
+    def _save_checkpoint(self, db: Session, checkpoint_key: str, watermark: datetime, sync_log_id: int = None):
+        """
+        保存（推进）同步检查点
+        """
+        checkpoint = self._get_checkpoint(db, checkpoint_key)
+        if checkpoint is None:
+            checkpoint = SyncCheckpoint(checkpoint_key=checkpoint_key)
+            db.add(checkpoint)
+        checkpoint.watermark = watermark
+        checkpoint.sync_log_id = sync_log_id
+        db.commit()
+        logger.info(f"同步水位线已更新: {checkpoint_key} -> {watermark}")
+    
+    def _set_checkpoint_position(self, db: Session, checkpoint_key: str, position: str, sync_log_id: int = None):
+        """
+        记录分块提交的断点位置（不提交，由调用方随本块数据一起提交）
+        """
+        checkpoint = self._get_checkpoint(db, checkpoint_key)
+        if checkpoint is None:
+            checkpoint = SyncCheckpoint(checkpoint_key=checkpoint_key)
+            db.add(checkpoint)
+        checkpoint.position = position
+        checkpoint.sync_log_id = sync_log_id
+    
+    def _clear_checkpoint(self, db: Session, checkpoint_key: str):
+        """
+        删除已完成的范围同步断点
+        """
+        db.query(SyncCheckpoint).filter(SyncCheckpoint.checkpoint_key == checkpoint_key).delete()
+        db.commit()
+    
+    def _range_checkpoint_key(self, start_date: date, end_date: date, employee_nos: List[str] = None) -> str:
+        """
+        生成范围同步的断点标识，同一日期范围和员工范围共用一个断点
+        """
+        scope = hashlib.md5(",".join(sorted(set(employee_nos))).encode()).hexdigest()[:12] if employee_nos else "all"
+        return f"attendance_records:range:{start_date.strftime('%Y-%m-%d')}:{end_date.strftime('%Y-%m-%d')}:{scope}"
+    
+    def get_sync_watermark(self, db: Session) -> Optional[datetime]:
+        """
+        获取当前增量同步水位线
+        """
+        checkpoint = self._get_checkpoint(db, WATERMARK_CHECKPOINT_KEY)
+        return checkpoint.watermark if checkpoint else None
+    
+    def _sync_date_range(self, db: Session, start_date: date, end_date: date, employee_nos: List[str] = None,
+                         progress_callback: Callable[[str, bool, int], None] = None, resumable: bool = False,
+                         sync_type: str = "attendance_records", cancel_event: threading.Event = None) -> Dict:
+        """
+        同步日期范围内的考勤记录
+        
+        progress_callback(日期, 是否成功, 处理记录数) 在每个日期处理完成后调用，用于上报进度。
+        resumable 为 True 时，每个提交块与断点位置在同一事务中写入检查点；
+        同一范围再次同步时跳过已提交的日期和块，全部成功后清除检查点。
+        sync_type 写入总体同步日志，用于区分历史回补等批量任务。
+        拉取与写入按窗口流水线执行；cancel_event 在MSSQL批次之间、日期之间和提交块之间检查，
+        被设置后回滚未提交的块并停止，状态为 cancelled，断点保留在最后提交的块，下次同步时继续。
+        """
+        total_records = 0
+        total_duplicates = 0
+        failed_dates = []
+        successful_dates = []
+        
+        # 创建总体同步日志
+        date_range_str = f"{start_date.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')}"
+        sync_log = self._create_sync_log(db, date_range_str, employee_nos, sync_type=sync_type)
+        fetch_stats = FetchStats()
+        
+        # 断点续传：从上次最后提交的日期和工号继续
+        checkpoint_key = self._range_checkpoint_key(start_date, end_date, employee_nos) if resumable else None
+        resume_date, resume_after = None, None
+        if checkpoint_key:
+            checkpoint = self._get_checkpoint(db, checkpoint_key)
+            if checkpoint and checkpoint.position:
+                resume_date_str, _, resume_after = checkpoint.position.partition('|')
+                resume_date = datetime.strptime(resume_date_str, '%Y-%m-%d').date()
+                resume_after = resume_after or None
+                logger.info(f"范围同步 {date_range_str} 从断点继续: {resume_date_str} 工号 {resume_after or '(开头)'} 之后")
+        fetch_start_date = max(start_date, resume_date) if resume_date else start_date
+        
+        try:
+            # 员工列表只加载一次；之前的运行中已全部提交的日期直接计为成功
+            employees = self._get_sync_employees(db, employee_nos)
+            current_date = start_date
+            while current_date < fetch_start_date and current_date <= end_date:
+                successful_dates.append(current_date.strftime('%Y-%m-%d'))
+                if progress_callback:
+                    progress_callback(current_date.strftime('%Y-%m-%d'), True, 0)
+                current_date += timedelta(days=1)
+            
+            # 拉取与写入流水线：后台线程预取下一个窗口的刷卡，当前线程写入已拉取的窗口
+            fetch_employee_nos = [emp.employee_no for emp in employees]
+            tasks = [
+                ((window_start, window_end),
+                 lambda window_start=window_start, window_end=window_end: self._fetch_sync_window(
+                     window_start, window_end, fetch_employee_nos, fetch_stats, cancel_event))
+                for window_start, window_end in self._split_fetch_windows(fetch_start_date, end_date)
+            ]
+            cancelled = False
+            for (window_start, window_end), window_data, fetch_error in prefetch_pipeline(tasks, settings.SYNC_PIPELINE_DEPTH, cancel_event):
+                if fetch_error is not None and not isinstance(fetch_error, SyncCancelled):
+                    logger.error(f"获取考勤数据失败 - {window_start} 至 {window_end}: {str(fetch_error)}")
                 
+                current_date = window_start
+                while current_date <= window_end:
+                    sync_date_str = current_date.strftime('%Y-%m-%d')
+                    if cancel_event is not None and cancel_event.is_set():
+                        cancelled = True
+                        break
+                    logger.info(f"开始同步日期: {sync_date_str}")
+                    
+                    # 已有日期失败时不再推进断点，保证下次从最早的失败位置继续
+                    day_resume_after = resume_after if current_date == resume_date else None
+                    checkpoint_callback = None
+                    if checkpoint_key and not failed_dates:
+                        checkpoint_callback = lambda chunk_db, employee_no, day=sync_date_str: self._set_checkpoint_position(
+                            chunk_db, checkpoint_key, f"{day}|{employee_no}", sync_log.id
+                        )
+                    
+                    try:
+                        if fetch_error is not None:
+                            raise fetch_error
+                        result = self._sync_prefetched_date(
+                            db, sync_log.id, sync_date_str, window_data.get(sync_date_str, []), employees,
+                            day_resume_after, checkpoint_callback, cancel_event
+                        )
+                        total_records += result.get('records_count', 0)
+                        total_duplicates += result.get('duplicates_skipped', 0)
+                        successful_dates.append(sync_date_str)
+                        if checkpoint_key and not failed_dates:
+                            next_date_str = (current_date + timedelta(days=1)).strftime('%Y-%m-%d')
+                            self._set_checkpoint_position(db, checkpoint_key, f"{next_date_str}|", sync_log.id)
+                            db.commit()
+                        if progress_callback:
+                            progress_callback(sync_date_str, True, result.get('records_count', 0))
+                    except SyncCancelled as e:
+                        # 当前块之前的块和断点已提交，未提交的部分回滚
+                        db.rollback()
+                        logger.warning(f"同步日期 {sync_date_str} 中止: {str(e)}")
+                        cancelled = True
+                        break
+                    except Exception as e:
+                        logger.error(f"同步日期 {sync_date_str} 失败: {str(e)}")
+                        failed_dates.append(sync_date_str)
+                        if progress_callback:
+                            progress_callback(sync_date_str, False, 0)
+                    
+                    current_date += timedelta(days=1)
+                if cancelled:
+                    break
+            
+            # 取消时尚未完成的日期，下次同步时从断点重新处理
+            handled_dates = set(successful_dates) | set(failed_dates)
+            cancelled_dates = []
+            current_date = fetch_start_date
+            while current_date <= end_date:
+                if current_date.strftime('%Y-%m-%d') not in handled_dates:
+                    cancelled_dates.append(current_date.strftime('%Y-%m-%d'))
                 current_date += timedelta(days=1)
+            if cancelled_dates:
+                logger.warning(f"范围同步 {date_range_str} 已取消，未完成的日期: {', '.join(cancelled_dates)}")
+            
+            if checkpoint_key and not failed_dates and not cancelled_dates:
+                self._clear_checkpoint(db, checkpoint_key)
             
             # 更新总体同步日志
-            status = "success" if not failed_dates else "partial_success" if successful_dates else "failed"
+            if cancelled_dates:
+                status = "cancelled"
+            else:
+                status = "success" if not failed_dates else "partial_success" if successful_dates else "failed"
             message = f"成功同步 {len(successful_dates)} 天，失败 {len(failed_dates)} 天。总计 {total_records} 条记录，跳过重复 {total_duplicates} 条"
+            if cancelled_dates:
+                message += f"；已取消，未完成 {len(cancelled_dates)} 天"
             
+            error_messages = []
+            if failed_dates:
+                error_messages.append(f"失败日期: {', '.join(failed_dates)}")
+            if cancelled_dates:
+                error_messages.append(f"取消时未完成的日期: {', '.join(cancelled_dates)}")
             self._update_sync_log(db, sync_log.id, {
                 "sync_status": status,
                 "records_count": total_records,
-                "error_message": f"失败日期: {', '.join(failed_dates)}" if failed_dates else None,
+                "error_message": "；".join(error_messages) or None,
+                "fetch_stats": fetch_stats.to_json(),
                 "sync_end_time": datetime.now()
             })
             
@@ -174,6 +834,7 @@ class MSSQLSyncService:
                 "duplicates_skipped": total_duplicates,
                 "successful_dates": successful_dates,
                 "failed_dates": failed_dates,
+                "cancelled_dates": cancelled_dates,
                 "status": status
             }
             
@@ -182,23 +843,54 @@ class MSSQLSyncService:
             self._update_sync_log(db, sync_log.id, {
                 "sync_status": "failed",
                 "error_message": str(e),
+                "fetch_stats": fetch_stats.to_json(),
                 "sync_end_time": datetime.now()
             })
             raise
     
+    def _split_fetch_windows(self, start_date: date, end_date: date) -> List[tuple]:
+        """
+        将日期范围切分为拉取窗口：范围拉取模式按 SYNC_PIPELINE_WINDOW_DAYS 天一个窗口，否则逐日拉取
+        """
+        window_days = settings.SYNC_PIPELINE_WINDOW_DAYS if settings.SYNC_RANGE_FETCH else 1
+        windows = []
+        window_start = start_date
+        while window_start <= end_date:
+            window_end = min(window_start + timedelta(days=window_days - 1), end_date)
+            windows.append((window_start, window_end))
+            window_start = window_end + timedelta(days=1)
+        return windows
+    
+    def _fetch_sync_window(self, start_date: date, end_date: date, employee_nos: List[str], fetch_stats: FetchStats,
+                           cancel_event: threading.Event = None) -> Dict[str, List[Dict]]:
+        """
+        拉取一个窗口的考勤数据，在流水线的预取线程中执行
+        
+        Returns:
+            日期字符串(YYYY-MM-DD) -> 当天处理后的考勤记录列表
+        """
+        if not employee_nos:
+            return {}
+        if start_date == end_date:
+            sync_date_str = start_date.strftime('%Y-%m-%d')
+            return {sync_date_str: self._fetch_attendance_from_mssql(sync_date_str, employee_nos, fetch_stats, cancel_event)}
+        return self._fetch_attendance_range_from_mssql(start_date, end_date, employee_nos, fetch_stats, cancel_event)
+    
     def _sync_single_date(self, db: Session, sync_date: str, employee_nos: List[str] = None) -> Dict:
         """
         同步单个日期的考勤记录（对外接口）
         """
         sync_log = self._create_sync_log(db, sync_date, employee_nos)
+        fetch_stats = FetchStats()
         
         try:
-            result = self._sync_single_date_internal(db, sync_date, employee_nos)
+            result = self._sync_single_date_internal(db, sync_date, employee_nos, fetch_stats)
             
             # 更新同步日志
             self._update_sync_log(db, sync_log.id, {
                 "sync_status": "success",
                 "records_count": result["records_count"],
+                "fetch_stats": fetch_stats.to_json(),
                 "sync_end_time": datetime.now()
             })
             
@@ -210,21 +902,17 @@ class MSSQLSyncService:
             self._update_sync_log(db, sync_log.id, {
                 "sync_status": "failed",
                 "error_message": str(e),
+                "fetch_stats": fetch_stats.to_json(),
                 "sync_end_time": datetime.now()
             })
             raise
     
-    def _sync_single_date_internal(self, db: Session, sync_date: str, employee_nos: List[str] = None) -> Dict:
+    def _sync_single_date_internal(self, db: Session, sync_date: str, employee_nos: List[str] = None, fetch_stats: FetchStats = None) -> Dict:
         """
         同步单个日期的考勤记录（内部实现）
         """
         # 获取系统中的员工列表
-        if employee_nos:
-            employees = db.query(employee_model.Employee).filter(
-                employee_model.Employee.employee_no.in_(employee_nos)
-            ).all()
-        else:
-            employees = db.query(employee_model.Employee).all()
+        employees = self._get_sync_employees(db, employee_nos)
         
         if not employees:
             return {
@@ -235,7 +923,7 @@ class MSSQLSyncService:
             }
         
         # 从MSSQL获取考勤数据
-        attendance_data = self._fetch_attendance_from_mssql(sync_date, [emp.employee_no for emp in employees])
+        attendance_data = self._fetch_attendance_from_mssql(sync_date, [emp.employee_no for emp in employees], fetch_stats)
         
         # 检查是否获取到数据，如果没有数据可能是连接失败
         if not attendance_data:
@@ -266,13 +954,55 @@ class MSSQLSyncService:
             "status": "success"
         }
     
-    def _create_sync_log(self, db: Session, sync_date: str, employee_nos: List[str] = None) -> SyncLog:
+    def _sync_prefetched_date(self, db: Session, sync_log_id: int, sync_date: str, attendance_data: List[Dict], employees: List,
+                              resume_after: str = None, checkpoint_callback: Callable[[Session, str], None] = None,
+                              cancel_event: threading.Event = None) -> Dict:
+        """
+        写入已按范围预取的单日考勤数据（范围拉取模式下的单日处理）
+        """
+        if not employees:
+            return {
+                "message": "未找到要同步的员工",
+                "records_count": 0,
+                "duplicates_skipped": 0,
+                "status": "failed"
+            }
+        
+        if not attendance_data:
+            return {
+                "message": "同步完成，但没有找到符合条件的考勤数据",
+                "records_count": 0,
+                "duplicates_skipped": 0,
+                "status": "success"
+            }
+        
+        result = self._process_sync_data(db, sync_log_id, attendance_data, employees, resume_after, checkpoint_callback, cancel_event)
+        
+        return {
+            "message": f"同步完成，共处理 {result['records_count']} 条记录，跳过重复 {result.get('duplicates_skipped', 0)} 条",
+            "records_count": result["records_count"],
+            "duplicates_skipped": result.get("duplicates_skipped", 0),
+            "status": "success"
+        }
+    
+    def _get_sync_employees(self, db: Session, employee_nos: List[str] = None) -> List:
+        """
+        获取需要同步的员工列表
+        """
+        if employee_nos:
+            return db.query(employee_model.Employee).filter(
+                employee_model.Employee.employee_no.in_(employee_nos)
+            ).all()
+        return db.query(employee_model.Employee).all()
+    
+    def _create_sync_log(self, db: Session, sync_date: str, employee_nos: List[str] = None, sync_source: str = "MSSQL_AttendanceDB",
+                         sync_type: str = "attendance_records") -> SyncLog:
         """
         创建同步日志记录
         """
         sync_log_data = SyncLogCreate(
-            sync_type="attendance_records",
-            sync_source="MSSQL_AttendanceDB",
+            sync_type=sync_type,
+            sync_source=sync_source,
             sync_date=sync_date,
             employee_no=",".join(employee_nos) if employee_nos else "all"
         )
@@ -291,7 +1021,8 @@ class MSSQLSyncService:
         db.query(SyncLog).filter(SyncLog.id == sync_log_id).update(update_data)
         db.commit()
     
-    def _fetch_attendance_from_mssql(self, sync_date: str, employee_nos: List[str]) -> List[Dict]:
+    def _fetch_attendance_from_mssql(self, sync_date: str, employee_nos: List[str], fetch_stats: FetchStats = None,
+                                     cancel_event: threading.Event = None) -> List[Dict]:
         """
         从MSSQL数据库获取考勤数据
         
@@ -301,119 +1032,436 @@ class MSSQLSyncService:
         try:
             logger.info(f"开始从MSSQL获取考勤数据 - 同步日期: {sync_date}, 员工数量: {len(employee_nos) if employee_nos else 0}")
             
-            # 检查员工工号列表是否为空
-            if not employee_nos:
-                error_msg = "员工工号列表为空，无法查询考勤数据"
-                logger.error(error_msg)
-                raise Exception(error_msg)
-            
-            # 排除指定的设备ID
-            excluded_devices = [701, 702, 703, 704, 705, 706, 710, 750, 760]
-            excluded_devices_str = ','.join(map(str, excluded_devices))
-            
-            # 分批处理员工工号，避免IN子句过长导致查询超时
-            batch_size = 100  # 每批处理100个员工
-            all_records = []
-            
-            for i in range(0, len(employee_nos), batch_size):
-                batch_employee_nos = employee_nos[i:i + batch_size]
-                
-                # 构建参数化查询的占位符
-                placeholders = ','.join(['?' for _ in batch_employee_nos])
-                
-                # 根据用户提供的SQL语句结构更新查询，使用参数化查询防止SQL注入
-                query = f"""
-                SELECT 
-                    e.emp_fname as employee_name,
-                    T.clock_id as device_id,
-                    c.Clock_name as device_name,
-                    T.emp_id as employee_no,
-                    T.sign_time as card_time
-                FROM TimeRecords T WITH (nolock)
-                INNER JOIN dbo.Clocks C WITH (nolock) ON C.Clock_id = T.clock_id
-                INNER JOIN [dbo].[Employee] e WITH (nolock) ON e.emp_id = t.emp_id
-                WHERE CAST(T.sign_time AS DATE) = ?
-                AND T.emp_id IN ({placeholders})
-                AND T.clock_id NOT IN ({excluded_devices_str})
-                ORDER BY T.emp_id, T.sign_time
-                """
-                
-                # 构建查询参数
-                params = [sync_date] + batch_employee_nos
-                
-                try:
-                    # 执行查询获取当前批次的刷卡记录
-                    batch_records = self.mssql_conn.execute_query(query, params)
-                    all_records.extend(batch_records)
-                    
-                    logger.info(f"批次 {i//batch_size + 1}: 查询员工 {len(batch_employee_nos)} 人，获取到 {len(batch_records)} 条刷卡记录")
-                except Exception as batch_error:
-                    error_msg = f"批次 {i//batch_size + 1} 查询失败 - 员工数量: {len(batch_employee_nos)}, 错误: {str(batch_error)}"
-                    logger.error(error_msg)
-                    raise Exception(f"MSSQL批次查询失败: {str(batch_error)}")
+            day = datetime.strptime(sync_date, '%Y-%m-%d').date()
             
-            # 处理刷卡记录，计算上下班时间
-            processed_records = self._process_card_records(all_records, sync_date)
+            # 流式读取刷卡记录，边读边折叠出上下班时间
+            accumulator = PunchAccumulator()
+            self._stream_card_records(day, day + timedelta(days=1), employee_nos, accumulator, fetch_stats, cancel_event)
+            self._metrics.add_rows("punches_fetched", accumulator.punch_count)
+            with self._metrics.time_phase("fold"):
+                processed_records = accumulator.processed_records_by_date().get(sync_date, [])
             
-            logger.info(f"从MSSQL成功获取到 {len(all_records)} 条刷卡记录，处理后得到 {len(processed_records)} 条考勤记录")
+            logger.info(f"从MSSQL成功获取到 {accumulator.punch_count} 条刷卡记录，处理后得到 {len(processed_records)} 条考勤记录")
             return processed_records
             
+        except SyncCancelled:
+            raise
         except Exception as e:
             error_msg = f"从MSSQL获取数据失败 - 同步日期: {sync_date}, 员工数量: {len(employee_nos) if employee_nos else 0}, 错误: {str(e)}"
             logger.error(error_msg)
             # 抛出异常而不是返回空列表，让上层处理
             raise Exception(f"MSSQL数据获取失败: {str(e)}")
     
-    def _process_card_records(self, raw_records: List[Dict], sync_date: str) -> List[Dict]:
+    def _fetch_attendance_range_from_mssql(self, start_date: date, end_date: date, employee_nos: List[str], fetch_stats: FetchStats = None,
+                                           cancel_event: threading.Event = None) -> Dict[str, List[Dict]]:
+        """
+        一次性获取 [start_date, end_date] 整个日期窗口的考勤数据，并在本地按天拆分
+        
+        Returns:
+            日期字符串(YYYY-MM-DD) -> 当天处理后的考勤记录列表
+        """
+        try:
+            logger.info(f"开始从MSSQL按范围获取考勤数据 - 日期范围: {start_date} 至 {end_date}, 员工数量: {len(employee_nos) if employee_nos else 0}")
+            
+            # 流式读取刷卡记录，边读边按刷卡日期折叠
+            accumulator = PunchAccumulator()
+            self._stream_card_records(start_date, end_date + timedelta(days=1), employee_nos, accumulator, fetch_stats, cancel_event)
+            self._metrics.add_rows("punches_fetched", accumulator.punch_count)
+            with self._metrics.time_phase("fold"):
+                result = accumulator.processed_records_by_date()
+            
+            logger.info(f"从MSSQL成功获取到 {accumulator.punch_count} 条刷卡记录，覆盖 {len(result)} 天，处理后得到 {sum(len(r) for r in result.values())} 条考勤记录")
+            return result
+            
+        except SyncCancelled:
+            raise
+        except Exception as e:
+            error_msg = f"从MSSQL按范围获取数据失败 - 日期范围: {start_date} 至 {end_date}, 员工数量: {len(employee_nos) if employee_nos else 0}, 错误: {str(e)}"
+            logger.error(error_msg)
+            raise Exception(f"MSSQL数据获取失败: {str(e)}")
+    
+    def _stream_card_records(self, start_date: date, end_date: date, employee_nos: List[str], accumulator: PunchAccumulator, fetch_stats: FetchStats = None,
+                             cancel_event: threading.Event = None):
         """
-        处理刷卡记录，将每个员工当天的第一次刷卡作为上班时间，最后一次刷卡作为下班时间
+        流式读取 [start_date, end_date) 时间窗口内指定员工的原始刷卡记录，逐块折叠进 accumulator
+        
+        使用 sign_time >= ? AND sign_time < ? 的可走索引条件，而不是 CAST(sign_time AS DATE)。
+        MSSQL_EMPLOYEE_FILTER_MODE 为 temp_table / window 时整个窗口只发送一条查询，见 _fetch_card_window；
+        为 batch 时员工按 MSSQL_FETCH_BATCH_SIZE 分批，最多 MSSQL_FETCH_CONCURRENCY 个批次在线程池上并发查询，
+        任一批次失败立即取消其余批次；各批次结果按批次顺序合并，保证结果确定。
+        cancel_event 在批次之间和每个 fetchmany 块之间检查，被设置时抛出 SyncCancelled。
+        每次查询分别统计游标迭代（mssql_fetch）、折叠（fold）和原始刷卡落地（raw_store）的耗时。
         """
-        from collections import defaultdict
+        # 检查员工工号列表是否为空
+        if not employee_nos:
+            error_msg = "员工工号列表为空，无法查询考勤数据"
+            logger.error(error_msg)
+            raise Exception(error_msg)
         
-        # 按员工分组刷卡记录
-        employee_records = defaultdict(list)
-        for record in raw_records:
-            employee_no = record['employee_no']
-            employee_records[employee_no].append(record)
+        window_start = datetime.combine(start_date, datetime.min.time())
+        window_end = datetime.combine(end_date, datetime.min.time())
         
-        processed_records = []
+        if fetch_stats is None:
+            fetch_stats = FetchStats()
         
-        for employee_no, records in employee_records.items():
-            if not records:
-                continue
+        if settings.MSSQL_EMPLOYEE_FILTER_MODE != "batch":
+            self._fetch_card_window(employee_nos, window_start, window_end, accumulator, fetch_stats, cancel_event)
+            return
+        
+        # 分批处理员工工号，避免IN子句过长导致查询超时
+        batch_size = settings.MSSQL_FETCH_BATCH_SIZE
+        batches = [employee_nos[i:i + batch_size] for i in range(0, len(employee_nos), batch_size)]
+        concurrency = max(1, min(settings.MSSQL_FETCH_CONCURRENCY, len(batches)))
+        
+        fetch_stats.configure(batch_size, concurrency)
+        wall_start = time.perf_counter()
+        
+        if concurrency == 1:
+            for batch_no, batch_employee_nos in enumerate(batches, 1):
+                self._fetch_card_batch(batch_no, batch_employee_nos, window_start, window_end, accumulator, fetch_stats,
+                                       cancel_event=cancel_event)
+        else:
+            abort_event = threading.Event()
+            batch_accumulators = [PunchAccumulator() for _ in batches]
+            
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="MSSQLFetch") as executor:
+                futures = [
+                    executor.submit(
+                        self._fetch_card_batch, batch_no, batch_employee_nos, window_start, window_end,
+                        batch_accumulators[batch_no - 1], fetch_stats, abort_event, cancel_event
+                    )
+                    for batch_no, batch_employee_nos in enumerate(batches, 1)
+                ]
                 
-            # 按时间排序（确保第一条是最早的，最后一条是最晚的）
-            records.sort(key=lambda x: x['card_time'])
+                done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+                failed = [future for future in done if future.exception() is not None]
+                if failed:
+                    # 快速失败：取消未开始的批次，并通知进行中的批次尽快停止
+                    abort_event.set()
+                    for future in not_done:
+                        future.cancel()
+                    raise failed[0].exception()
             
-            # 第一次刷卡作为上班时间
-            clock_in_time = records[0]['card_time']
+            # 按批次顺序合并，保证结果确定
+            for batch_accumulator in batch_accumulators:
+                accumulator.merge(batch_accumulator)
+        
+        fetch_stats.record_wall(time.perf_counter() - wall_start)
+    
+    def _fetch_card_batch(self, batch_no: int, batch_employee_nos: List[str], window_start: datetime, window_end: datetime,
+                          accumulator: PunchAccumulator, fetch_stats: FetchStats, abort_event: threading.Event = None,
+                          cancel_event: threading.Event = None):
+        """
+        查询一个员工批次的刷卡记录并折叠进 accumulator
+        """
+        # 构建参数化查询的占位符
+        placeholders = ','.join(['?' for _ in batch_employee_nos])
+        query = self._build_card_query(employee_filter=f"AND T.emp_id IN ({placeholders})")
+        
+        # 构建查询参数
+        params = [window_start, window_end] + batch_employee_nos
+        
+        timings = dict.fromkeys(("mssql_fetch", "fold", "raw_store"), 0.0)
+        try:
+            # 流式读取当前批次的刷卡记录
+            batch_start = time.perf_counter()
+            punch_count_before = accumulator.punch_count
+            check_cancelled(cancel_event, f"批次 {batch_no} 查询前")
+            for chunk in self._timed_chunks(self.mssql_conn.execute_query_stream(query, params), timings):
+                if abort_event is not None and abort_event.is_set():
+                    logger.info(f"批次 {batch_no}: 其他批次已失败，停止读取")
+                    return
+                check_cancelled(cancel_event, f"批次 {batch_no} 读取中")
+                self._fold_and_store(chunk, accumulator, timings)
             
-            # 最后一次刷卡作为下班时间（如果只有一次刷卡，则下班时间为空）
-            clock_out_time = records[-1]['card_time'] if len(records) > 1 else None
+            punches = accumulator.punch_count - punch_count_before
+            elapsed = time.perf_counter() - batch_start
+            fetch_stats.record_batch(elapsed, punches)
+            logger.info(f"批次 {batch_no}: 查询员工 {len(batch_employee_nos)} 人，获取到 {punches} 条刷卡记录，耗时 {elapsed:.2f} 秒")
+        except SyncCancelled:
+            raise
+        except Exception as batch_error:
+            error_msg = f"批次 {batch_no} 查询失败 - 员工数量: {len(batch_employee_nos)}, 错误: {str(batch_error)}"
+            logger.error(error_msg)
+            raise Exception(f"MSSQL批次查询失败: {str(batch_error)}")
+        finally:
+            self._observe_fetch_timings(timings)
+    
+    def _fetch_card_window(self, employee_nos: List[str], window_start: datetime, window_end: datetime,
+                           accumulator: PunchAccumulator, fetch_stats: FetchStats, cancel_event: threading.Event = None):
+        """
+        整个时间窗口只发送一条查询，员工集合只传一次：
+        - temp_table: 员工工号写入会话临时表 #sync_employees 后与 TimeRecords 关联
+        - window: 拉取窗口内全部刷卡，在本地按员工集合过滤
+        """
+        mode = settings.MSSQL_EMPLOYEE_FILTER_MODE
+        employee_set = set(employee_nos)
+        params = [window_start, window_end]
+        fetch_stats.configure(len(employee_set), 1)
+        timings = dict.fromkeys(("mssql_fetch", "fold", "raw_store"), 0.0)
+        
+        try:
+            batch_start = time.perf_counter()
+            punch_count_before = accumulator.punch_count
+            skipped = 0
             
-            # 生成唯一的外部记录ID
-            external_record_id = f"MSSQL_{employee_no}_{sync_date}_{len(records)}_cards"
+            if mode == "temp_table":
+                query = self._build_card_query(employee_join="INNER JOIN #sync_employees S ON S.emp_id = T.emp_id")
+                stream = self.mssql_conn.execute_query_stream_with_keys("#sync_employees", employee_set, query, params)
+                for chunk in self._timed_chunks(stream, timings):
+                    check_cancelled(cancel_event, "窗口查询读取中")
+                    self._fold_and_store(chunk, accumulator, timings)
+            else:
+                query = self._build_card_query()
+                for chunk in self._timed_chunks(self.mssql_conn.execute_query_stream(query, params), timings):
+                    check_cancelled(cancel_event, "窗口查询读取中")
+                    rows = [row for row in chunk if row['employee_no'] in employee_set]
+                    skipped += len(chunk) - len(rows)
+                    self._fold_and_store(rows, accumulator, timings)
             
-            processed_record = {
-                'employee_no': employee_no,
-                'employee_name': records[0].get('employee_name', ''),
-                'attendance_date': sync_date,
-                'clock_in_time': clock_in_time,
-                'clock_out_time': clock_out_time,
-                'external_record_id': external_record_id,
-                'total_card_count': len(records),
-                'device_info': f"{records[0].get('device_name', '')}等{len(set(r.get('device_name', '') for r in records))}个设备"
+            punches = accumulator.punch_count - punch_count_before
+            elapsed = time.perf_counter() - batch_start
+            fetch_stats.record_batch(elapsed, punches)
+            fetch_stats.record_wall(elapsed)
+            logger.info(f"按时间窗口查询({mode}): 员工 {len(employee_set)} 人，获取到 {punches} 条刷卡记录（本地过滤 {skipped} 条），耗时 {elapsed:.2f} 秒")
+        except SyncCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"按时间窗口查询({mode})失败 - 员工数量: {len(employee_set)}, 错误: {str(e)}")
+            raise Exception(f"MSSQL窗口查询失败: {str(e)}")
+        finally:
+            self._observe_fetch_timings(timings)
+    
+    @staticmethod
+    def _timed_chunks(chunks: Iterable[List[Dict]], timings: Dict[str, float]) -> Iterator[List[Dict]]:
+        """
+        逐块产出查询结果，等待游标返回下一块的时间累计到 timings["mssql_fetch"]
+        """
+        iterator = iter(chunks)
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                timings["mssql_fetch"] += time.perf_counter() - started
+            yield chunk
+    
+    def _fold_and_store(self, rows: List[Dict], accumulator: PunchAccumulator, timings: Dict[str, float]):
+        """
+        将一块刷卡折叠进 accumulator 并落地到 raw_punches，两步耗时分别累计到 fold 和 raw_store
+        """
+        started = time.perf_counter()
+        accumulator.add_rows(rows)
+        folded = time.perf_counter()
+        self._store_raw_punches(rows)
+        timings["fold"] += folded - started
+        timings["raw_store"] += time.perf_counter() - folded
+    
+    def _observe_fetch_timings(self, timings: Dict[str, float]):
+        # 每次查询各阶段只记一次样本，避免按块记录拉低直方图
+        for phase, seconds in timings.items():
+            self._metrics.observe_phase(phase, seconds)
+    
+    def _store_raw_punches(self, rows: List[Dict]):
+        """
+        将一块原始刷卡记录追加到本地 raw_punches 表
+        
+        使用独立连接和事务写入，可在并发批次的工作线程中调用；
+        INSERT IGNORE 依赖 (employee_no, sign_time, device_id) 唯一键，重复同步同一窗口不会产生重复明细
+        """
+        if not settings.RAW_PUNCH_STORE_ENABLED or not rows:
+            return
+        
+        raw_rows = [
+            {
+                "employee_no": row['employee_no'],
+                "employee_name": row.get('employee_name'),
+                "device_id": row['device_id'],
+                "device_name": row.get('device_name'),
+                "sign_time": row['card_time']
             }
+            for row in rows
+        ]
+        with engine.begin() as conn:
+            conn.execute(insert(RawPunch).prefix_with("IGNORE"), raw_rows)
+    
+    def _load_raw_punches(self, start_date: date, end_date: date, employee_nos: List[str], accumulator: PunchAccumulator):
+        """
+        从本地 raw_punches 表流式读取 [start_date, end_date) 窗口内的刷卡，逐块折叠进 accumulator
+        """
+        window_start = datetime.combine(start_date, datetime.min.time())
+        window_end = datetime.combine(end_date, datetime.min.time())
+        employee_set = set(employee_nos)
+        
+        query = (
+            select(
+                RawPunch.employee_name,
+                RawPunch.device_id,
+                RawPunch.device_name,
+                RawPunch.employee_no,
+                RawPunch.sign_time.label("card_time")
+            )
+            .where(RawPunch.sign_time >= window_start, RawPunch.sign_time < window_end)
+            .order_by(RawPunch.employee_no, RawPunch.sign_time, RawPunch.id)
+        )
+        
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(query)
+            for partition in result.mappings().partitions(settings.MSSQL_FETCH_CHUNK_SIZE):
+                accumulator.add_rows([row for row in partition if row['employee_no'] in employee_set])
+    
+    def replay_from_raw_punches(self, db: Session, start_date: date, end_date: date, employee_nos: List[str] = None,
+                                progress_callback: Callable[[str, bool, int], None] = None,
+                                cancel_event: threading.Event = None) -> Dict:
+        """
+        基于本地 raw_punches 重建日期范围内的考勤记录，不访问MSSQL
+        
+        用于考勤规则调整或修复后的重算：已存在的记录按新规则更新状态，缺失的记录补写。
+        只能覆盖曾经同步（并落地原始刷卡）过的时间窗口。
+        按 SYNC_PIPELINE_WINDOW_DAYS 天分段读取原始刷卡，内存中只保留一个窗口的折叠结果。
+        与其他同步写入同一批数据，调用方需持有 sync_lock（见 SyncJobService）；
+        cancel_event 在提交块之间检查，被设置时回滚当前块并停止，已完成的日期保留。
+        
+        Returns:
+            同步结果字典，结构与 _sync_date_range 一致
+        """
+        total_records = 0
+        total_duplicates = 0
+        failed_dates = []
+        successful_dates = []
+        cancelled = False
+        
+        date_range_str = f"{start_date.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')}"
+        sync_log = self._create_sync_log(db, date_range_str, employee_nos, sync_source=RAW_PUNCH_SYNC_SOURCE)
+        
+        try:
+            employees = self._get_sync_employees(db, employee_nos)
+            employee_nos_to_load = [emp.employee_no for emp in employees]
             
-            processed_records.append(processed_record)
+            window_start = start_date
+            while window_start <= end_date and not cancelled:
+                window_end = min(window_start + timedelta(days=settings.SYNC_PIPELINE_WINDOW_DAYS - 1), end_date)
+                accumulator = PunchAccumulator()
+                if employees:
+                    self._load_raw_punches(window_start, window_end + timedelta(days=1), employee_nos_to_load, accumulator)
+                range_data = accumulator.processed_records_by_date()
+                logger.info(f"从本地原始刷卡读取到 {accumulator.punch_count} 条记录 - {window_start} 至 {window_end}")
+                
+                current_date = window_start
+                while current_date <= window_end:
+                    sync_date_str = current_date.strftime('%Y-%m-%d')
+                    try:
+                        check_cancelled(cancel_event, f"本地重建日期 {sync_date_str} 开始前")
+                        result = self._sync_prefetched_date(db, sync_log.id, sync_date_str, range_data.get(sync_date_str, []), employees,
+                                                            cancel_event=cancel_event)
+                        total_records += result.get('records_count', 0)
+                        total_duplicates += result.get('duplicates_skipped', 0)
+                        successful_dates.append(sync_date_str)
+                        if progress_callback:
+                            progress_callback(sync_date_str, True, result.get('records_count', 0))
+                    except SyncCancelled as e:
+                        db.rollback()
+                        logger.warning(f"本地重建日期 {sync_date_str} 中止: {str(e)}")
+                        cancelled = True
+                        break
+                    except Exception as e:
+                        logger.error(f"本地重建日期 {sync_date_str} 失败: {str(e)}")
+                        failed_dates.append(sync_date_str)
+                        if progress_callback:
+                            progress_callback(sync_date_str, False, 0)
+                    
+                    current_date += timedelta(days=1)
+                window_start = window_end + timedelta(days=1)
             
-        return processed_records
+            handled_dates = set(successful_dates) | set(failed_dates)
+            cancelled_dates = []
+            current_date = start_date
+            while current_date <= end_date:
+                if current_date.strftime('%Y-%m-%d') not in handled_dates:
+                    cancelled_dates.append(current_date.strftime('%Y-%m-%d'))
+                current_date += timedelta(days=1)
+            
+            if cancelled_dates:
+                status = "cancelled"
+            else:
+                status = "success" if not failed_dates else "partial_success" if successful_dates else "failed"
+            message = f"本地重建 {len(successful_dates)} 天，失败 {len(failed_dates)} 天。总计 {total_records} 条记录，跳过重复 {total_duplicates} 条"
+            if cancelled_dates:
+                message += f"；已取消，未完成 {len(cancelled_dates)} 天"
+            
+            error_messages = []
+            if failed_dates:
+                error_messages.append(f"失败日期: {', '.join(failed_dates)}")
+            if cancelled_dates:
+                error_messages.append(f"取消时未完成的日期: {', '.join(cancelled_dates)}")
+            self._update_sync_log(db, sync_log.id, {
+                "sync_status": status,
+                "records_count": total_records,
+                "error_message": "；".join(error_messages) or None,
+                "sync_end_time": datetime.now()
+            })
+            
+            return {
+                "message": message,
+                "sync_log_id": sync_log.id,
+                "records_count": total_records,
+                "duplicates_skipped": total_duplicates,
+                "successful_dates": successful_dates,
+                "failed_dates": failed_dates,
+                "cancelled_dates": cancelled_dates,
+                "status": status
+            }
+            
+        except Exception as e:
+            logger.error(f"本地重建失败: {str(e)}")
+            self._update_sync_log(db, sync_log.id, {
+                "sync_status": "failed",
+                "error_message": str(e),
+                "sync_end_time": datetime.now()
+            })
+            raise
     
-
+    def _build_card_query(self, employee_join: str = "", employee_filter: str = "") -> str:
+        """
+        构建刷卡记录查询语句，时间窗口参数为 (window_start, window_end)
+        """
+        # 排除指定的设备ID
+        excluded_devices_str = ','.join(map(str, EXCLUDED_DEVICE_IDS))
+        
+        # 根据用户提供的SQL语句结构更新查询，使用参数化查询防止SQL注入
+        return f"""
+        SELECT 
+            e.emp_fname as employee_name,
+            T.clock_id as device_id,
+            c.Clock_name as device_name,
+            T.emp_id as employee_no,
+            T.sign_time as card_time
+        FROM TimeRecords T WITH (nolock)
+        INNER JOIN dbo.Clocks C WITH (nolock) ON C.Clock_id = T.clock_id
+        INNER JOIN [dbo].[Employee] e WITH (nolock) ON e.emp_id = t.emp_id
+        {employee_join}
+        WHERE T.sign_time >= ? AND T.sign_time < ?
+        {employee_filter}
+        AND T.clock_id NOT IN ({excluded_devices_str})
+        ORDER BY T.emp_id, T.sign_time
+        """
     
-    def _process_sync_data(self, db: Session, sync_log_id: int, attendance_data: List[Dict], employees: List) -> Dict:
+    def _process_sync_data(self, db: Session, sync_log_id: int, attendance_data: List[Dict], employees: List,
+                           resume_after: str = None, checkpoint_callback: Callable[[Session, str], None] = None,
+                           cancel_event: threading.Event = None) -> Dict:
         """
         处理同步数据，去重并插入数据库
+        
+        采用集合化处理：按工号排序后每 SYNC_COMMIT_CHUNK_SIZE 个员工-日期为一块，
+        每块一次性预取候选哈希及其对应的考勤记录，再以多行INSERT写入新记录、以主键批量UPDATE写入状态变更，
+        并单独提交，避免长事务长时间持有InnoDB锁；某一块失败时之前已提交的块不受影响。
+        
+        Args:
+            resume_after: 断点续传时跳过工号不大于该值的记录（这些记录已在之前的运行中提交）
+            checkpoint_callback: 每块提交前以 (db, 本块最后一个工号) 调用，与本块在同一事务中记录断点
+            cancel_event: 每块写入前检查，被设置时抛出 SyncCancelled，已提交的块及其断点保留
         """
         records_count = 0
         duplicates_skipped = 0
@@ -424,6 +1472,9 @@ class MSSQLSyncService:
         # 创建员工工号到ID的映射
         employee_map = {emp.employee_no: emp.employee_id for emp in employees}
         
+        # 第一遍：校验记录并生成数据哈希，同时剔除本批次内同一员工-日期的重复记录
+        candidates = []
+        batch_keys = set()
         for record in attendance_data:
             try:
                 employee_no = record['employee_no']
@@ -433,90 +1484,249 @@ class MSSQLSyncService:
                     failed_records += 1
                     continue
                 
-                # 生成数据哈希用于去重
+                # 数据哈希用于判断当天的打卡是否有变化
                 sync_hash = self._generate_sync_hash(record)
                 
-                # 检查是否已经同步过
-                existing_sync_record = db.query(SyncRecord).filter(
-                    SyncRecord.sync_hash == sync_hash
-                ).first()
+                day_key = (employee_no, record['attendance_date'])
+                if day_key in batch_keys:
+                    duplicates_skipped += 1
+                    logger.debug(f"批次内重复记录，跳过: {employee_no} - {record['attendance_date']}")
+                    continue
                 
-                if existing_sync_record:
-                    # 找到对应的考勤记录
-                    existing_attendance_record = db.query(attendance_record_model.AttendanceRecord).filter(
-                        attendance_record_model.AttendanceRecord.employee_id == employee_map[employee_no],
-                        attendance_record_model.AttendanceRecord.clock_in_time == record.get('clock_in_time'),
-                        attendance_record_model.AttendanceRecord.clock_out_time == record.get('clock_out_time')
-                    ).first()
-                    
-                    if existing_attendance_record:
-                        # 重新计算状态
-                        new_status = self._determine_status(record)
-                        
-                        # 如果状态不一致，更新记录
-                        if existing_attendance_record.status != new_status:
-                            old_status = existing_attendance_record.status
-                            existing_attendance_record.status = new_status
-                            logger.info(f"更新考勤状态 - 员工: {employee_no}, 日期: {record['attendance_date']}, {old_status} -> {new_status}")
-                            records_count += 1  # 计入处理记录数
-                        else:
-                            duplicates_skipped += 1
-                            logger.debug(f"记录已存在且状态一致，跳过: {employee_no} - {record['attendance_date']}")
-                    else:
-                        duplicates_skipped += 1
-                        logger.debug(f"同步记录存在但考勤记录不存在，跳过: {employee_no} - {record['attendance_date']}")
-                    
+                batch_keys.add(day_key)
+                candidates.append((record, employee_map[employee_no], sync_hash))
+                
+            except Exception as record_error:
+                failed_records += 1
+                logger.error(f"处理单条记录失败 - 员工工号: {record.get('employee_no')}, 考勤日期: {record.get('attendance_date')}, 错误: {str(record_error)}")
+        
+        # 按工号排序，保证分块边界和断点位置稳定
+        candidates.sort(key=lambda candidate: (candidate[0]['employee_no'], candidate[0]['attendance_date']))
+        if resume_after is not None:
+            resumed = [candidate for candidate in candidates if candidate[0]['employee_no'] > resume_after]
+            duplicates_skipped += len(candidates) - len(resumed)
+            logger.info(f"从断点继续: 跳过工号 {resume_after} 及之前已提交的 {len(candidates) - len(resumed)} 条记录")
+            candidates = resumed
+        self._metrics.add_rows("records_skipped", duplicates_skipped)
+        
+        chunk_size = settings.SYNC_COMMIT_CHUNK_SIZE
+        chunk_total = (len(candidates) + chunk_size - 1) // chunk_size
+        for chunk_no, i in enumerate(range(0, len(candidates), chunk_size), 1):
+            chunk = candidates[i:i + chunk_size]
+            check_cancelled(cancel_event, f"第 {chunk_no}/{chunk_total} 块写入前，之前 {chunk_no - 1} 块已提交")
+            try:
+                chunk_result = self._write_sync_chunk(db, sync_log_id, chunk, checkpoint_callback)
+            except Exception as chunk_error:
+                error_msg = f"数据库提交失败（第 {chunk_no}/{chunk_total} 块，之前 {chunk_no - 1} 块已提交）: {str(chunk_error)}"
+                logger.error(error_msg)
+                raise Exception(error_msg)
+            
+            records_count += chunk_result["records_count"]
+            duplicates_skipped += chunk_result["duplicates_skipped"]
+            failed_records += chunk_result["failed_records"]
+        
+        self._metrics.add_rows("records_failed", failed_records)
+        logger.info(f"数据库提交成功 - 成功: {records_count}条, 重复: {duplicates_skipped}条, 失败: {failed_records}条, 提交块数: {chunk_total}")
+        
+        return {
+            "message": f"成功同步 {records_count} 条记录，跳过重复记录 {duplicates_skipped} 条，失败记录 {failed_records} 条",
+            "records_count": records_count,
+            "duplicates_skipped": duplicates_skipped,
+            "failed_records": failed_records,
+            "status": "success" if failed_records == 0 else "partial_success"
+        }
+    
+    def _write_sync_chunk(self, db: Session, sync_log_id: int, chunk: List[tuple],
+                          checkpoint_callback: Callable[[Session, str], None] = None) -> Dict:
+        """
+        按 (员工, 考勤日期) 自然键写入一块候选记录，单独提交；失败时回滚本块
+        
+        同一员工同一天只保留一条考勤记录和一条同步记录：当天打卡有变化（哈希不同）或状态需要更新时原地更新，
+        新的员工-日期插入新行；写入使用 INSERT ... ON DUPLICATE KEY UPDATE，并发写入同一天时也不会产生重复行。
+        
+        Args:
+            chunk: (record, employee_id, sync_hash) 列表
+        """
+        records_count = 0
+        duplicates_skipped = 0
+        failed_records = 0
+        inserted = 0
+        
+        # 一次性预取本块员工-日期已有的同步哈希、考勤状态和刷卡次数
+        with self._metrics.time_phase("dedup_lookup"):
+            existing_sync_hashes = self._fetch_existing_sync_hashes(db, [record for record, employee_id, sync_hash in chunk])
+            existing_states = self._fetch_existing_attendance_states(db, [(record, employee_id) for record, employee_id, sync_hash in chunk])
+        
+        # 在内存中完成变化判断，收集待写入的行
+        attendance_rows = []
+        sync_rows = []
+        # 整批向量化识别班制、判断考勤状态，规则与 _determine_status 一致
+        with self._metrics.time_phase("classify"):
+            new_shift_types, new_statuses = classify_attendance(
+                [record.get('clock_in_time') for record, employee_id, sync_hash in chunk],
+                [record.get('clock_out_time') for record, employee_id, sync_hash in chunk]
+            )
+        for (record, employee_id, sync_hash), new_shift_type, new_status in zip(chunk, new_shift_types, new_statuses):
+            employee_no = record['employee_no']
+            try:
+                attendance_date = datetime.strptime(record['attendance_date'], '%Y-%m-%d').date()
+                punch_count = record.get('total_card_count')
+                old_hash = existing_sync_hashes.get((employee_no, record['attendance_date']))
+                old_status, old_punch_count, old_device_id = existing_states.get((employee_id, attendance_date), (None, None, None))
+                
+                if (employee_id, attendance_date) in existing_states and old_device_id != "MSSQL_SYNC":
+                    # 手动录入/导入的记录优先，同步不覆盖
+                    duplicates_skipped += 1
+                    logger.warning(f"员工 {employee_no} 在 {record['attendance_date']} 已有手动录入的考勤记录（设备: {old_device_id}），跳过同步覆盖")
                     continue
                 
-                # 创建考勤记录
-                attendance_record = attendance_record_model.AttendanceRecord(
-                    employee_id=employee_map[employee_no],
-                    clock_in_time=record.get('clock_in_time'),
-                    clock_out_time=record.get('clock_out_time'),
-                    clock_type="正常",
-                    device_id="MSSQL_SYNC",
-                    location="MSSQL同步",
-                    status=self._determine_status(record)
-                )
+                if old_hash == sync_hash:
+                    if old_status is None:
+                        # 考勤记录已被删除，不重新写入
+                        duplicates_skipped += 1
+                        logger.debug(f"同步记录存在但考勤记录不存在，跳过: {employee_no} - {record['attendance_date']}")
+                        continue
+                    if old_status == new_status and old_punch_count == punch_count:
+                        duplicates_skipped += 1
+                        logger.debug(f"记录已存在且无变化，跳过: {employee_no} - {record['attendance_date']}")
+                        continue
                 
-                db.add(attendance_record)
+                if old_status is None:
+                    inserted += 1
+                elif old_hash != sync_hash:
+                    logger.debug(f"更新当天打卡 - 员工: {employee_no}, 日期: {record['attendance_date']}")
+                else:
+                    logger.info(f"更新考勤状态 - 员工: {employee_no}, 日期: {record['attendance_date']}, {old_status} -> {new_status}")
                 
-                # 创建同步记录
-                sync_record = SyncRecord(
-                    sync_log_id=sync_log_id,
-                    employee_no=employee_no,
-                    attendance_date=record['attendance_date'],
-                    clock_in_time=record.get('clock_in_time'),
-                    clock_out_time=record.get('clock_out_time'),
-                    external_record_id=record.get('external_record_id'),
-                    sync_hash=sync_hash
-                )
+                # 考勤记录
+                work_minutes, overtime_minutes = calculate_work_minutes(record.get('clock_in_time'), record.get('clock_out_time'))
+                attendance_rows.append({
+                    "employee_id": employee_id,
+                    "attendance_date": attendance_date,
+                    "clock_in_time": record.get('clock_in_time'),
+                    "clock_out_time": record.get('clock_out_time'),
+                    "punch_count": punch_count,
+                    "work_minutes": work_minutes,
+                    "overtime_minutes": overtime_minutes,
+                    "shift_type": new_shift_type,
+                    "clock_type": "正常",
+                    "device_id": "MSSQL_SYNC",
+                    "location": "MSSQL同步",
+                    "status": new_status
+                })
                 
-                db.add(sync_record)
+                # 同步记录
+                sync_rows.append({
+                    "sync_log_id": sync_log_id,
+                    "employee_no": employee_no,
+                    "attendance_date": record['attendance_date'],
+                    "clock_in_time": record.get('clock_in_time'),
+                    "clock_out_time": record.get('clock_out_time'),
+                    "external_record_id": record.get('external_record_id'),
+                    "sync_hash": sync_hash
+                })
                 records_count += 1
                 
             except Exception as record_error:
                 failed_records += 1
-                logger.error(f"处理单条记录失败 - 员工工号: {record.get('employee_no')}, 考勤日期: {record.get('attendance_date')}, 错误: {str(record_error)}")
+                logger.error(f"处理单条记录失败 - 员工工号: {employee_no}, 考勤日期: {record.get('attendance_date')}, 错误: {str(record_error)}")
                 continue
         
         try:
-            db.commit()
-            logger.info(f"数据库提交成功 - 成功: {records_count}条, 重复: {duplicates_skipped}条, 失败: {failed_records}条")
-        except Exception as commit_error:
+            # 按自然键多行UPSERT，已有的员工-日期原地更新
+            with self._metrics.time_phase("write"):
+                if attendance_rows:
+                    self._upsert_rows(db, attendance_record_model.AttendanceRecord, attendance_rows,
+                                      ["clock_in_time", "clock_out_time", "punch_count", "work_minutes",
+                                       "overtime_minutes", "shift_type", "status"])
+                if sync_rows:
+                    self._upsert_rows(db, SyncRecord, sync_rows,
+                                      ["sync_log_id", "clock_in_time", "clock_out_time", "external_record_id", "sync_hash"])
+                if checkpoint_callback and chunk:
+                    checkpoint_callback(db, chunk[-1][0]['employee_no'])
+                # 数据版本行锁在提交前最后获取，并发写入之间只在提交时短暂串行
+                if attendance_rows:
+                    bump_data_version(db)
+            with self._metrics.time_phase("commit"):
+                db.commit()
+        except Exception:
             db.rollback()
-            error_msg = f"数据库提交失败: {str(commit_error)}"
-            logger.error(error_msg)
-            raise Exception(error_msg)
+            raise
+        
+        self._metrics.add_rows("records_inserted", inserted)
+        self._metrics.add_rows("records_updated", records_count - inserted)
+        self._metrics.add_rows("records_skipped", duplicates_skipped)
         
         return {
-            "message": f"成功同步 {records_count} 条记录，跳过重复记录 {duplicates_skipped} 条，失败记录 {failed_records} 条",
             "records_count": records_count,
             "duplicates_skipped": duplicates_skipped,
-            "failed_records": failed_records,
-            "status": "success" if failed_records == 0 else "partial_success"
+            "failed_records": failed_records
         }
     
+    def _upsert_rows(self, db: Session, model, rows: List[Dict], update_columns: List[str]):
+        """
+        多行 INSERT ... ON DUPLICATE KEY UPDATE，唯一键冲突时只更新 update_columns
+        """
+        stmt = mysql_insert(model)
+        stmt = stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in update_columns})
+        db.execute(stmt, rows)
+    
+    def _fetch_existing_sync_hashes(self, db: Session, records: List[Dict]) -> Dict:
+        """
+        批量查询员工-日期已有的同步哈希（按块拼接IN列表，每块一次查询）
+        
+        Returns:
+            (employee_no, 考勤日期字符串) -> sync_hash 的映射
+        """
+        result = {}
+        
+        for i in range(0, len(records), DEDUP_LOOKUP_CHUNK_SIZE):
+            chunk = records[i:i + DEDUP_LOOKUP_CHUNK_SIZE]
+            wanted = {(record['employee_no'], record['attendance_date']) for record in chunk}
+            rows = db.query(SyncRecord.employee_no, SyncRecord.attendance_date, SyncRecord.sync_hash).filter(
+                SyncRecord.employee_no.in_({employee_no for employee_no, _ in wanted}),
+                SyncRecord.attendance_date.in_({attendance_date for _, attendance_date in wanted})
+            ).all()
+            for row in rows:
+                key = (row.employee_no, row.attendance_date)
+                if key in wanted:
+                    result[key] = row.sync_hash
+        
+        return result
+    
+    def _fetch_existing_attendance_states(self, db: Session, records: List) -> Dict:
+        """
+        批量查询员工-日期已有考勤记录的状态和刷卡次数
+        
+        Returns:
+            (employee_id, 考勤日期) -> (status, punch_count, device_id) 的映射
+        """
+        result = {}
+        AttendanceRecord = attendance_record_model.AttendanceRecord
+        
+        for i in range(0, len(records), DEDUP_LOOKUP_CHUNK_SIZE):
+            chunk = records[i:i + DEDUP_LOOKUP_CHUNK_SIZE]
+            wanted = {
+                (employee_id, datetime.strptime(record['attendance_date'], '%Y-%m-%d').date())
+                for record, employee_id in chunk
+            }
+            rows = db.query(
+                AttendanceRecord.employee_id,
+                AttendanceRecord.attendance_date,
+                AttendanceRecord.status,
+                AttendanceRecord.punch_count,
+                AttendanceRecord.device_id
+            ).filter(
+                AttendanceRecord.employee_id.in_({employee_id for employee_id, _ in wanted}),
+                AttendanceRecord.attendance_date.in_({attendance_date for _, attendance_date in wanted})
+            ).all()
+            for row in rows:
+                key = (row.employee_id, row.attendance_date)
+                if key in wanted:
+                    result[key] = (row.status, row.punch_count, row.device_id)
+        
+        return result
+    
     def _generate_sync_hash(self, record: Dict) -> str:
         """
         生成同步数据的哈希值用于去重
@@ -733,8 +1943,12 @@ class MSSQLSyncService:
         
         self._is_running = True
         self._stop_event.clear()
+        self._wake_event.clear()
         self._sync_status = "running"
         
+        if self._leader_election:
+            self._leader_election.start_heartbeat()
+        
         # 启动后台线程
         self._background_sync_thread = threading.Thread(
             target=self._background_sync_loop,
@@ -756,11 +1970,23 @@ class MSSQLSyncService:
         
         self._is_running = False
         self._stop_event.set()
+        self._wake_event.set()
         self._sync_status = "stopping"
         
-        # 等待线程结束
+        # 等待线程结束：进行中的同步在下一个检查点（MSSQL批次、日期或提交块之间）回滚未提交部分并退出
+        thread_alive = False
         if self._background_sync_thread and self._background_sync_thread.is_alive():
-            self._background_sync_thread.join(timeout=5)
+            self._background_sync_thread.join(timeout=settings.SYNC_STOP_TIMEOUT_SECONDS)
+            thread_alive = self._background_sync_thread.is_alive()
+            if thread_alive:
+                logger.warning(
+                    f"后台同步线程在 {settings.SYNC_STOP_TIMEOUT_SECONDS} 秒内未结束，仍在写入；"
+                    f"不主动释放租约，其他进程在租约过期后才能接管"
+                )
+        
+        # 线程已结束时释放租约，让其他进程立即接管；线程仍在运行时只停止续约，由租约自然过期
+        if self._leader_election:
+            self._leader_election.stop_heartbeat(release=not thread_alive)
         
         self._sync_status = "stopped"
         logger.info("后台同步服务已停止")
@@ -777,8 +2003,12 @@ class MSSQLSyncService:
             "status": self._sync_status,
             "sync_interval_minutes": self._sync_interval // 60,
             "last_sync_time": self._last_sync_time.isoformat() if self._last_sync_time else None,
+            "next_sync_time": self._next_sync_time.isoformat() if self._next_sync_time and self._is_running else None,
+            "schedule": self._scheduler.get_status() if self._scheduler else {"adaptive": False},
             "thread_alive": self._background_sync_thread.is_alive() if self._background_sync_thread else False,
             "metrics": self._metrics.get_metrics(),
+            "mssql_pool": self.mssql_conn.get_pool_stats(),
+            "leader": self._leader_election.get_leader() if self._leader_election else {"enabled": False},
             "health_status": self._get_health_status()
         }
     
@@ -848,10 +2078,13 @@ class MSSQLSyncService:
             if error_rate > 30:
                 return {"status": "warning", "message": f"错误率较高: {error_rate:.2f}%"}
         
-        # 检查最后同步时间
+        # 检查最后同步时间（自适应调度下以计划间隔为准）
         if self._last_sync_time:
             time_since_last = datetime.now() - self._last_sync_time
-            if time_since_last.total_seconds() > self._sync_interval * 2:
+            expected_interval = self._sync_interval
+            if self._next_sync_time and self._next_sync_time > self._last_sync_time:
+                expected_interval = max(expected_interval, (self._next_sync_time - self._last_sync_time).total_seconds())
+            if time_since_last.total_seconds() > expected_interval * 2:
                 return {"status": "warning", "message": "同步延迟过长"}
         
         return {"status": "healthy", "message": "服务运行正常"}
@@ -862,6 +2095,12 @@ class MSSQLSyncService:
         """
         return self._metrics.get_metrics()
     
+    def get_prometheus_metrics(self) -> str:
+        """
+        获取Prometheus文本格式的同步监控指标
+        """
+        return self._metrics.to_prometheus()
+    
     def _get_environment_name(self) -> str:
         """
         获取当前环境名称
@@ -914,13 +2153,16 @@ class MSSQLSyncService:
         old_interval = self._sync_interval // 60
         self._sync_interval = interval_minutes * 60
         
+        # 唤醒后台循环按新间隔重新计算下一次同步时间，无需重启
+        self._wake_event.set()
+        
         logger.info(f"同步间隔已更新: {old_interval}分钟 -> {interval_minutes}分钟")
         
         return {
             "message": f"同步间隔已更新为 {interval_minutes} 分钟",
             "old_interval_minutes": old_interval,
             "new_interval_minutes": interval_minutes,
-            "requires_restart": self._is_running
+            "requires_restart": False
         }
     
     def _background_sync_loop(self):
@@ -931,6 +2173,13 @@ class MSSQLSyncService:
         
         while self._is_running and not self._stop_event.is_set():
             try:
+                # 非领导者不执行同步，按不超过租约时长的间隔检查是否需要接管
+                if self._leader_election and not self._leader_election.try_acquire():
+                    self._sync_status = "standby"
+                    if self._stop_event.wait(timeout=min(self._sync_interval, self._leader_election.lease_seconds)):
+                        break
+                    continue
+                
                 # 执行同步操作
                 self._perform_background_sync()
                 
@@ -938,7 +2187,7 @@ class MSSQLSyncService:
                 self._last_sync_time = datetime.now()
                 
                 # 等待下次同步
-                if self._stop_event.wait(timeout=self._sync_interval):
+                if self._wait_for_next_sync():
                     # 如果收到停止信号，退出循环
                     break
                     
@@ -961,6 +2210,32 @@ class MSSQLSyncService:
         
         logger.info("后台同步循环已结束")
     
+    def _wait_for_next_sync(self) -> bool:
+        """
+        等待到下一次同步时间，期间同步间隔被修改时立即按新间隔重新计算
+        
+        Returns:
+            是否收到停止信号
+        """
+        while not self._stop_event.is_set():
+            if self._scheduler:
+                next_sync_time, reason = self._scheduler.next_sync_time(self._last_sync_time, self._sync_interval)
+            else:
+                next_sync_time, reason = self._last_sync_time + timedelta(seconds=self._sync_interval), "fixed"
+            
+            if next_sync_time != self._next_sync_time:
+                logger.info(f"下次同步时间: {next_sync_time.strftime('%Y-%m-%d %H:%M:%S')} ({reason})")
+            self._next_sync_time = next_sync_time
+            
+            remaining = (next_sync_time - datetime.now()).total_seconds()
+            if remaining <= 0:
+                return False
+            
+            self._wake_event.wait(timeout=remaining)
+            self._wake_event.clear()
+        
+        return True
+    
     def _perform_background_sync(self):
         """
         执行后台同步操作（增量同步）
@@ -975,30 +2250,29 @@ class MSSQLSyncService:
             db = next(get_db())
             
             try:
-                # 获取上次同步时间，如果没有则同步最近3天的数据
-                if self._last_sync_time:
-                    # 增量同步：从上次同步时间开始
-                    sync_days = (datetime.now().date() - self._last_sync_time.date()).days + 1
-                    sync_days = max(1, min(sync_days, 3))  # 限制在1-3天之间
-                    logger.info(f"执行增量同步，同步最近 {sync_days} 天的数据")
-                else:
-                    # 首次同步：同步最近3天的数据
-                    sync_days = 3
-                    logger.info(f"首次同步，同步最近 {sync_days} 天的数据")
+                # 手动同步任务持有同步锁时分段等待，期间收到停止信号即放弃本轮
+                if not self._acquire_sync_lock(self._stop_event):
+                    logger.info("后台同步已取消: 等待同步锁时收到停止信号")
+                    return
+                try:
+                    with self._metrics.time_phase("cycle"):
+                        result = self._run_background_sync(db)
+                finally:
+                    self.sync_lock.release()
                 
-                # 执行同步
-                result = self.sync_attendance_records(
-                    db=db,
-                    sync_date=None,  # 不指定日期，使用默认逻辑
-                    employee_nos=None,  # 同步所有员工
-                    sync_days=sync_days  # 动态确定同步天数
-                )
+                if result.get('status') == "cancelled":
+                    logger.info(f"后台同步已取消: {result.get('message')}")
+                    return
                 
                 # 记录成功指标
                 records_count = result.get('records_count', 0)
                 self._metrics.record_sync_success(records_count)
                 self._sync_status = "success"
                 
+                # 新刷卡数用于自适应调度估计刷卡速率
+                if self._scheduler:
+                    self._scheduler.record_sync(result.get('punches'), datetime.now())
+                
                 logger.info(f"后台增量同步完成: {result.get('message', '未知结果')}，处理记录数: {records_count}")
                 
             finally:
@@ -1008,6 +2282,46 @@ class MSSQLSyncService:
             self._sync_status = "error"
             logger.error(f"后台增量同步执行失败: {str(e)}")
             raise
+    
+    def _acquire_sync_lock(self, cancel_event: threading.Event) -> bool:
+        """
+        获取同步锁，每 SYNC_LOCK_POLL_SECONDS 秒检查一次 cancel_event
+
+        Returns:
+            是否获取到锁；cancel_event 被设置时返回 False
+        """
+        while not cancel_event.is_set():
+            if self.sync_lock.acquire(timeout=SYNC_LOCK_POLL_SECONDS):
+                return True
+        return False
+    
+    def _run_background_sync(self, db: Session) -> Dict:
+        """
+        执行一轮后台同步，返回同步结果
+        """
+        if settings.SYNC_INCREMENTAL:
+            # 基于持久化水位线的增量同步
+            return self.sync_incremental(db, cancel_event=self._stop_event)
+        
+        # 获取上次同步时间，如果没有则同步最近3天的数据
+        if self._last_sync_time:
+            # 增量同步：从上次同步时间开始
+            sync_days = (datetime.now().date() - self._last_sync_time.date()).days + 1
+            sync_days = max(1, min(sync_days, INITIAL_SYNC_DAYS))  # 限制在1-3天之间
+            logger.info(f"执行增量同步，同步最近 {sync_days} 天的数据")
+        else:
+            # 首次同步：同步最近3天的数据
+            sync_days = INITIAL_SYNC_DAYS
+            logger.info(f"首次同步，同步最近 {sync_days} 天的数据")
+        
+        # 执行同步
+        return self.sync_attendance_records(
+            db=db,
+            sync_date=None,  # 不指定日期，使用默认逻辑
+            employee_nos=None,  # 同步所有员工
+            sync_days=sync_days,  # 动态确定同步天数
+            cancel_event=self._stop_event  # 停止后台同步时中止本轮
+        )
 
 # 全局同步服务实例
 mssql_sync_service = MSSQLSyncService()
\ No newline at end of file
@@ -6,36 +6,31 @@ import pandas as pd
 from io import BytesIO
 
 from models import attendance_record as models_ar, employee as models_e
+from services.shift_classifier import SHIFT_NAMES
 
 def _calculate_work_details(record, db):
     """
-    简化的工作时长计算，不依赖排班信息
+    读取写入时计算好的工作/加班分钟数和班制，不依赖排班信息
     """
-    if not record.clock_in_time or not record.clock_out_time:
+    if record.work_minutes is None:
         return None, None, None, None
 
-    # 计算实际工作时长
-    work_duration = record.clock_out_time - record.clock_in_time
-    
-    # 假设标准工作时长为8小时
-    standard_work_duration = timedelta(hours=8)
-    
-    # 计算加班时长（超过8小时的部分）
-    overtime = work_duration - standard_work_duration if work_duration > standard_work_duration else timedelta(0)
+    work_duration = timedelta(minutes=record.work_minutes)
+    overtime = timedelta(minutes=record.overtime_minutes or 0)
     
     # 简单的状态判断（基于记录中的状态字段，如果没有则默认为正常）
     status = record.status if record.status else "正常"
     
-    # 返回工作时长、加班时长、状态和班次名称（固定为"标准班次"）
-    return work_duration, overtime, status, "标准班次"
+    # 返回工作时长、加班时长、状态和班次名称
+    return work_duration, overtime, status, SHIFT_NAMES.get(record.shift_type, "标准班次")
 
 def get_detailed_report_data(db: Session, start_date: datetime.date, end_date: datetime.date):
     """
     获取详细报表数据，简化版本不依赖排班信息
     """
     records = db.query(models_ar.AttendanceRecord).filter(
-        func.date(models_ar.AttendanceRecord.clock_in_time) >= start_date,
-        func.date(models_ar.AttendanceRecord.clock_in_time) <= end_date
+        models_ar.AttendanceRecord.attendance_date >= start_date,
+        models_ar.AttendanceRecord.attendance_date <= end_date
     ).all()
 
     if not records:
@@ -83,16 +78,20 @@ def get_reports(db: Session):
     end_date = datetime.now().date()
     start_date = end_date - timedelta(days=30)
     
-    # 统计总考勤记录数
-    total_records = db.query(models_ar.AttendanceRecord).filter(
-        func.date(models_ar.AttendanceRecord.clock_in_time) >= start_date,
-        func.date(models_ar.AttendanceRecord.clock_in_time) <= end_date
-    ).count()
+    # 统计总考勤记录数和工作/加班总时长
+    total_records, total_work_minutes, total_overtime_minutes = db.query(
+        func.count(models_ar.AttendanceRecord.record_id),
+        func.coalesce(func.sum(models_ar.AttendanceRecord.work_minutes), 0),
+        func.coalesce(func.sum(models_ar.AttendanceRecord.overtime_minutes), 0)
+    ).filter(
+        models_ar.AttendanceRecord.attendance_date >= start_date,
+        models_ar.AttendanceRecord.attendance_date <= end_date
+    ).one()
     
     # 统计异常考勤记录数（迟到、早退等）
     abnormal_records = db.query(models_ar.AttendanceRecord).filter(
-        func.date(models_ar.AttendanceRecord.clock_in_time) >= start_date,
-        func.date(models_ar.AttendanceRecord.clock_in_time) <= end_date,
+        models_ar.AttendanceRecord.attendance_date >= start_date,
+        models_ar.AttendanceRecord.attendance_date <= end_date,
         models_ar.AttendanceRecord.status.in_(['迟到', '早退', '缺勤'])
     ).count()
     
@@ -115,7 +114,9 @@ def get_reports(db: Session):
                 "created_at": latest_time,
                 "status": "completed",
                 "total_records": total_records,
-                "total_employees": total_employees
+                "total_employees": total_employees,
+                "total_work_hours": round(total_work_minutes / 60, 1),
+                "total_overtime_hours": round(total_overtime_minutes / 60, 1)
             },
             {
                 "id": 2,
@@ -155,8 +156,8 @@ def generate_report(db: Session, report_type: str, start_date: str = None, end_d
     if report_type == "monthly":
         # 获取月度考勤数据
         records = db.query(models_ar.AttendanceRecord).filter(
-            func.date(models_ar.AttendanceRecord.clock_in_time) >= start_dt,
-            func.date(models_ar.AttendanceRecord.clock_in_time) <= end_dt
+            models_ar.AttendanceRecord.attendance_date >= start_dt,
+            models_ar.AttendanceRecord.attendance_date <= end_dt
         ).count()
         
         report_data = get_detailed_report_data(db, start_dt, end_dt)
@@ -164,8 +165,8 @@ def generate_report(db: Session, report_type: str, start_date: str = None, end_d
     elif report_type == "exception":
         # 获取异常考勤数据
         records = db.query(models_ar.AttendanceRecord).filter(
-            func.date(models_ar.AttendanceRecord.clock_in_time) >= start_dt,
-            func.date(models_ar.AttendanceRecord.clock_in_time) <= end_dt,
+            models_ar.AttendanceRecord.attendance_date >= start_dt,
+            models_ar.AttendanceRecord.attendance_date <= end_dt,
             models_ar.AttendanceRecord.status.in_(['迟到', '早退', '缺勤'])
         ).count()
         
@@ -0,0 +1,148 @@
+"""
+批量班制识别与考勤状态判断
+
+与 MSSQLSyncService._determine_status / _identify_shift_type / _check_*_shift 的逐条规则完全一致，
+区别在于一次接收整批上下班时间，用 NumPy 向量化计算，供同步写入和批量重算使用。
+逐条规则仍是参照实现，可通过 /api/attendance/test-attendance-status 对照。
+
+班制规则：
+1. 12H白班：7:00-19:00，迟到线7:30，早退线19:00
+2. 8H班：8:45-17:15，迟到线9:00，早退线17:15
+3. 12H夜班：19:00-7:00，迟到线19:30，早退线7:00
+弹性工作规则：工作时长满足班制最低要求（12H班12小时、8H班8小时）即为正常
+工时规则：工作时长为上下班打卡间隔的整分钟数，超过8小时标准工时的部分为加班时长
+"""
+
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+
+SHIFT_12H_DAY = "12H_DAY"
+SHIFT_8H = "8H"
+SHIFT_12H_NIGHT = "12H_NIGHT"
+
+SHIFT_NAMES = {
+    SHIFT_12H_DAY: "12小时白班",
+    SHIFT_8H: "8小时班",
+    SHIFT_12H_NIGHT: "12小时夜班",
+}
+
+# 加班时长按超过8小时标准工时的部分计算
+STANDARD_WORK_MINUTES = 8 * 60
+
+_HOUR = np.timedelta64(1, 'h')
+_MINUTE = np.timedelta64(1, 'm')
+_DAY = np.timedelta64(1, 'D')
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def classify_attendance(clock_in_times: Sequence[Optional[datetime]],
+                        clock_out_times: Sequence[Optional[datetime]]) -> Tuple[List[Optional[str]], List[str]]:
+    """
+    批量识别班制并判断考勤状态
+
+    Args:
+        clock_in_times: 上班打卡时间序列
+        clock_out_times: 下班打卡时间序列，与 clock_in_times 等长
+
+    Returns:
+        (班制类型列表, 考勤状态列表)，缺卡/缺勤/数据异常的记录班制类型为 None
+    """
+    if len(clock_in_times) != len(clock_out_times):
+        raise ValueError("上班时间与下班时间数量不一致")
+
+    shift_types: List[Optional[str]] = [None] * len(clock_in_times)
+    statuses: List[Optional[str]] = [None] * len(clock_in_times)
+
+    # 缺卡、缺勤、数据异常的记录无需进入向量计算
+    valid_indexes = []
+    for i, (clock_in_time, clock_out_time) in enumerate(zip(clock_in_times, clock_out_times)):
+        if not clock_in_time and not clock_out_time:
+            statuses[i] = "缺勤"
+        elif not clock_in_time or not clock_out_time:
+            statuses[i] = "缺卡"
+        elif not isinstance(clock_in_time, datetime) or not isinstance(clock_out_time, datetime):
+            statuses[i] = "数据异常"
+        else:
+            valid_indexes.append(i)
+
+    if not valid_indexes:
+        return shift_types, statuses
+
+    # 按打卡时的本地时间计算（与逐条规则读取 hour/minute 一致）
+    ins = _to_datetime64([clock_in_times[i] for i in valid_indexes])
+    outs = _to_datetime64([clock_out_times[i] for i in valid_indexes])
+
+    in_minutes = (ins - ins.astype('datetime64[D]')) // _MINUTE
+    out_minutes = (outs - outs.astype('datetime64[D]')) // _MINUTE
+    in_hour, in_minute = in_minutes // 60, in_minutes % 60
+    out_hour, out_minute = out_minutes // 60, out_minutes % 60
+
+    duration = outs - ins
+    # 夜班需要考虑跨日期
+    night_duration = np.where(outs < ins, duration + _DAY, duration)
+
+    # 班制识别：18:00之后上班为夜班；6:00-7:59上班且时长>=10小时为12H白班；其余为8H班
+    is_night = in_hour >= 18
+    is_day = ~is_night & (in_hour >= 6) & (in_hour <= 7) & (duration >= 10 * _HOUR)
+    is_8h = ~is_night & ~is_day
+
+    meets_hours = np.select(
+        [is_night, is_day],
+        [night_duration >= 12 * _HOUR, duration >= 12 * _HOUR],
+        duration >= 8 * _HOUR
+    )
+    is_late = np.select(
+        [is_night, is_day],
+        [(in_hour > 19) | ((in_hour == 19) & (in_minute > 30)),
+         (in_hour > 7) | ((in_hour == 7) & (in_minute > 30))],
+        (in_hour > 9) | ((in_hour == 9) & (in_minute > 0))
+    )
+    is_early = np.select(
+        [is_night, is_day],
+        [out_hour < 7, out_hour < 19],
+        (out_hour < 17) | ((out_hour == 17) & (out_minute < 15))
+    )
+
+    valid_statuses = np.select(
+        [meets_hours, is_late & is_early, is_late, is_early],
+        ["正常", "迟到早退", "迟到", "早退"],
+        "正常"
+    )
+    valid_shift_types = np.select([is_night, is_day, is_8h], [SHIFT_12H_NIGHT, SHIFT_12H_DAY, SHIFT_8H], SHIFT_8H)
+
+    for i, shift_type, status in zip(valid_indexes, valid_shift_types.tolist(), valid_statuses.tolist()):
+        shift_types[i] = shift_type
+        statuses[i] = status
+
+    return shift_types, statuses
+
+
+def calculate_work_minutes(clock_in_time: Optional[datetime],
+                           clock_out_time: Optional[datetime]) -> Tuple[Optional[int], Optional[int]]:
+    """
+    计算工作时长和加班时长(分钟)
+
+    Returns:
+        (工作分钟数, 加班分钟数)，缺卡或下班时间不晚于上班时间时均为 None
+    """
+    if not clock_in_time or not clock_out_time:
+        return None, None
+    total_seconds = (clock_out_time - clock_in_time).total_seconds()
+    if total_seconds <= 0:
+        return None, None
+    work_minutes = int(total_seconds // 60)
+    return work_minutes, max(0, work_minutes - STANDARD_WORK_MINUTES)
+
+
+def _to_datetime64(values: List[datetime]) -> np.ndarray:
+    # 先换算为整数微秒再整体转型，比 np.array(datetime列表) 逐个解析对象快数倍
+    micros = np.fromiter(((_wall_clock(value) - _EPOCH) // _MICROSECOND for value in values),
+                         dtype=np.int64, count=len(values))
+    return micros.astype('datetime64[us]')
+
+
+def _wall_clock(value: datetime) -> datetime:
+    # NumPy datetime64 不支持时区，带时区的时间按其本地时刻参与计算
+    return value.replace(tzinfo=None) if value.tzinfo is not None else value
@@ -0,0 +1,377 @@
+from datetime import datetime, date, timedelta
+from typing import Callable, Dict, List, Optional
+from collections import OrderedDict
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from config.config import settings
+from database.database import SessionLocal
+from services.mssql_sync_service import mssql_sync_service, SyncCancelled
+
+logger = logging.getLogger(__name__)
+
+class SyncJobQueueFull(Exception):
+    """手动同步任务队列已满"""
+
+class SyncJob:
+    """
+    手动同步任务
+    记录任务的日期范围、员工范围和执行进度；kind 为 replay 时基于本地原始刷卡重建，
+    为 reconcile 时是对账任务，结果保存在 result 中
+    """
+    def __init__(self, start_date: date, end_date: date, employee_nos: Optional[List[str]] = None,
+                 kind: str = "sync", resync: bool = False):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind  # sync, replay, reconcile
+        self.resync = resync
+        self.start_date = start_date
+        self.end_date = end_date
+        self.employee_nos = sorted(set(employee_nos)) if employee_nos else None
+        self.status = "queued"  # queued, running, success, partial_success, failed, cancelled
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.completed_dates = []
+        self.failed_dates = []
+        self.records_count = 0
+        self.sync_log_id = None
+        self.result = None
+        self.message = None
+        self.error = None
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    @property
+    def dates_total(self) -> int:
+        return (self.end_date - self.start_date).days + 1
+
+    def covers(self, start_date: date, end_date: date, employee_nos: Optional[List[str]],
+               kind: str = "sync", resync: bool = False) -> bool:
+        """
+        判断本任务是否已完整覆盖给定的日期范围和员工范围
+        """
+        if self.kind != kind or (resync and not self.resync):
+            return False
+        if self.start_date > start_date or self.end_date < end_date:
+            return False
+        if self.employee_nos is None:
+            return True
+        return employee_nos is not None and set(employee_nos) <= set(self.employee_nos)
+
+    def can_merge(self, start_date: date, end_date: date, employee_nos: Optional[List[str]]) -> bool:
+        """
+        判断排队中的任务能否扩展日期范围以吸收给定请求（员工范围相同，日期相交或相邻）
+        """
+        if self.status != "queued" or self.kind != "sync":
+            return False
+        if self.employee_nos != (sorted(set(employee_nos)) if employee_nos else None):
+            return False
+        if start_date > self.end_date + timedelta(days=1) or end_date < self.start_date - timedelta(days=1):
+            return False
+        merged_days = (max(self.end_date, end_date) - min(self.start_date, start_date)).days + 1
+        return merged_days <= settings.SYNC_JOB_MAX_DAYS
+
+    def record_progress(self, sync_date: str, success: bool, records_count: int):
+        # 调用方需持有 SyncJobService._lock，与 to_dict 的读取互斥
+        if success:
+            self.completed_dates.append(sync_date)
+            self.records_count += records_count
+        else:
+            self.failed_dates.append(sync_date)
+
+    def to_dict(self) -> Dict:
+        dates_done = len(self.completed_dates) + len(self.failed_dates)
+        elapsed = None
+        if self.started_at:
+            elapsed = ((self.finished_at or datetime.now()) - self.started_at).total_seconds()
+
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "start_date": self.start_date.isoformat(),
+            "end_date": self.end_date.isoformat(),
+            "employee_nos": self.employee_nos,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "progress": {
+                "dates_total": self.dates_total,
+                "dates_done": dates_done,
+                "completed_dates": list(self.completed_dates),
+                "failed_dates": list(self.failed_dates),
+                "records_count": self.records_count,
+                "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+                "records_per_second": round(self.records_count / elapsed, 2) if elapsed else None
+            },
+            "sync_log_id": self.sync_log_id,
+            "result": self.result,
+            "message": self.message,
+            "error": self.error
+        }
+
+class SyncJobService:
+    """
+    手动同步任务队列
+
+    请求线程只负责入队并立即返回任务ID，同步在后台工作线程中执行，不阻塞API请求。
+    与排队中或执行中的任务范围重叠的请求会被合并或直接复用已有任务。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=settings.SYNC_JOB_QUEUE_SIZE)
+        self._jobs = OrderedDict()
+        self._workers = []
+        # 停止时通知执行中的任务在下一个提交块之间退出
+        self._cancel_event = threading.Event()
+
+    def submit(self, start_date: date, end_date: date, employee_nos: Optional[List[str]] = None) -> Dict:
+        """
+        提交手动同步任务
+
+        Returns:
+            {"job": 任务信息, "deduplicated": 是否复用了已有任务}
+        """
+        self._validate_range(start_date, end_date)
+
+        with self._lock:
+            for job in self._jobs.values():
+                if job.is_active and job.covers(start_date, end_date, employee_nos):
+                    logger.info(f"手动同步请求 {start_date} 至 {end_date} 已被任务 {job.job_id} 覆盖")
+                    return {"job": job.to_dict(), "deduplicated": True}
+
+            for job in self._jobs.values():
+                if job.can_merge(start_date, end_date, employee_nos):
+                    job.start_date = min(job.start_date, start_date)
+                    job.end_date = max(job.end_date, end_date)
+                    logger.info(f"手动同步请求 {start_date} 至 {end_date} 已合并到排队任务 {job.job_id}，新范围: {job.start_date} 至 {job.end_date}")
+                    return {"job": job.to_dict(), "deduplicated": True}
+
+            job = self._enqueue(SyncJob(start_date, end_date, employee_nos))
+            logger.info(f"手动同步任务已入队: {job.job_id}, {start_date} 至 {end_date}, 员工: {job.employee_nos or 'all'}")
+            return {"job": job.to_dict(), "deduplicated": False}
+
+    def submit_replay(self, start_date: date, end_date: date, employee_nos: Optional[List[str]] = None) -> Dict:
+        """
+        提交基于本地原始刷卡的重建任务，与手动同步共用队列、同步锁和日期跨度上限
+
+        Returns:
+            {"job": 任务信息, "deduplicated": 是否复用了已有任务}
+        """
+        self._validate_range(start_date, end_date)
+
+        with self._lock:
+            for job in self._jobs.values():
+                if job.is_active and job.covers(start_date, end_date, employee_nos, kind="replay"):
+                    logger.info(f"本地重建请求 {start_date} 至 {end_date} 已被任务 {job.job_id} 覆盖")
+                    return {"job": job.to_dict(), "deduplicated": True}
+
+            job = self._enqueue(SyncJob(start_date, end_date, employee_nos, kind="replay"))
+            logger.info(f"本地重建任务已入队: {job.job_id}, {start_date} 至 {end_date}, 员工: {job.employee_nos or 'all'}")
+            return {"job": job.to_dict(), "deduplicated": False}
+
+    def submit_reconcile(self, start_date: date, end_date: date, resync: bool = True) -> Dict:
+        """
+        提交对账任务，对账在后台工作线程中执行，结果通过任务查询接口获取
+
+        Returns:
+            {"job": 任务信息, "deduplicated": 是否复用了已有任务}
+        """
+        if start_date > end_date:
+            raise ValueError("开始日期不能晚于结束日期")
+
+        with self._lock:
+            for job in self._jobs.values():
+                if job.is_active and job.covers(start_date, end_date, None, kind="reconcile", resync=resync):
+                    logger.info(f"对账请求 {start_date} 至 {end_date} 已被任务 {job.job_id} 覆盖")
+                    return {"job": job.to_dict(), "deduplicated": True}
+
+            job = self._enqueue(SyncJob(start_date, end_date, kind="reconcile", resync=resync))
+            logger.info(f"对账任务已入队: {job.job_id}, {start_date} 至 {end_date}, 重新同步: {resync}")
+            return {"job": job.to_dict(), "deduplicated": False}
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list_jobs(self, limit: int = 20) -> List[Dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+            return [job.to_dict() for job in reversed(jobs)]
+
+    def get_queue_status(self) -> Dict:
+        with self._lock:
+            return {
+                "queued": sum(1 for job in self._jobs.values() if job.status == "queued"),
+                "running": sum(1 for job in self._jobs.values() if job.status == "running"),
+                "queue_size": settings.SYNC_JOB_QUEUE_SIZE,
+                "workers": sum(1 for worker in self._workers if worker.is_alive())
+            }
+
+    def shutdown(self, timeout: float = 5):
+        """
+        停止工作线程：未开始的任务标记为已取消，执行中的任务回滚未提交的块后停止，
+        已提交的块保留在检查点中，重新提交同一范围时继续
+        """
+        self._cancel_event.set()
+        with self._lock:
+            workers = [worker for worker in self._workers if worker.is_alive()]
+            self._workers = []
+            for job in self._jobs.values():
+                if job.status == "queued":
+                    job.status = "cancelled"
+                    job.finished_at = datetime.now()
+        for _ in workers:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+        for worker in workers:
+            worker.join(timeout=timeout)
+
+    @staticmethod
+    def _validate_range(start_date: date, end_date: date):
+        if start_date > end_date:
+            raise ValueError("开始日期不能晚于结束日期")
+        if (end_date - start_date).days + 1 > settings.SYNC_JOB_MAX_DAYS:
+            raise ValueError(f"同步日期跨度不能超过 {settings.SYNC_JOB_MAX_DAYS} 天")
+
+    def _enqueue(self, job: SyncJob) -> SyncJob:
+        # 调用方需持有 self._lock
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise SyncJobQueueFull(f"同步任务队列已满（{settings.SYNC_JOB_QUEUE_SIZE}），请稍后再试")
+
+        self._jobs[job.job_id] = job
+        self._trim_history()
+        self._ensure_workers()
+        return job
+
+    def _ensure_workers(self):
+        # 首次提交时才启动工作线程
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        if not self._workers:
+            self._cancel_event.clear()
+        while len(self._workers) < settings.SYNC_JOB_WORKERS:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"SyncJobWorker-{len(self._workers) + 1}",
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def _trim_history(self):
+        # 只淘汰已结束的任务
+        finished = [job_id for job_id, job in self._jobs.items() if not job.is_active]
+        for job_id in finished[:max(0, len(finished) - settings.SYNC_JOB_HISTORY_SIZE)]:
+            del self._jobs[job_id]
+
+    def _worker_loop(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                if job.status == "cancelled":
+                    continue
+                if job.kind == "reconcile":
+                    self._run_reconcile_job(job)
+                else:
+                    self._run_job(job)
+            finally:
+                self._queue.task_done()
+
+    def _progress_callback(self, job: SyncJob) -> Callable[[str, bool, int], None]:
+        # 工作线程在服务锁下更新进度，查询接口读取时不会看到更新到一半的状态
+        def record_progress(sync_date: str, success: bool, records_count: int):
+            with self._lock:
+                job.record_progress(sync_date, success, records_count)
+        return record_progress
+
+    def _run_job(self, job: SyncJob):
+        with self._lock:
+            job.status = "running"
+            job.started_at = datetime.now()
+            start_date, end_date, employee_nos = job.start_date, job.end_date, job.employee_nos
+
+        logger.info(f"开始执行手动同步任务 {job.job_id}（{job.kind}）: {start_date} 至 {end_date}")
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            # 与后台定时同步互斥
+            with mssql_sync_service.sync_lock:
+                if job.kind == "replay":
+                    result = mssql_sync_service.replay_from_raw_punches(
+                        db, start_date, end_date, employee_nos, progress_callback=self._progress_callback(job),
+                        cancel_event=self._cancel_event
+                    )
+                else:
+                    # 可断点续传：同一范围重新提交时从上次最后提交的块继续
+                    result = mssql_sync_service._sync_date_range(
+                        db, start_date, end_date, employee_nos, progress_callback=self._progress_callback(job), resumable=True,
+                        cancel_event=self._cancel_event
+                    )
+            with self._lock:
+                job.status = result["status"]
+                job.sync_log_id = result.get("sync_log_id")
+                job.message = result.get("message")
+        except Exception as e:
+            logger.error(f"手动同步任务 {job.job_id} 失败: {str(e)}")
+            with self._lock:
+                job.status = "failed"
+                job.error = str(e)
+        finally:
+            db.close()
+            with self._lock:
+                job.finished_at = datetime.now()
+                self._trim_history()
+            logger.info(f"手动同步任务 {job.job_id} 结束: {job.status}，耗时 {time.perf_counter() - started:.2f} 秒")
+
+    def _run_reconcile_job(self, job: SyncJob):
+        # 对账服务通过本服务提交重新同步任务，在此处导入避免循环导入
+        from services.sync_reconcile_service import sync_reconcile_service
+
+        with self._lock:
+            job.status = "running"
+            job.started_at = datetime.now()
+            start_date, end_date = job.start_date, job.end_date
+
+        logger.info(f"开始执行对账任务 {job.job_id}: {start_date} 至 {end_date}")
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            # 对账只读取两侧数据，不与同步互斥
+            result = sync_reconcile_service.reconcile(
+                db, start_date, end_date, job.resync, progress_callback=self._progress_callback(job),
+                cancel_event=self._cancel_event
+            )
+            with self._lock:
+                job.status = "success"
+                job.result = result
+                job.message = f"共 {result['days_checked']} 天，不一致 {len(result['drifted_dates'])} 天"
+        except SyncCancelled as e:
+            with self._lock:
+                job.status = "cancelled"
+                job.message = str(e)
+        except Exception as e:
+            logger.error(f"对账任务 {job.job_id} 失败: {str(e)}")
+            with self._lock:
+                job.status = "failed"
+                job.error = str(e)
+        finally:
+            db.close()
+            with self._lock:
+                job.finished_at = datetime.now()
+                self._trim_history()
+            logger.info(f"对账任务 {job.job_id} 结束: {job.status}，耗时 {time.perf_counter() - started:.2f} 秒")
+
+# 全局手动同步任务服务实例
+sync_job_service = SyncJobService()
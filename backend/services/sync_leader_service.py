@@ -0,0 +1,179 @@
+from datetime import datetime, timedelta
+from typing import Dict
+from sqlalchemy import select, insert, update, or_, func
+import logging
+import os
+import socket
+import threading
+
+from database.database import engine
+from models.sync_log import SyncLease
+
+logger = logging.getLogger(__name__)
+
+# 后台同步使用的租约名称
+BACKGROUND_SYNC_LEASE = "mssql_background_sync"
+
+class SyncLeaderElection:
+    """
+    基于MySQL租约行的领导者选举
+
+    每个进程以"主机名:进程号"作为标识竞争同一行租约：租约未过期时只有持有者能续约，
+    过期后任一进程都可以通过条件UPDATE原子地接管。持有者由心跳线程定期续约，
+    进程退出或失联超过租约时长后，其他进程在下一次检查时接管。
+    所有时间都取数据库的 NOW()，避免各主机时钟不一致。
+    """
+    def __init__(self, lease_name: str, lease_seconds: int):
+        self.lease_name = lease_name
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._is_leader = False
+        self._lock = threading.Lock()
+        self._heartbeat_thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._is_leader
+
+    def try_acquire(self) -> bool:
+        """
+        尝试获取或续约租约
+
+        Returns:
+            当前进程是否为领导者
+        """
+        with self._lock:
+            try:
+                with engine.begin() as conn:
+                    now = self._db_now(conn)
+                    expires_at = now + timedelta(seconds=self.lease_seconds)
+
+                    # 自己持有则续约，租约已过期则接管
+                    result = conn.execute(
+                        update(SyncLease)
+                        .where(
+                            SyncLease.lease_name == self.lease_name,
+                            or_(
+                                SyncLease.holder == self.worker_id,
+                                SyncLease.holder.is_(None),
+                                SyncLease.expires_at.is_(None),
+                                SyncLease.expires_at < now
+                            )
+                        )
+                        .values(
+                            holder=self.worker_id,
+                            acquired_at=now if not self._is_leader else SyncLease.acquired_at,
+                            heartbeat_at=now,
+                            expires_at=expires_at
+                        )
+                    )
+                    acquired = result.rowcount > 0
+
+                    if not acquired:
+                        # 租约行不存在时创建；并发创建时只有一个进程成功
+                        result = conn.execute(
+                            insert(SyncLease).prefix_with("IGNORE").values(
+                                lease_name=self.lease_name,
+                                holder=self.worker_id,
+                                acquired_at=now,
+                                heartbeat_at=now,
+                                expires_at=expires_at
+                            )
+                        )
+                        acquired = result.rowcount > 0
+            except Exception as e:
+                # 无法确认租约时按失去领导权处理，避免多个进程同时同步
+                logger.error(f"同步租约获取失败: {str(e)}")
+                acquired = False
+
+            if acquired != self._is_leader:
+                if acquired:
+                    logger.info(f"进程 {self.worker_id} 成为后台同步领导者")
+                else:
+                    logger.warning(f"进程 {self.worker_id} 失去后台同步领导权")
+            self._is_leader = acquired
+            return acquired
+
+    def release(self):
+        """
+        主动释放租约，使其他进程可以立即接管
+        """
+        with self._lock:
+            if not self._is_leader:
+                return
+            try:
+                with engine.begin() as conn:
+                    conn.execute(
+                        update(SyncLease)
+                        .where(SyncLease.lease_name == self.lease_name, SyncLease.holder == self.worker_id)
+                        .values(expires_at=self._db_now(conn))
+                    )
+                logger.info(f"进程 {self.worker_id} 已释放后台同步租约")
+            except Exception as e:
+                logger.error(f"同步租约释放失败: {str(e)}")
+            finally:
+                self._is_leader = False
+
+    def start_heartbeat(self):
+        """
+        启动心跳线程，持有租约期间每隔租约时长的三分之一续约一次
+        """
+        if self._heartbeat_thread and self._heartbeat_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat_loop,
+            daemon=True,
+            name="SyncLeaderHeartbeat"
+        )
+        self._heartbeat_thread.start()
+
+    def stop_heartbeat(self, release: bool = True):
+        """
+        停止心跳；release 为 False 时保留租约直到过期，用于本进程仍可能在写入的情况
+        """
+        self._stop_event.set()
+        if self._heartbeat_thread and self._heartbeat_thread.is_alive():
+            self._heartbeat_thread.join(timeout=5)
+        if release:
+            self.release()
+
+    def get_leader(self) -> Dict:
+        """
+        获取当前领导者信息
+        """
+        leader = None
+        expires_at = None
+        heartbeat_at = None
+        try:
+            with engine.connect() as conn:
+                now = self._db_now(conn)
+                lease = conn.execute(
+                    select(SyncLease.holder, SyncLease.heartbeat_at, SyncLease.expires_at)
+                    .where(SyncLease.lease_name == self.lease_name)
+                ).first()
+            if lease and lease.expires_at and lease.expires_at >= now:
+                leader = lease.holder
+                heartbeat_at = lease.heartbeat_at
+                expires_at = lease.expires_at
+        except Exception as e:
+            logger.error(f"获取同步领导者失败: {str(e)}")
+
+        return {
+            "worker_id": self.worker_id,
+            "is_leader": self._is_leader,
+            "leader": leader,
+            "leader_heartbeat_at": heartbeat_at.isoformat() if heartbeat_at else None,
+            "lease_expires_at": expires_at.isoformat() if expires_at else None,
+            "lease_seconds": self.lease_seconds
+        }
+
+    def _heartbeat_loop(self):
+        while not self._stop_event.wait(timeout=self.lease_seconds / 3):
+            if self._is_leader:
+                self.try_acquire()
+
+    @staticmethod
+    def _db_now(conn) -> datetime:
+        return conn.execute(select(func.now())).scalar()
@@ -0,0 +1,78 @@
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 生产者在队列满时检查停止信号的间隔(秒)
+PIPELINE_POLL_SECONDS = 0.5
+
+_DONE = object()
+
+def prefetch_pipeline(tasks: Iterable[Tuple[object, Callable[[], object]]], depth: int,
+                      cancel_event: Optional[threading.Event] = None) -> Iterator[Tuple[object, object, Optional[Exception]]]:
+    """
+    拉取与写入两级流水线
+
+    生产者线程按顺序执行每个任务的拉取函数，结果经容量为 depth 的有界队列交给调用方（写入阶段），
+    调用方写入第 N 个结果时，生产者已在拉取第 N+1 个；队列满时生产者阻塞等待，预取量不超过 depth。
+    cancel_event 被设置后生产者不再开始新的拉取，调用方收完已拉取的结果后迭代结束；
+    调用方提前退出迭代时生产者在当前拉取完成后退出。depth 为 0 时不启动线程，逐个先拉取后交给调用方。
+
+    Args:
+        tasks: (任务标识, 拉取函数) 序列
+        depth: 已拉取、等待写入的结果数上限
+
+    Yields:
+        (任务标识, 拉取结果, 拉取异常)，拉取失败时结果为 None
+    """
+    if depth <= 0:
+        for key, fetch in tasks:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            try:
+                item = (key, fetch(), None)
+            except Exception as e:
+                item = (key, None, e)
+            yield item
+        return
+
+    buffer = queue.Queue(maxsize=depth)
+    stop_event = threading.Event()
+
+    def put(item) -> bool:
+        while not stop_event.is_set():
+            try:
+                buffer.put(item, timeout=PIPELINE_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for key, fetch in tasks:
+                if stop_event.is_set() or (cancel_event is not None and cancel_event.is_set()):
+                    logger.info("同步流水线已停止预取")
+                    break
+                try:
+                    item = (key, fetch(), None)
+                except Exception as e:
+                    item = (key, None, e)
+                if not put(item):
+                    return
+        finally:
+            put(_DONE)
+
+    producer = threading.Thread(target=produce, daemon=True, name="SyncPrefetch")
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        stop_event.set()
+        producer.join()
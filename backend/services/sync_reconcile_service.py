@@ -0,0 +1,267 @@
+from datetime import datetime, date, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+import hashlib
+import logging
+import threading
+
+from sqlalchemy.orm import Session
+
+from config.config import settings
+from models.attendance_record import AttendanceRecord
+from models.employee import Employee
+from services.mssql_sync_service import mssql_sync_service, EXCLUDED_DEVICE_IDS, check_cancelled
+from services.sync_job_service import sync_job_service, SyncJobQueueFull
+
+logger = logging.getLogger(__name__)
+
+# 每次聚合查询覆盖的天数，两侧各一条查询
+RECONCILE_WINDOW_DAYS = 7
+
+# 每天最多返回的差异员工明细数
+RECONCILE_MAX_DRIFT_DETAILS = 20
+
+class SyncReconcileService:
+    """
+    MSSQL与MySQL考勤数据按天对账
+
+    两侧都在数据库端聚合出"员工-日期"的刷卡次数和首末次刷卡时间，
+    在本地按天生成摘要进行比较，只对摘要不一致的日期提交重新同步任务，
+    无需重新拉取刷卡明细即可检查长时间范围内的数据完整性。
+    同步不会删除本地记录，只有本地多出记录（MSSQL中不存在）的日期重新同步也无法消除差异，
+    这些日期只在结果中报告，不提交重新同步。
+    """
+    def reconcile(self, db: Session, start_date: date, end_date: date, resync: bool = True,
+                  progress_callback: Optional[Callable[[str, bool, int], None]] = None,
+                  cancel_event: Optional[threading.Event] = None) -> Dict:
+        """
+        对账日期范围内的考勤数据
+
+        Args:
+            resync: 是否为摘要不一致的日期提交重新同步任务
+            progress_callback: 每对账完一天调用一次 (日期, 是否一致, 0)
+            cancel_event: 被设置后在下一个查询窗口之前停止
+
+        Returns:
+            对账结果：每天的摘要比较结果、不一致的日期、仅本地多出记录的日期和提交的同步任务
+        """
+        if start_date > end_date:
+            raise ValueError("开始日期不能晚于结束日期")
+
+        # 与同步一致，只比较本地存在的员工
+        employee_nos = {row.employee_no for row in db.query(Employee.employee_no).all()}
+
+        days = []
+        window_start = start_date
+        while window_start <= end_date:
+            check_cancelled(cancel_event, f"对账 {window_start}")
+            window_end = min(window_start + timedelta(days=RECONCILE_WINDOW_DAYS - 1), end_date)
+            source = self._fetch_source_digests(window_start, window_end, employee_nos)
+            local, manual = self._fetch_local_digests(db, window_start, window_end)
+
+            current_date = window_start
+            while current_date <= window_end:
+                date_str = current_date.strftime('%Y-%m-%d')
+                manual_employees = manual.get(date_str, set())
+                day_source = {employee_no: digest for employee_no, digest in source.get(date_str, {}).items()
+                              if employee_no not in manual_employees}
+                day = self._compare_day(date_str, day_source, local.get(date_str, {}))
+                days.append(day)
+                if progress_callback:
+                    progress_callback(date_str, day["match"], 0)
+                current_date += timedelta(days=1)
+            window_start = window_end + timedelta(days=1)
+
+        drifted_dates = [day["date"] for day in days if not day["match"]]
+        # 只有MSSQL有而本地缺失或不同的记录可以通过重新同步修复
+        resync_dates = [
+            day["date"] for day in days
+            if not day["match"] and (day["drift"]["missing_in_mysql_count"] or day["drift"]["changed_count"])
+        ]
+        local_only_dates = [
+            day["date"] for day in days
+            if not day["match"] and day["drift"]["missing_in_mssql_count"]
+        ]
+        logger.info(
+            f"对账 {start_date} 至 {end_date}: 共 {len(days)} 天，不一致 {len(drifted_dates)} 天，"
+            f"需重新同步 {len(resync_dates)} 天，本地多出记录 {len(local_only_dates)} 天"
+        )
+
+        jobs = []
+        if resync and resync_dates:
+            jobs = self._submit_resync(resync_dates)
+
+        return {
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "days_checked": len(days),
+            "drifted_dates": drifted_dates,
+            "resync_dates": resync_dates,
+            "local_only_dates": local_only_dates,
+            "days": days,
+            "resync_jobs": jobs
+        }
+
+    def _fetch_source_digests(self, start_date: date, end_date: date, employee_nos: set) -> Dict[str, Dict]:
+        """
+        在MSSQL端按"日期-员工"聚合刷卡次数和首末次刷卡时间，过滤条件与同步查询一致
+
+        Returns:
+            日期字符串 -> {员工工号: (刷卡次数, 上班时间, 下班时间)}
+        """
+        excluded_devices_str = ','.join(map(str, EXCLUDED_DEVICE_IDS))
+        query = f"""
+        SELECT
+            CONVERT(date, T.sign_time) as attendance_date,
+            T.emp_id as employee_no,
+            COUNT(*) as punch_count,
+            MIN(T.sign_time) as first_time,
+            MAX(T.sign_time) as last_time
+        FROM TimeRecords T WITH (nolock)
+        INNER JOIN dbo.Clocks C WITH (nolock) ON C.Clock_id = T.clock_id
+        INNER JOIN [dbo].[Employee] e WITH (nolock) ON e.emp_id = t.emp_id
+        WHERE T.sign_time >= ? AND T.sign_time < ?
+        AND T.clock_id NOT IN ({excluded_devices_str})
+        GROUP BY CONVERT(date, T.sign_time), T.emp_id
+        """
+        window_start = datetime.combine(start_date, datetime.min.time())
+        window_end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+        rows = mssql_sync_service.mssql_conn.execute_query(query, [window_start, window_end])
+
+        result = {}
+        for row in rows:
+            employee_no = str(row['employee_no'])
+            if employee_no not in employee_nos:
+                continue
+            attendance_date = row['attendance_date']
+            date_str = attendance_date if isinstance(attendance_date, str) else attendance_date.strftime('%Y-%m-%d')
+            punch_count = row['punch_count']
+            # 与同步规则一致：只有一次刷卡时下班时间为空
+            result.setdefault(date_str, {})[employee_no] = (
+                punch_count,
+                self._to_seconds(row['first_time']),
+                self._to_seconds(row['last_time']) if punch_count > 1 else None
+            )
+        return result
+
+    def _fetch_local_digests(self, db: Session, start_date: date, end_date: date) -> Tuple[Dict[str, Dict], Dict[str, set]]:
+        """
+        查询MySQL中同步产生的考勤记录（每个员工-日期一行）
+
+        Returns:
+            (日期字符串 -> {员工工号: (刷卡次数, 上班时间, 下班时间)},
+             日期字符串 -> 当天为手动录入/导入记录、同步不覆盖的员工工号集合)
+        """
+        rows = db.query(
+            AttendanceRecord.attendance_date,
+            Employee.employee_no,
+            AttendanceRecord.punch_count,
+            AttendanceRecord.clock_in_time,
+            AttendanceRecord.clock_out_time,
+            AttendanceRecord.device_id
+        ).join(Employee, Employee.employee_id == AttendanceRecord.employee_id).filter(
+            AttendanceRecord.attendance_date >= start_date,
+            AttendanceRecord.attendance_date <= end_date
+        ).all()
+
+        result = {}
+        manual = {}
+        for row in rows:
+            if row.device_id != "MSSQL_SYNC":
+                # 手动录入/导入的记录优先于同步，不参与对账
+                manual.setdefault(row.attendance_date.strftime('%Y-%m-%d'), set()).add(row.employee_no)
+                continue
+            result.setdefault(row.attendance_date.strftime('%Y-%m-%d'), {})[row.employee_no] = (
+                row.punch_count,
+                self._to_seconds(row.clock_in_time),
+                self._to_seconds(row.clock_out_time)
+            )
+        return result, manual
+
+    def _compare_day(self, date_str: str, source: Dict, local: Dict) -> Dict:
+        """
+        比较一天的两侧摘要；本地刷卡次数为空（迁移前的记录）时只比较首末次刷卡时间
+        """
+        normalized_local = {}
+        for employee_no, (punch_count, clock_in, clock_out) in local.items():
+            if punch_count is None and employee_no in source:
+                punch_count = source[employee_no][0]
+            normalized_local[employee_no] = (punch_count, clock_in, clock_out)
+
+        source_digest = self._digest(source)
+        local_digest = self._digest(normalized_local)
+        day = {
+            "date": date_str,
+            "match": source_digest == local_digest,
+            "mssql": {"employees": len(source), "punches": sum(value[0] for value in source.values()), "digest": source_digest},
+            "mysql": {"employees": len(local), "punches": sum(value[0] or 0 for value in local.values()), "digest": local_digest}
+        }
+
+        if not day["match"]:
+            missing = sorted(set(source) - set(normalized_local))
+            extra = sorted(set(normalized_local) - set(source))
+            changed = sorted(
+                employee_no for employee_no in set(source) & set(normalized_local)
+                if source[employee_no] != normalized_local[employee_no]
+            )
+            day["drift"] = {
+                "missing_in_mysql": missing[:RECONCILE_MAX_DRIFT_DETAILS],
+                "missing_in_mssql": extra[:RECONCILE_MAX_DRIFT_DETAILS],
+                "changed": changed[:RECONCILE_MAX_DRIFT_DETAILS],
+                "missing_in_mysql_count": len(missing),
+                "missing_in_mssql_count": len(extra),
+                "changed_count": len(changed)
+            }
+        return day
+
+    def _submit_resync(self, drifted_dates: List[str]) -> List[Dict]:
+        """
+        将不一致的日期合并为连续区间，每个区间提交一个手动同步任务
+        """
+        ranges = []
+        for date_str in drifted_dates:
+            current = datetime.strptime(date_str, '%Y-%m-%d').date()
+            if (ranges and current == ranges[-1][1] + timedelta(days=1)
+                    and (current - ranges[-1][0]).days < settings.SYNC_JOB_MAX_DAYS):
+                ranges[-1][1] = current
+            else:
+                ranges.append([current, current])
+
+        jobs = []
+        for range_start, range_end in ranges:
+            try:
+                submitted = sync_job_service.submit(range_start, range_end)
+                jobs.append({
+                    "start_date": range_start.isoformat(),
+                    "end_date": range_end.isoformat(),
+                    "job_id": submitted["job"]["job_id"],
+                    "deduplicated": submitted["deduplicated"]
+                })
+            except SyncJobQueueFull as e:
+                logger.warning(f"对账重新同步 {range_start} 至 {range_end} 未能入队: {str(e)}")
+                jobs.append({
+                    "start_date": range_start.isoformat(),
+                    "end_date": range_end.isoformat(),
+                    "job_id": None,
+                    "error": str(e)
+                })
+        return jobs
+
+    @staticmethod
+    def _digest(entries: Dict) -> str:
+        digest = hashlib.md5()
+        for employee_no in sorted(entries):
+            punch_count, clock_in, clock_out = entries[employee_no]
+            digest.update(f"{employee_no}|{punch_count}|{clock_in}|{clock_out};".encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _to_seconds(value: Optional[datetime]) -> Optional[str]:
+        # MySQL DATETIME 按秒四舍五入保存
+        if value is None:
+            return None
+        if value.microsecond:
+            value = (value + timedelta(microseconds=500000)).replace(microsecond=0)
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+
+# 全局对账服务实例
+sync_reconcile_service = SyncReconcileService()
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+# 刷卡速率指数平滑系数，越大越偏向最近一次同步
+PUNCH_RATE_SMOOTHING = 0.5
+
+class AdaptiveSyncScheduler:
+    """
+    班次感知的自适应同步调度
+
+    - 班次交接时间点前后窗口内按高频间隔同步
+    - 窗口外按基础间隔同步，新刷卡速率达到阈值时切换为高频间隔
+    - 连续无新刷卡时间隔逐次翻倍，直到上限；即将进入交接窗口时提前唤醒
+    """
+    def __init__(self, shift_boundaries: List[str], window_minutes: int, peak_interval_seconds: int,
+                 idle_max_interval_seconds: int, busy_punches_per_minute: float):
+        self.boundaries = sorted(self._parse_boundary(boundary) for boundary in shift_boundaries)
+        self.window = timedelta(minutes=window_minutes)
+        self.peak_interval_seconds = peak_interval_seconds
+        self.idle_max_interval_seconds = idle_max_interval_seconds
+        self.busy_punches_per_minute = busy_punches_per_minute
+        self._punch_rate = None
+        self._idle_streak = 0
+        self._last_record_time = None
+        self._last_decision = None
+
+    def record_sync(self, punches: Optional[int], at: datetime):
+        """
+        记录一次同步拉取到的新刷卡数，用于估计刷卡速率（条/分钟）
+        """
+        if punches is None:
+            return
+
+        if self._last_record_time is not None:
+            minutes = max((at - self._last_record_time).total_seconds() / 60, 1 / 60)
+            rate = punches / minutes
+            if self._punch_rate is None:
+                self._punch_rate = rate
+            else:
+                self._punch_rate = PUNCH_RATE_SMOOTHING * rate + (1 - PUNCH_RATE_SMOOTHING) * self._punch_rate
+
+        self._idle_streak = self._idle_streak + 1 if punches == 0 else 0
+        self._last_record_time = at
+
+    def next_sync_time(self, last_sync_time: datetime, base_interval_seconds: int, now: datetime = None) -> Tuple[datetime, str]:
+        """
+        计算下一次同步时间
+
+        Returns:
+            (下一次同步时间, 原因)
+        """
+        now = now or datetime.now()
+        peak_interval = min(self.peak_interval_seconds, base_interval_seconds)
+
+        if self.in_shift_window(now):
+            interval, reason = peak_interval, "shift_window"
+        elif self._punch_rate is not None and self._punch_rate >= self.busy_punches_per_minute:
+            interval, reason = peak_interval, "busy"
+        elif self._idle_streak > 0:
+            # 连续空轮询时逐次翻倍
+            idle_max = max(self.idle_max_interval_seconds, base_interval_seconds)
+            interval, reason = min(base_interval_seconds * 2 ** self._idle_streak, idle_max), "idle"
+        else:
+            interval, reason = base_interval_seconds, "normal"
+
+        next_time = last_sync_time + timedelta(seconds=interval)
+
+        # 不错过下一个交接窗口的开始
+        window_start = self.next_window_start(now)
+        if window_start is not None and window_start < next_time:
+            next_time, reason = max(window_start, now), "shift_window_start"
+
+        self._last_decision = {
+            "next_sync_time": next_time.isoformat(),
+            "interval_seconds": int(interval),
+            "reason": reason
+        }
+        return next_time, reason
+
+    def in_shift_window(self, moment: datetime) -> bool:
+        for boundary in self._boundary_datetimes(moment):
+            if boundary - self.window <= moment <= boundary + self.window:
+                return True
+        return False
+
+    def next_window_start(self, moment: datetime) -> Optional[datetime]:
+        starts = [boundary - self.window for boundary in self._boundary_datetimes(moment)]
+        future = [start for start in starts if start > moment]
+        return min(future) if future else None
+
+    def get_status(self) -> Dict:
+        return {
+            "adaptive": True,
+            "shift_boundaries": [f"{minutes // 60:02d}:{minutes % 60:02d}" for minutes in self.boundaries],
+            "window_minutes": int(self.window.total_seconds() // 60),
+            "punch_rate_per_minute": round(self._punch_rate, 2) if self._punch_rate is not None else None,
+            "idle_streak": self._idle_streak,
+            "last_decision": self._last_decision
+        }
+
+    def _boundary_datetimes(self, moment: datetime) -> List[datetime]:
+        # 覆盖前一天和后一天，处理跨零点的窗口
+        day_start = datetime.combine(moment.date(), datetime.min.time())
+        return [
+            day_start + timedelta(days=day_offset, minutes=minutes)
+            for day_offset in (-1, 0, 1)
+            for minutes in self.boundaries
+        ]
+
+    @staticmethod
+    def _parse_boundary(boundary: str) -> int:
+        hour, minute = str(boundary).split(':')
+        return int(hour) * 60 + int(minute)